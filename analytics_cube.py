@@ -0,0 +1,343 @@
+import threading
+from collections import namedtuple
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from dispatcher import slot_label
+from slot_rankings import DAYS
+
+# Attempts without a date (legacy dataset.csv rows) fall into this month bucket
+UNDATED = 'undated'
+
+# Dimensions a query can group by or filter on
+DIMENSIONS = ['customer', 'area', 'day', 'slot', 'size', 'status', 'month']
+STATUSES = ['Success', 'Fail']
+SLOTS = [slot_label(hour) for hour in range(24)]
+
+# Axes of the dense area cube
+AREA_AXES = ['area', 'day', 'slot', 'size', 'status', 'month']
+# Columns of the sparse customer cells, kept per month
+CELL_AXES = ['customer', 'area', 'day', 'slot', 'size', 'status']
+
+# Dimensions whose labels grow as new values are recorded
+GROWING = ['customer', 'area', 'size', 'month']
+
+CubeView = namedtuple('CubeView', ['labels', 'index', 'by_area', 'months'])
+
+
+def month_bucket(value):
+    """'YYYY-MM' bucket of a 'YYYY-MM-DD...' date (or date), UNDATED when missing"""
+    if isinstance(value, date):
+        return value.strftime('%Y-%m')
+    if isinstance(value, str) and len(value) >= 7 and value[4] == '-':
+        return value[:7]
+    return UNDATED
+
+
+def _index(labels):
+    return {dimension: {label: i for i, label in enumerate(values)} for dimension, values in labels.items()}
+
+
+class MonthCells:
+    """
+    Sparse attempt counts of one month: a row per distinct customer, area, day, slot, size and status
+
+    Rows are label codes in a capacity-doubled array. Counting a known
+    combination increments its row; a new combination is appended. Readers
+    take `cells()` and never see a partially written row.
+    """
+
+    def __init__(self, codes=None, counts=None):
+        codes = np.zeros((0, len(CELL_AXES)), dtype=np.int32) if codes is None else np.asarray(codes, dtype=np.int32)
+        self.length = len(codes)
+        capacity = max(16, self.length)
+        self.codes = np.zeros((capacity, len(CELL_AXES)), dtype=np.int32)
+        self.codes[:self.length] = codes
+        self.counts = np.zeros(capacity, dtype=np.int64)
+        if counts is not None:
+            self.counts[:self.length] = counts
+        self.position = {cell: i for i, cell in enumerate(map(tuple, codes.tolist()))}
+
+    def add(self, cell):
+        """Count one attempt (caller holds the cube lock)"""
+        i = self.position.get(cell)
+        if i is None:
+            i = self.length
+            if i == len(self.counts):
+                # Readers keep the arrays they already hold
+                self.codes = np.concatenate([self.codes, np.zeros_like(self.codes)])
+                self.counts = np.concatenate([self.counts, np.zeros_like(self.counts)])
+            self.codes[i] = cell
+            self.position[cell] = i
+            # Publish the row only once it is written
+            self.length = i + 1
+        self.counts[i] += 1
+
+    def cells(self):
+        """(codes, counts) of the filled rows"""
+        length = self.length
+        return self.codes[:length], self.counts[:length]
+
+
+class DeliveryCube:
+    """
+    Pre-aggregated delivery attempt counts for slice, dice and roll-up queries
+
+    Queries that do not mention customers read a dense NumPy cube of
+    area x day x slot x size x status x month counts. Its size depends only
+    on the number of areas, sizes and months, so a query is a few takes and
+    sums. Customer queries read sparse per-month cells: one row per distinct
+    (customer, area, day, slot, size, status) actually seen that month. The
+    selected months are filtered and grouped in NumPy, so the cost depends
+    on the distinct combinations in those months, not on the number of
+    recorded attempts, and no customers x slots x months block is ever
+    allocated. Both read the area recorded on each attempt, so area totals
+    are the same with or without a customer filter.
+
+    Outcomes are added with `record` as they happen: two counts are
+    incremented in place. A new area, size or month pads the small area
+    cube; a new customer only extends the labels. Either way a new view is
+    published in one assignment, so readers never block.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        labels = {'customer': [], 'area': [], 'day': list(DAYS), 'slot': list(SLOTS),
+                  'size': [], 'status': list(STATUSES), 'month': []}
+        self._view = CubeView(labels, _index(labels), self._area_cube(labels), {})
+
+    def _area_cube(self, labels):
+        return np.zeros([len(labels[axis]) for axis in AREA_AXES], dtype=np.int64)
+
+    @classmethod
+    def from_history(cls, df):
+        """
+        Build the cube from a history DataFrame in one vectorised pass
+
+        Parameters:
+        - df: History with the dataset.csv columns, plus optional `Date` and `Count`
+        """
+        cube = cls()
+        counts = df['Count'].astype(np.int64) if 'Count' in df.columns else pd.Series(1, index=df.index, dtype=np.int64)
+        frame = pd.DataFrame({
+            'customer': df['Name'].astype(str),
+            'area': df['Area'].astype(str),
+            'day': df['Day of Delivery Attempt'],
+            'slot': df['Time'],
+            'size': df['Package Size'].astype(str),
+            'status': np.where(df['Delivery Status'] == 'Success', 'Success', 'Fail'),
+            'month': df['Date'].map(month_bucket) if 'Date' in df.columns else UNDATED,
+            'count': counts
+        })
+        # Rows outside the fixed day and hourly slot labels can't be placed
+        frame = frame[frame['day'].isin(DAYS) & frame['slot'].isin(SLOTS)]
+
+        labels = dict(cube._view.labels)
+        for dimension in GROWING:
+            labels[dimension] = sorted(frame[dimension].unique())
+        codes = pd.DataFrame({
+            axis: pd.Categorical(frame[axis], categories=labels[axis]).codes.astype(np.int32) for axis in DIMENSIONS
+        })
+        weights = frame['count'].to_numpy()
+
+        by_area = cube._area_cube(labels)
+        flat = np.ravel_multi_index([codes[axis].to_numpy() for axis in AREA_AXES], by_area.shape)
+        by_area += np.bincount(flat, weights=weights, minlength=by_area.size).astype(np.int64).reshape(by_area.shape)
+
+        # One customer cell per distinct combination and month
+        cells = codes.assign(count=weights).groupby(CELL_AXES + ['month'], sort=False)['count'].sum().reset_index()
+        months = {
+            labels['month'][month]: MonthCells(part[CELL_AXES].to_numpy(), part['count'].to_numpy())
+            for month, part in cells.groupby('month')
+        }
+        cube._view = CubeView(labels, _index(labels), by_area, months)
+        return cube
+
+    def record(self, entry, attempt_date=None):
+        """
+        Count one delivery attempt
+
+        Parameters:
+        - entry: dataset.csv style row (Name, Day of Delivery Attempt, Time, Area, Package Size, Delivery Status)
+        - attempt_date: Date of the attempt (defaults to today)
+        """
+        values = {
+            'customer': str(entry['Name']),
+            'area': str(entry['Area']),
+            'day': entry['Day of Delivery Attempt'],
+            'slot': entry['Time'],
+            'size': str(entry['Package Size']),
+            'status': 'Success' if entry['Delivery Status'] == 'Success' else 'Fail',
+            'month': month_bucket(attempt_date or date.today())
+        }
+        if values['day'] not in DAYS or values['slot'] not in SLOTS:
+            return
+        with self._lock:
+            view = self._view
+            if any(values[dimension] not in view.index[dimension] for dimension in GROWING):
+                view = self._grown(view, values)
+                self._view = view
+            view.by_area[tuple(view.index[axis][values[axis]] for axis in AREA_AXES)] += 1
+            view.months[values['month']].add(tuple(view.index[axis][values[axis]] for axis in CELL_AXES))
+
+    def _grown(self, view, values):
+        """A new view with the new labels appended (the area cube is padded only when its axes grew)"""
+        labels = dict(view.labels)
+        index = dict(view.index)
+        grown = []
+        for dimension in GROWING:
+            if values[dimension] not in view.index[dimension]:
+                labels[dimension] = labels[dimension] + [values[dimension]]
+                index[dimension] = dict(index[dimension])
+                index[dimension][values[dimension]] = len(labels[dimension]) - 1
+                grown.append(dimension)
+
+        by_area = view.by_area
+        if any(dimension in AREA_AXES for dimension in grown):
+            by_area = self._area_cube(labels)
+            by_area[tuple(slice(0, length) for length in view.by_area.shape)] = view.by_area
+        months = view.months
+        if 'month' in grown:
+            months = dict(months)
+            months[values['month']] = MonthCells()
+        return CubeView(labels, index, by_area, months)
+
+    def query(self, group_by=(), filters=None, start=None, end=None, limit=None):
+        """
+        Attempt counts and failure rates grouped and filtered by any dimensions
+
+        Parameters:
+        - group_by: Dimensions to keep (roll-up sums over the others)
+        - filters: {dimension: value or list of values}; one value slices, a list dices
+        - start, end: Inclusive month bounds ('YYYY-MM'); undated attempts are
+          left out when either is given
+        - limit: Maximum rows to return
+
+        Returns:
+        - Dictionary with `rows` (the group_by labels plus attempts,
+          successes, failures and failure_rate), `totals` and `truncated`
+
+        Raises:
+        - ValueError: For unknown dimensions
+        """
+        group_by = list(group_by)
+        requested = {dimension: [values] if isinstance(values, str) else list(values) for dimension, values in (filters or {}).items()}
+        unknown = [dimension for dimension in group_by + list(requested) if dimension not in DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown dimensions: {', '.join(unknown)} (expected {', '.join(DIMENSIONS)})")
+
+        # Read one consistent view for the whole query
+        view = self._view
+        filters = dict(requested)
+        if start or end:
+            months = [m for m in view.labels['month'] if m != UNDATED and (not start or m >= start[:7]) and (not end or m <= end[:7])]
+            filters['month'] = [m for m in filters.get('month', months) if m in months]
+        # Label positions per filtered dimension; unknown labels select nothing
+        positions = {
+            dimension: [view.index[dimension][value] for value in values if value in view.index[dimension]]
+            for dimension, values in filters.items()
+        }
+
+        if 'customer' in group_by or 'customer' in filters:
+            groups, successes, failures = self._query_cells(view, group_by, positions)
+        else:
+            groups, successes, failures = self._query_area_cube(view, group_by, positions)
+
+        # Order the output by group_by, with names and months sorted
+        def sort_key(i):
+            return tuple(view.labels[dimension][code] if dimension in GROWING else code
+                         for dimension, code in zip(group_by, groups[i]))
+
+        order = sorted((i for i in range(len(groups)) if successes[i] + failures[i] > 0), key=sort_key)
+        truncated = limit is not None and len(order) > limit
+        rows = []
+        for i in order[:limit] if limit is not None else order:
+            row = {dimension: view.labels[dimension][code] for dimension, code in zip(group_by, groups[i])}
+            rows.append(dict(row, **self._rates(int(successes[i]), int(failures[i]))))
+
+        return {
+            'group_by': group_by,
+            'filters': requested,
+            'start': start,
+            'end': end,
+            'rows': rows,
+            'totals': self._rates(int(np.sum(successes)), int(np.sum(failures))),
+            'truncated': truncated
+        }
+
+    def _query_area_cube(self, view, group_by, positions):
+        """Slice, dice and roll up the dense area cube; returns (group codes, successes, failures)"""
+        array, axes = view.by_area, list(AREA_AXES)
+        # Slice and dice first, so the sums only touch the selected cells; a
+        # status filter zeroes the other outcome so status stays a full axis
+        for dimension, selected in positions.items():
+            if dimension != 'status':
+                array = np.take(array, selected, axis=axes.index(dimension))
+        statuses = positions.get('status', range(len(STATUSES)))
+        kept = [dimension for dimension in group_by if dimension != 'status'] + ['status']
+        array = array.sum(axis=tuple(i for i, axis in enumerate(axes) if axis not in kept))
+        axes = [axis for axis in axes if axis in kept]
+        array = np.transpose(array, [axes.index(dimension) for dimension in kept])
+
+        by_status = [array[..., i] if i in statuses else np.zeros(array.shape[:-1], dtype=np.int64) for i in range(len(STATUSES))]
+        successes = by_status[STATUSES.index('Success')]
+        failures = by_status[STATUSES.index('Fail')]
+        if 'status' in group_by:
+            # Grouping by status: every status gets its own cell holding only that outcome
+            successes = np.stack([successes if status == 'Success' else np.zeros_like(successes) for status in STATUSES], axis=-1)
+            failures = np.stack([failures if status == 'Fail' else np.zeros_like(failures) for status in STATUSES], axis=-1)
+        else:
+            kept = kept[:-1]
+        cells = [tuple(cell) for cell in np.argwhere(successes + failures > 0)]
+        # Map positions in the filtered axes back to label codes
+        codes = {dimension: positions.get(dimension, range(len(view.labels[dimension]))) for dimension in group_by}
+        codes['status'] = range(len(STATUSES))
+        groups = [tuple(codes[dimension][cell[kept.index(dimension)]] for dimension in group_by) for cell in cells]
+        return groups, [successes[cell] for cell in cells], [failures[cell] for cell in cells]
+
+    def _query_cells(self, view, group_by, positions):
+        """Filter and group the sparse customer cells of the selected months; returns (group codes, successes, failures)"""
+        months = [view.labels['month'][code] for code in positions.get('month', range(len(view.labels['month'])))]
+        parts = [(view.index['month'][month], view.months[month].cells()) for month in months if month in view.months]
+        if parts:
+            codes = np.concatenate([cells for _, (cells, _) in parts])
+            counts = np.concatenate([counted for _, (_, counted) in parts])
+            month_codes = np.concatenate([np.full(len(counted), code, dtype=np.int32) for code, (_, counted) in parts])
+        else:
+            codes = np.zeros((0, len(CELL_AXES)), dtype=np.int32)
+            counts = np.zeros(0, dtype=np.int64)
+            month_codes = np.zeros(0, dtype=np.int32)
+        columns = {axis: codes[:, i] for i, axis in enumerate(CELL_AXES)}
+        columns['month'] = month_codes
+
+        keep = np.ones(len(counts), dtype=bool)
+        for dimension, selected in positions.items():
+            if dimension != 'month':
+                keep &= np.isin(columns[dimension], selected)
+        counts = counts[keep]
+        succeeded = columns['status'][keep] == STATUSES.index('Success')
+
+        if group_by:
+            keys = np.stack([columns[dimension][keep] for dimension in group_by], axis=1)
+            unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+        else:
+            unique, inverse = np.zeros((1, 0), dtype=np.int32), np.zeros(len(counts), dtype=np.int64)
+        successes = np.bincount(inverse, weights=counts * succeeded, minlength=len(unique))
+        failures = np.bincount(inverse, weights=counts * ~succeeded, minlength=len(unique))
+        return [tuple(row) for row in unique.tolist()], successes, failures
+
+    def _rates(self, successes, failures):
+        attempts = successes + failures
+        return {
+            'attempts': attempts,
+            'successes': successes,
+            'failures': failures,
+            'failure_rate': round(100 * failures / attempts, 1) if attempts else None
+        }
+
+    def dimensions(self):
+        """Labels of every dimension"""
+        return {dimension: list(self._view.labels[dimension]) for dimension in DIMENSIONS}
@@ -1,12 +1,14 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for, session
+from flask import Flask, render_template, request, jsonify, redirect, url_for, session, Response, stream_with_context
 import pandas as pd
 from delivery_predictor import DeliveryPredictor
 from datetime import datetime
 import argparse
-import requests
 import json
 import os
 from chatbot_assistant import DeliveryChatbot
+from bulk_ingest import iter_csv_rows, iter_ndjson_rows, ingest_orders
+from position_tracker import parse_pings
+from analytics_cube import DIMENSIONS
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -14,7 +16,8 @@ load_dotenv()
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'dev_secret_key')  # Required for session
-predictor = DeliveryPredictor()
+# The server owns the redelivery queue and the background flush and retraining threads
+predictor = DeliveryPredictor(background_tasks=True)
 
 # Initialize chatbot with Perplexity API key from environment variable
 perplexity_api_key = os.environ.get("PERPLEXITY_API_KEY")
@@ -38,49 +41,22 @@ def index():
     # Get current day
     current_day = datetime.now().strftime('%A')
     
-    # Get pending orders
-    pending_orders = predictor.get_pending_orders()
+    # Groupings are maintained incrementally by the predictor; just read the current view
+    aggregates = predictor.order_aggregates
+    view = aggregates.view()
     
     # Get names for dropdown
-    names = sorted(list(set([order['name'] for order in pending_orders])))
-    
-    # Get today's orders for route optimization
-    todays_orders = predictor.get_todays_orders()
-    
-    # Group today's orders by customer and count parcels
-    grouped_orders = {}
-    for order in todays_orders:
-        customer_name = order['name']
-        if customer_name in grouped_orders:
-            # Increment parcel count for existing customer
-            grouped_orders[customer_name]['parcel_count'] += 1
-        else:
-            # Copy the order and add parcel count
-            grouped_order = order.copy()
-            grouped_order['parcel_count'] = 1
-            grouped_orders[customer_name] = grouped_order
-    
-    # Convert grouped orders dict to list
-    grouped_todays_orders = list(grouped_orders.values())
-    
-    # Group pending orders by customer name and delivery day
-    grouped_pending_orders = {}
+    names = list(view.names)
     
-    for order in pending_orders:
-        key = f"{order['name']}_{order['delivery_day']}"
-        if key in grouped_pending_orders:
-            grouped_pending_orders[key]['orders'].append(order)
-        else:
-            grouped_pending_orders[key] = {
-                'name': order['name'],
-                'delivery_day': order['delivery_day'],
-                'area': order['area'],
-                'address': order['address'],
-                'orders': [order]
-            }
+    # Today's orders grouped by customer with parcel counts, for route optimization
+    grouped_todays_orders = aggregates.customers_for_day(current_day)
     
-    # Convert to list for the template
-    grouped_pending_list = list(grouped_pending_orders.values())
+    # One page of pending orders grouped by customer name and delivery day
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+    pending_page = aggregates.groups_page(page=page, per_page=per_page)
+    grouped_pending_list = pending_page['items']
+    pending_count = len(predictor.order_store)
     
     # Get real-time data
     real_time_data = {
@@ -101,10 +77,10 @@ def index():
     }
     
     return render_template('index.html', 
-                          pending_orders=pending_orders,
+                          pending_count=pending_count,
+                          pending_page=pending_page,
                           current_day=current_day,
                           names=names,
-                          todays_orders=todays_orders,
                           grouped_todays_orders=grouped_todays_orders,
                           grouped_pending_orders=grouped_pending_list,
                           real_time_data=real_time_data,
@@ -116,7 +92,7 @@ def predict():
     name = request.form.get('name')
     day = request.form.get('day', datetime.now().strftime('%A'))
     
-    optimal_times = predictor.predict_optimal_times(name, day)
+    optimal_times = predictor.predict_optimal_times(name, day, package_size=request.form.get('package_size'))
     
     # Add real-time factors that influenced the prediction
     customer_area = predictor.customer_areas.get(name)
@@ -174,6 +150,172 @@ def add_order():
         'order_id': order_id
     })
 
+@app.route('/orders/bulk', methods=['POST'])
+def bulk_add_orders():
+    """Import many orders from an NDJSON or CSV upload"""
+    # Accept either a multipart file upload or a raw request body
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    content_type = (upload.content_type if upload else request.content_type) or ''
+    filename = upload.filename if upload else ''
+    
+    data_format = request.args.get('format')
+    if not data_format:
+        if 'csv' in content_type or filename.lower().endswith('.csv'):
+            data_format = 'csv'
+        else:
+            data_format = 'ndjson'
+    
+    if data_format == 'csv':
+        rows = iter_csv_rows(stream)
+    elif data_format == 'ndjson':
+        rows = iter_ndjson_rows(stream)
+    else:
+        return jsonify({'error': 'Invalid format. Use "ndjson" or "csv"'}), 400
+    
+    batch_size = request.args.get('batch_size', 500, type=int)
+    if batch_size < 1:
+        return jsonify({'error': 'batch_size must be positive'}), 400
+    
+    try:
+        result = ingest_orders(predictor, rows, batch_size=batch_size)
+    except UnicodeDecodeError:
+        return jsonify({'error': 'Upload must be UTF-8 encoded'}), 400
+    
+    return jsonify(result)
+
+@app.route('/api/orders/groups', methods=['GET'])
+def order_groups():
+    """Paginated pending order groups, filterable by day, customer and area"""
+    result = predictor.order_aggregates.groups_page(
+        day=request.args.get('day'),
+        customer=request.args.get('customer'),
+        area=request.args.get('area'),
+        page=request.args.get('page', 1, type=int),
+        per_page=min(request.args.get('per_page', 50, type=int), 500)
+    )
+    return jsonify(result)
+
+@app.route('/api/orders/customers', methods=['GET'])
+def order_customers():
+    """Per-customer parcel counts for a delivery day (defaults to today)"""
+    day = request.args.get('day', datetime.now().strftime('%A'))
+    customers = predictor.order_aggregates.customers_for_day(day, area=request.args.get('area'))
+    
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', 100, type=int), 1000))
+    start = (page - 1) * per_page
+    
+    return jsonify({
+        'day': day,
+        'items': customers[start:start + per_page],
+        'total': len(customers),
+        'page': page,
+        'per_page': per_page,
+        'pages': (len(customers) + per_page - 1) // per_page
+    })
+
+@app.route('/api/customers/<int:customer_id>', methods=['GET'])
+def get_customer(customer_id):
+    """Look up a customer in the registry by id"""
+    customer = predictor.customer_registry.get(customer_id)
+    if customer is None:
+        return jsonify({'error': 'Customer not found'}), 404
+    return jsonify(customer)
+
+@app.route('/api/customers', methods=['GET'])
+def list_customers():
+    """Paginated customer names in an area"""
+    area = request.args.get('area')
+    if not area:
+        return jsonify({'areas': predictor.customer_registry.areas()})
+    
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = max(1, min(request.args.get('per_page', 100, type=int), 1000))
+    total = predictor.customer_registry.count_in_area(area)
+    
+    return jsonify({
+        'area': area,
+        'items': predictor.customer_registry.names_in_area(area, limit=per_page, offset=(page - 1) * per_page),
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page
+    })
+
+@app.route('/api/slots/top', methods=['GET'])
+def top_customers_for_slot():
+    """Customers most likely to accept a delivery in a time slot (defaults to today and the current hour)"""
+    now = datetime.now()
+    day = request.args.get('day', now.strftime('%A'))
+    slot = request.args.get('slot', now.strftime('%-I %p'))
+    area = request.args.get('area')
+    k = max(1, min(request.args.get('k', 10, type=int), 1000))
+    offset = max(0, request.args.get('offset', 0, type=int))
+    
+    rankings = predictor.get_slot_rankings()
+    if slot not in rankings.slots:
+        return jsonify({'error': f"Unknown slot '{slot}'", 'slots': rankings.slots}), 400
+    return jsonify({
+        'day': day,
+        'slot': slot,
+        'area': area,
+        'customers': rankings.top(day, slot, k=k, area=area, offset=offset),
+        'total': rankings.count(area),
+        'model_version': rankings.version
+    })
+
+@app.route('/api/model', methods=['GET'])
+def model_status():
+    """Live model version, outcomes recorded since the last training and the last retraining result"""
+    return jsonify(predictor.retrainer.status())
+
+@app.route('/api/model/retrain', methods=['POST'])
+def model_retrain():
+    """Start retraining the model tables in the background"""
+    predictor.retrainer.request()
+    return jsonify(predictor.retrainer.status()), 202
+
+@app.route('/api/day_plan', methods=['GET'])
+def day_plan_status():
+    """The precomputed plan serving today's predictions and routes, with lookup hit counts"""
+    day_plan = predictor.get_day_plan()
+    if day_plan is None:
+        return jsonify({'error': 'No day plan for today'}), 404
+    return jsonify(day_plan.summary())
+
+@app.route('/api/horizon_plan/apply', methods=['POST'])
+def horizon_plan_apply():
+    """Move pending orders to the days and slots of a plan written by horizon_planner.py"""
+    plan = request.get_json(silent=True)
+    if not isinstance(plan, dict) or not isinstance(plan.get('days'), dict):
+        return jsonify({'error': 'Expected a horizon plan with a "days" object'}), 400
+    try:
+        moved = predictor.apply_horizon_plan(plan)
+    except (KeyError, TypeError):
+        return jsonify({'error': 'Every planned order needs an order_id and a slot'}), 400
+    return jsonify({'rescheduled': moved})
+
+@app.route('/analytics', methods=['GET'])
+def analytics():
+    """Attempt counts and failure rates from the delivery cube, grouped and filtered by any dimensions"""
+    group_by = [d for d in request.args.get('group_by', '').split(',') if d]
+    filters = {
+        dimension: request.args.get(dimension).split(',')
+        for dimension in DIMENSIONS if request.args.get(dimension)
+    }
+    limit = max(1, min(request.args.get('limit', 1000, type=int), 10000))
+    try:
+        result = predictor.delivery_cube.query(
+            group_by, filters,
+            start=request.args.get('start'),
+            end=request.args.get('end'),
+            limit=limit
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
 @app.route('/mark_delivered/<int:order_id>')
 def mark_delivered(order_id):
     """Mark an order as delivered"""
@@ -182,6 +324,19 @@ def mark_delivered(order_id):
     
     return redirect(url_for('index'))
 
+@app.route('/redelivery', methods=['GET'])
+def redelivery_queue():
+    """Failed attempts waiting to be rescheduled and the result of the last batch"""
+    return jsonify({
+        'queued': predictor.redelivery.pending(),
+        'last_batch': predictor.redelivery.last_result
+    })
+
+@app.route('/redelivery/flush', methods=['POST'])
+def redelivery_flush():
+    """Reschedule every queued failed attempt now"""
+    return jsonify(predictor.redelivery.flush())
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Process a chat message from the postman"""
@@ -219,29 +374,44 @@ def optimize_route():
     selected_customers = request.form.getlist('selected_customers[]')
     
     if not selected_customers:
-        # If no customers selected, get today's orders
-        todays_orders = predictor.get_todays_orders()
-        # Create a list with customer names, repeating for multiple orders
-        customer_counts = {}
-        for order in todays_orders:
-            name = order['name']
-            if name in customer_counts:
-                customer_counts[name] += 1
-            else:
-                customer_counts[name] = 1
+        # If no customers selected, use today's per-customer parcel counts
+        todays_customers = predictor.order_aggregates.customers_for_day(datetime.now().strftime('%A'))
         
         # Create the expanded list with customers repeated based on their order count
         selected_customers = []
-        for name, count in customer_counts.items():
-            selected_customers.extend([name] * count)
+        for customer in todays_customers:
+            selected_customers.extend([customer['name']] * customer['parcel_count'])
     
-    optimal_route = predictor.optimize_delivery_route(selected_customers)
+    try:
+        optimal_route = predictor.optimize_delivery_route(selected_customers, mode=request.form.get('mode', 'auto'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     # Store the optimized route in session for chatbot context
     session['last_route_optimization'] = optimal_route
     
     return jsonify(optimal_route)
 
+@app.route('/route_robustness', methods=['POST'])
+def route_robustness():
+    """Expected duration, p90 and lateness risk of candidate routes over sampled traffic/weather scenarios"""
+    payload = request.get_json(silent=True) or {}
+    routes = payload.get('routes')
+    if not routes or not all(isinstance(route, list) for route in routes):
+        return jsonify({'error': 'Expected {"routes": [["Customer1", "Customer2", ...], ...]}'}), 400
+    
+    samples = max(100, min(int(payload.get('samples', 5000)), 50000))
+    try:
+        result = predictor.evaluate_route_robustness(
+            routes,
+            samples=samples,
+            deadline_minutes=payload.get('deadline_minutes'),
+            seed=payload.get('seed')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(result)
+
 @app.route('/real_time_data', methods=['GET'])
 def get_real_time_data():
     """Get real-time data for traffic, weather, and festivals"""
@@ -272,6 +442,49 @@ def get_real_time_data():
     else:
         return jsonify({'error': 'Invalid data type. Use "traffic", "weather", "festivals", or "all"'}), 400
 
+@app.route('/api/stops/nearby', methods=['GET'])
+def nearby_stops():
+    """Customers near a point (k nearest or within a radius) or inside a bounding box"""
+    index = predictor.get_customer_index()
+    bbox = request.args.get('bbox')
+    
+    try:
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = (float(v) for v in bbox.split(','))
+            return jsonify({'stops': [{'name': name} for name in index.within_bbox(min_lat, min_lon, max_lat, max_lon)]})
+        
+        lat = float(request.args['lat'])
+        lon = float(request.args['lon'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Provide lat and lon, or bbox=min_lat,min_lon,max_lat,max_lon'}), 400
+    
+    radius_km = request.args.get('radius_km', type=float)
+    if radius_km is not None:
+        matches = index.within_radius(lat, lon, radius_km)
+    else:
+        matches = index.nearest(lat, lon, k=max(1, min(request.args.get('k', 5, type=int), 100)))
+    return jsonify({'stops': [{'name': name, 'distance_km': round(distance, 3)} for name, distance in matches]})
+
+@app.route('/route_geometry', methods=['POST'])
+def route_geometry():
+    """Road geometry and travel times through a sequence of points, from the local road graph"""
+    if predictor.road_graph is None:
+        return jsonify({'error': 'No road graph loaded'}), 503
+    
+    payload = request.get_json(silent=True) or {}
+    points = payload.get('points')
+    try:
+        points = [(float(lat), float(lon)) for lat, lon in points]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Expected {"points": [[lat, lon], ...]}'}), 400
+    if len(points) < 2:
+        return jsonify({'error': 'At least two points are required'}), 400
+    
+    result = predictor.road_graph.route(points)
+    if result is None:
+        return jsonify({'error': 'No route between these points'}), 404
+    return jsonify(result)
+
 @app.route('/geocode', methods=['POST'])
 def geocode():
     """Geocode an address to get coordinates"""
@@ -281,28 +494,134 @@ def geocode():
         return jsonify({'error': 'No address provided'}), 400
     
     try:
-        # Use Nominatim for geocoding
-        url = f"https://nominatim.openstreetmap.org/search?format=json&q={address}&limit=1"
-        headers = {
-            'User-Agent': 'DeliveryPredictionSystem/1.0'
-        }
-        
-        response = requests.get(url, headers=headers)
-        data = response.json()
-        
-        if data and len(data) > 0:
-            result = data[0]
-            return jsonify({
-                'lat': float(result['lat']),
-                'lon': float(result['lon']),
-                'display_name': result['display_name']
-            })
-        else:
+        # Served from the geocode cache / gazetteer; only true misses go to Nominatim
+        result = predictor.geocoder.geocode(address)
+        if result is None:
             return jsonify({'error': 'Address not found'}), 404
+        return jsonify({
+            'lat': result['lat'],
+            'lon': result['lon'],
+            'display_name': result['display_name'],
+            'source': result['source']
+        })
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/geocode/batch', methods=['POST'])
+def geocode_batch():
+    """Geocode many addresses, streaming NDJSON results as they complete"""
+    payload = request.get_json(silent=True)
+    if payload is not None:
+        addresses = payload.get('addresses') if isinstance(payload, dict) else payload
+    else:
+        # Plain text body with one address per line
+        addresses = request.get_data(as_text=True).splitlines()
+    
+    if not isinstance(addresses, list):
+        return jsonify({'error': 'Expected a JSON list of addresses or {"addresses": [...]}'}), 400
+    addresses = [str(a).strip() for a in addresses if str(a).strip()]
+    if not addresses:
+        return jsonify({'error': 'No addresses provided'}), 400
+    if len(addresses) > 10000:
+        return jsonify({'error': 'At most 10000 addresses per batch'}), 400
+    
+    workers = max(1, min(request.args.get('workers', 4, type=int), 16))
+    
+    def generate():
+        counts = {'found': 0, 'not_found': 0, 'error': 0}
+        for address, indexes, entry, error in predictor.geocoder.geocode_many(addresses, workers=workers):
+            line = {'address': address, 'indexes': indexes}
+            if error is not None:
+                line.update(status='error', error=error)
+            elif entry is None:
+                line['status'] = 'not_found'
+            else:
+                line.update(status='found', lat=entry['lat'], lon=entry['lon'],
+                            display_name=entry['display_name'], source=entry['source'])
+            counts[line['status']] += 1
+            yield json.dumps(line) + '\n'
+        yield json.dumps({'summary': dict(counts, requested=len(addresses), unique=sum(counts.values()))}) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/dispatch/start', methods=['POST'])
+def dispatch_start():
+    """Start a courier's shift with today's pending orders (or the given order ids)"""
+    payload = request.get_json(silent=True) or {}
+    orders = None
+    if payload.get('order_ids') is not None:
+        wanted = set(payload['order_ids'])
+        orders = [order for order in predictor.get_pending_orders() if order['order_id'] in wanted]
+    
+    state = predictor.dispatcher.start_shift(
+        courier_id=payload.get('courier_id', 'default'),
+        orders=orders,
+        location=payload.get('location')
+    )
+    return jsonify(state)
+
+@app.route('/dispatch/next', methods=['GET'])
+def dispatch_next():
+    """Best next stops for a courier, ranked by travel time and failure risk"""
+    courier_id = request.args.get('courier_id', 'default')
+    if predictor.dispatcher.state(courier_id) is None:
+        return jsonify({'error': 'No active shift for this courier'}), 404
+    k = max(1, min(request.args.get('k', 1, type=int), 20))
+    return jsonify({'courier_id': courier_id, 'stops': predictor.dispatcher.next_stops(courier_id, k)})
+
+@app.route('/dispatch/state', methods=['GET'])
+def dispatch_state():
+    """Current shift state for a courier"""
+    state = predictor.dispatcher.state(request.args.get('courier_id', 'default'))
+    if state is None:
+        return jsonify({'error': 'No active shift for this courier'}), 404
+    return jsonify(state)
+
+@app.route('/dispatch/location', methods=['POST'])
+def dispatch_location():
+    """Move a courier to an address, e.g. after a detour"""
+    payload = request.get_json(silent=True) or {}
+    courier_id = payload.get('courier_id', 'default')
+    if not payload.get('location'):
+        return jsonify({'error': 'location is required'}), 400
+    if not predictor.dispatcher.update_location(courier_id, payload['location'], payload.get('area')):
+        return jsonify({'error': 'No active shift for this courier'}), 404
+    return jsonify(predictor.dispatcher.state(courier_id))
+
+@app.route('/tracking/pings', methods=['POST'])
+def tracking_pings():
+    """Ingest a batch of NDJSON position pings (one {"courier_id", "lat", "lon", "timestamp"} per line)"""
+    pings, errors = parse_pings(request.stream)
+    result = predictor.position_tracker.ingest(pings)
+    result['errors'] = errors[:100]
+    return jsonify(result)
+
+@app.route('/tracking/route', methods=['POST'])
+def tracking_route():
+    """Start tracking a courier along a planned route"""
+    payload = request.get_json(silent=True) or {}
+    route = payload.get('route')
+    if not route:
+        return jsonify({'error': 'route (list of customer names) is required'}), 400
+    try:
+        progress = predictor.position_tracker.set_route(payload.get('courier_id', 'default'), route)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(progress)
+
+@app.route('/tracking/eta', methods=['GET'])
+def tracking_eta():
+    """Last known position and ETAs of a courier's remaining stops"""
+    courier_id = request.args.get('courier_id', 'default')
+    progress = predictor.position_tracker.progress(courier_id)
+    if progress is None:
+        position = predictor.position_tracker.position(courier_id)
+        if position is None:
+            return jsonify({'error': 'No route or position for this courier'}), 404
+        return jsonify({'courier_id': courier_id, 'position': position, 'remaining': []})
+    return jsonify(progress)
+
 if __name__ == '__main__':
     # Parse command line arguments
     parser = argparse.ArgumentParser(description='Delivery Prediction System')
@@ -0,0 +1,136 @@
+import codecs
+import csv
+import json
+import time
+
+VALID_DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+VALID_PACKAGE_SIZES = ['Small', 'Medium', 'Large']
+
+# Stop collecting per-row errors after this many so a bad file can't blow up the response
+MAX_REPORTED_ERRORS = 1000
+
+
+def iter_ndjson_rows(stream, encoding='utf-8'):
+    """
+    Parse a binary stream of newline-delimited JSON one line at a time
+
+    Yields (row_number, row_dict, error) tuples; exactly one of row_dict and
+    error is set.
+    """
+    row_number = 0
+    for raw_line in codecs.iterdecode(stream, encoding):
+        line = raw_line.strip()
+        if not line:
+            continue
+        row_number += 1
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield row_number, None, f"Invalid JSON: {e.msg}"
+            continue
+        if not isinstance(row, dict):
+            yield row_number, None, "Each line must be a JSON object"
+            continue
+        yield row_number, row, None
+
+
+def iter_csv_rows(stream, encoding='utf-8'):
+    """
+    Parse a binary CSV stream with a header row one record at a time
+
+    Yields (row_number, row_dict, error) tuples like iter_ndjson_rows.
+    """
+    reader = csv.DictReader(codecs.iterdecode(stream, encoding))
+    for row_number, row in enumerate(reader, 1):
+        if None in row:
+            yield row_number, None, "Row has more columns than the header"
+            continue
+        yield row_number, {k.strip(): (v.strip() if isinstance(v, str) else v) for k, v in row.items()}, None
+
+
+def validate_order_row(row, customer_areas):
+    """
+    Normalise and validate one order row
+
+    Returns:
+    - (name, delivery_day, package_size, error); error is None for valid rows
+    """
+    name = str(row.get('name') or '').strip()
+    if not name:
+        return None, None, None, "Missing customer name"
+    if name not in customer_areas:
+        return None, None, None, f"Unknown customer '{name}'"
+
+    delivery_day = str(row.get('delivery_day') or '').strip().title()
+    if delivery_day not in VALID_DAYS:
+        return None, None, None, f"Invalid delivery_day '{row.get('delivery_day')}'"
+
+    package_size = row.get('package_size')
+    if package_size in (None, ''):
+        package_size = None
+    else:
+        package_size = str(package_size).strip().title()
+        if package_size not in VALID_PACKAGE_SIZES:
+            return None, None, None, f"Invalid package_size '{row.get('package_size')}'"
+
+    return name, delivery_day, package_size, None
+
+
+def ingest_orders(predictor, rows, batch_size=500):
+    """
+    Validate a stream of order rows and commit them to the predictor in batches
+
+    Parameters:
+    - predictor: DeliveryPredictor receiving the orders
+    - rows: Iterable of (row_number, row_dict, error) from iter_ndjson_rows/iter_csv_rows
+    - batch_size: Number of valid orders committed per write
+
+    Returns:
+    - Dictionary with accepted order ids, per-row errors and throughput stats
+    """
+    started = time.perf_counter()
+    total_rows = 0
+    accepted_ids = []
+    errors = []
+    rejected = 0
+    batches = 0
+    batch = []
+
+    def report(row_number, message):
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({'row': row_number, 'error': message})
+
+    for row_number, row, error in rows:
+        total_rows += 1
+        if error is None:
+            name, delivery_day, package_size, error = validate_order_row(row, predictor.customer_areas)
+        if error is not None:
+            rejected += 1
+            report(row_number, error)
+            continue
+
+        batch.append((name, delivery_day, package_size))
+        if len(batch) >= batch_size:
+            accepted_ids.extend(predictor.add_orders(batch))
+            batches += 1
+            batch = []
+
+    if batch:
+        accepted_ids.extend(predictor.add_orders(batch))
+        batches += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        'success': rejected == 0,
+        'accepted': len(accepted_ids),
+        'rejected': rejected,
+        'order_ids': accepted_ids,
+        'errors': errors,
+        'errors_truncated': rejected > len(errors),
+        'stats': {
+            'rows': total_rows,
+            'batches': batches,
+            'seconds': round(elapsed, 4),
+            'rows_per_second': round(total_rows / elapsed, 1) if elapsed > 0 else None
+        }
+    }
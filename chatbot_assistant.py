@@ -3,12 +3,15 @@ import json
 import os
 from datetime import datetime
 import logging
+from upstream_replay import create_upstream_session
 
 class DeliveryChatbot:
-    def __init__(self, predictor, perplexity_api_key=None):
+    def __init__(self, predictor, perplexity_api_key=None, http_session=None):
         self.predictor = predictor
         self.perplexity_api_key = perplexity_api_key or os.environ.get("PERPLEXITY_API_KEY")
-        if not self.perplexity_api_key:
+        # Share the predictor's upstream session so recording/replay covers the chatbot too
+        self.http = http_session or getattr(predictor, 'http', None) or create_upstream_session()
+        if not self.perplexity_api_key and not self.http.replaying:
             logging.warning("No Perplexity API key provided. Chatbot will use mock responses.")
         self.chat_history = []
         
@@ -17,7 +20,7 @@ class DeliveryChatbot:
         # Build context from the current data
         system_context = self._build_system_context(current_context)
         
-        if not self.perplexity_api_key:
+        if not self.perplexity_api_key and not self.http.replaying:
             logging.warning("No Perplexity API key provided. Using mock response.")
             return self._generate_mock_response(query, system_context)
             
@@ -43,7 +46,7 @@ class DeliveryChatbot:
         
         try:
             # Call Perplexity API
-            response = requests.post(
+            response = self.http.post(
                 "https://api.perplexity.ai/chat/completions",
                 headers=headers,
                 json=payload,
@@ -124,12 +127,19 @@ class DeliveryChatbot:
         # Get current date
         current_date = datetime.now().strftime("%A, %B %d, %Y")
         
+        # Only customers with deliveries today go into the prompt; the registry can hold far more
+        try:
+            todays_customers = list(dict.fromkeys(order['name'] for order in self.predictor.get_todays_orders()))
+        except Exception as e:
+            logging.exception("Error retrieving today's customers")
+            todays_customers = []
+        
         # Get customer info with addresses and areas
         try:
             customer_info = []
-            for name, info in self.predictor.customer_areas.items():
+            for name in todays_customers:
                 address = self.predictor.customer_addresses.get(name, "Unknown address")
-                area = info
+                area = self.predictor.customer_areas.get(name, "Unknown area")
                 customer_info.append(f"- {name}: Area: {area}, Address: {address}")
             
             customer_info_str = "\n".join(customer_info) if customer_info else "No customer information available."
@@ -180,8 +190,9 @@ class DeliveryChatbot:
         # Get optimal delivery times for each customer
         try:
             optimal_times_info = []
-            for name, area in self.predictor.customer_areas.items():
-                optimal_times = self.predictor.predict_optimal_times(name)
+            current_day = datetime.now().strftime('%A')
+            for name in todays_customers:
+                optimal_times = self.predictor.predict_optimal_times(name, current_day)
                 if optimal_times and len(optimal_times) > 0:
                     best_time = optimal_times[0]['time']
                     failure_rate = optimal_times[0]['failure_rate']
@@ -0,0 +1,287 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+HOURS_PER_WEEK = 168
+
+
+def congestion_status(level):
+    """Describe a 1-10 congestion level the same way the traffic feed does"""
+    if level <= 3:
+        return "Smooth traffic flow"
+    elif level <= 5:
+        return "Regular traffic flow"
+    elif level <= 7:
+        return "Moderate congestion"
+    elif level <= 9:
+        return "Heavy traffic"
+    return "Severe congestion, avoid if possible"
+
+
+def hour_of_week(when):
+    """Bucket a datetime into 0-167 (Monday 00:00 is bucket 0)"""
+    return when.weekday() * 24 + when.hour
+
+
+class CongestionHistory:
+    """
+    Per-area congestion time series kept in fixed-size NumPy ring buffers
+
+    Every traffic snapshot is appended to the ring buffer of each area it
+    mentions and folded into an hour-of-week profile (running sum and count
+    per area and bucket). The profile gives a local congestion forecast that
+    can stand in for the upstream traffic feed when it is slow, down or
+    rate-limited.
+
+    Parameters:
+    - path: .npz file the history is persisted to
+    - capacity: Number of readings kept per area (default two weeks at 10 minute spacing)
+    - min_samples: Readings needed in an hour-of-week bucket before it is trusted
+    - save_interval: Minimum seconds between automatic saves
+    """
+
+    def __init__(self, path='congestion_history.npz', capacity=2016, min_samples=1, save_interval=60):
+        self.path = path
+        self.capacity = capacity
+        self.min_samples = min_samples
+        self.save_interval = save_interval
+        self._lock = threading.Lock()
+        self._last_saved = 0
+
+        self.areas = []
+        self.area_index = {}
+        self.timestamps = np.zeros((0, capacity), dtype=np.float64)
+        self.levels = np.zeros((0, capacity), dtype=np.float32)
+        self.heads = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.profile_sum = np.zeros((0, HOURS_PER_WEEK), dtype=np.float64)
+        self.profile_count = np.zeros((0, HOURS_PER_WEEK), dtype=np.int64)
+
+    @classmethod
+    def load_or_create(cls, path='congestion_history.npz', **kwargs):
+        """Load a persisted history, or start an empty one if the file does not exist"""
+        history = cls(path, **kwargs)
+        if os.path.exists(path):
+            try:
+                history.load()
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Could not load congestion history from {path}: {e}")
+        return history
+
+    def _area_row(self, area):
+        """Return the row for an area, growing the arrays for new areas (caller holds the lock)"""
+        if area in self.area_index:
+            return self.area_index[area]
+
+        row = len(self.areas)
+        self.areas.append(area)
+        self.area_index[area] = row
+        self.timestamps = np.vstack([self.timestamps, np.zeros((1, self.capacity), dtype=np.float64)])
+        self.levels = np.vstack([self.levels, np.zeros((1, self.capacity), dtype=np.float32)])
+        self.heads = np.append(self.heads, 0)
+        self.counts = np.append(self.counts, 0)
+        self.profile_sum = np.vstack([self.profile_sum, np.zeros((1, HOURS_PER_WEEK), dtype=np.float64)])
+        self.profile_count = np.vstack([self.profile_count, np.zeros((1, HOURS_PER_WEEK), dtype=np.int64)])
+        return row
+
+    def record(self, traffic_data, when=None, area=None):
+        """
+        Record a traffic snapshot
+
+        Parameters:
+        - traffic_data: Traffic feed dictionary keyed by area, or a single area's reading
+        - when: Time of the snapshot (defaults to now)
+        - area: Area name when traffic_data is a single area's reading
+
+        Returns:
+        - Number of area readings recorded
+        """
+        if not isinstance(traffic_data, dict):
+            return 0
+
+        when = when or datetime.now()
+        if area and 'congestion_level' in traffic_data:
+            readings = {area: traffic_data}
+        else:
+            readings = traffic_data
+
+        bucket = hour_of_week(when)
+        stamp = when.timestamp()
+        recorded = 0
+
+        with self._lock:
+            for area_name, reading in readings.items():
+                if not isinstance(reading, dict) or 'congestion_level' not in reading:
+                    continue
+                try:
+                    level = float(reading['congestion_level'])
+                except (TypeError, ValueError):
+                    continue
+
+                row = self._area_row(area_name)
+                head = self.heads[row]
+                self.timestamps[row, head] = stamp
+                self.levels[row, head] = level
+                self.heads[row] = (head + 1) % self.capacity
+                self.counts[row] = min(self.counts[row] + 1, self.capacity)
+                self.profile_sum[row, bucket] += level
+                self.profile_count[row, bucket] += 1
+                recorded += 1
+
+        if recorded and time.time() - self._last_saved >= self.save_interval:
+            self.save()
+
+        return recorded
+
+    def recent(self, area, limit=None):
+        """Return (timestamps, levels) of the most recent readings for an area, oldest first"""
+        with self._lock:
+            row = self.area_index.get(area)
+            if row is None:
+                return np.zeros(0), np.zeros(0, dtype=np.float32)
+            count = int(self.counts[row])
+            order = (self.heads[row] - count + np.arange(count)) % self.capacity
+            if limit:
+                order = order[-limit:]
+            return self.timestamps[row, order].copy(), self.levels[row, order].copy()
+
+    def has_profile(self):
+        """Whether any readings have been recorded yet"""
+        return bool(self.profile_count.size and self.profile_count.sum() > 0)
+
+    def forecast(self, area, when=None):
+        """
+        Forecast the congestion level for an area from its hour-of-week profile
+
+        Falls back to the area's average over all hours when the bucket has
+        too few samples. Returns None for areas that have never been recorded.
+        """
+        when = when or datetime.now()
+        bucket = hour_of_week(when)
+
+        with self._lock:
+            row = self.area_index.get(area)
+            if row is None:
+                return None
+
+            count = self.profile_count[row, bucket]
+            if count >= self.min_samples:
+                return float(self.profile_sum[row, bucket] / count)
+
+            total = self.profile_count[row].sum()
+            if total:
+                return float(self.profile_sum[row].sum() / total)
+            return None
+
+    def forecast_traffic(self, when=None, area=None):
+        """
+        Build a traffic feed dictionary from the learned profiles
+
+        The result has the same shape as get_real_time_data('traffic') so
+        predictions and routing can consume it unchanged.
+        """
+        when = when or datetime.now()
+        timestamp = when.strftime("%Y-%m-%d %H:%M:%S")
+        bucket = hour_of_week(when)
+
+        with self._lock:
+            if not self.areas:
+                return None
+
+            # Vectorised forecast for every area at once
+            counts = self.profile_count[:, bucket]
+            totals = self.profile_count.sum(axis=1)
+            bucket_mean = np.divide(self.profile_sum[:, bucket], counts,
+                                    out=np.zeros(len(self.areas)), where=counts > 0)
+            overall_mean = np.divide(self.profile_sum.sum(axis=1), totals,
+                                     out=np.zeros(len(self.areas)), where=totals > 0)
+            levels = np.where(counts >= self.min_samples, bucket_mean, overall_mean)
+            known = totals > 0
+            areas = list(self.areas)
+
+        traffic_data = {}
+        for area_name, level, is_known in zip(areas, levels, known):
+            if not is_known:
+                continue
+            congestion = int(min(10, max(1, round(level))))
+            traffic_data[area_name] = {
+                "congestion_level": congestion,
+                "delay_minutes": int(5 * (1.5 ** congestion)),
+                "status": congestion_status(congestion),
+                "source": "forecast",
+                "timestamp": timestamp
+            }
+
+        if not traffic_data:
+            return None
+
+        if area:
+            return traffic_data.get(area)
+
+        overall = round(sum(d['congestion_level'] for d in traffic_data.values()) / len(traffic_data))
+        traffic_data["overall_city_congestion"] = overall
+        traffic_data["status"] = congestion_status(overall)
+        traffic_data["source"] = "forecast"
+        return traffic_data
+
+    def save(self, path=None):
+        """Persist the history atomically to an .npz file"""
+        path = path or self.path
+        tmp_path = f"{path}.tmp.npz"
+        with self._lock:
+            np.savez(
+                tmp_path,
+                areas=np.array(self.areas, dtype=str),
+                timestamps=self.timestamps,
+                levels=self.levels,
+                heads=self.heads,
+                counts=self.counts,
+                profile_sum=self.profile_sum,
+                profile_count=self.profile_count
+            )
+            os.replace(tmp_path, path)
+            self._last_saved = time.time()
+
+    def load(self, path=None):
+        """Load a persisted history, resizing ring buffers if the capacity changed"""
+        path = path or self.path
+        with np.load(path) as data:
+            areas = [str(a) for a in data['areas']]
+            timestamps = data['timestamps']
+            levels = data['levels']
+            heads = data['heads']
+            counts = data['counts']
+            profile_sum = data['profile_sum']
+            profile_count = data['profile_count']
+
+        with self._lock:
+            self.areas = areas
+            self.area_index = {area: i for i, area in enumerate(areas)}
+            self.profile_sum = profile_sum.astype(np.float64)
+            self.profile_count = profile_count.astype(np.int64)
+
+            if timestamps.shape[1] == self.capacity:
+                self.timestamps = timestamps.astype(np.float64)
+                self.levels = levels.astype(np.float32)
+                self.heads = heads.astype(np.int64)
+                self.counts = counts.astype(np.int64)
+                return
+
+            # Re-pack each ring buffer oldest-first into the new capacity
+            old_capacity = timestamps.shape[1]
+            self.timestamps = np.zeros((len(areas), self.capacity), dtype=np.float64)
+            self.levels = np.zeros((len(areas), self.capacity), dtype=np.float32)
+            self.heads = np.zeros(len(areas), dtype=np.int64)
+            self.counts = np.zeros(len(areas), dtype=np.int64)
+            for row in range(len(areas)):
+                count = int(counts[row])
+                order = (heads[row] - count + np.arange(count)) % old_capacity
+                order = order[-self.capacity:]
+                kept = len(order)
+                self.timestamps[row, :kept] = timestamps[row, order]
+                self.levels[row, :kept] = levels[row, order]
+                self.heads[row] = kept % self.capacity
+                self.counts[row] = kept
@@ -0,0 +1,252 @@
+import argparse
+import csv
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from functools import lru_cache
+
+# Seed customers for a fresh registry: (name, area, address)
+DEFAULT_CUSTOMERS = [
+    ('Aditya', 'Satellite', 'Near Jodhpur Cross Road, Satellite, Ahmedabad - 380015'),
+    ('Vivaan', 'Bopal', 'Near Bopal Cross Road, Bopal, Ahmedabad - 380058'),
+    ('Aarav', 'Vastrapur', 'Near Vastrapur Lake, Vastrapur, Ahmedabad - 380015'),
+    ('Meera', 'Paldi', 'Opposite Dharnidhar Derasar, Paldi, Ahmedabad - 380007'),
+    ('Diya', 'Thaltej', 'Near Thaltej Cross Road, S.G. Highway, Ahmedabad - 380054'),
+    ('Riya', 'Navrangpura', 'Near Navrangpura AMTS Bus Stop, Navrangpura, Ahmedabad - 380009'),
+    ('Ananya', 'Bodakdev', 'Opposite Rajpath Club, Bodakdev, Ahmedabad - 380054'),
+    ('Aryan', 'Gota', 'Near Oganaj Gam, Gota, Ahmedabad - 382481'),
+    ('Ishaan', 'Maninagar', 'Opposite Rambaug Police Station, Maninagar, Ahmedabad - 380008'),
+    ('Kabir', 'Chandkheda', 'Near Chandkheda Gam Bus Stop, Chandkheda, Ahmedabad - 382424')
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    customer_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    area TEXT NOT NULL,
+    address TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_customers_area ON customers (area);
+CREATE INDEX IF NOT EXISTS idx_customers_address ON customers (address);
+"""
+
+# Number of addresses kept in memory after a lazy lookup
+ADDRESS_CACHE_SIZE = 4096
+
+
+class CustomerRegistry:
+    """
+    Customers with their fixed area and address, stored in SQLite
+
+    Only the compact name -> (id, area) index is held in memory, since that
+    is what validation and routing hit on every request. Addresses stay in
+    the database and are loaded lazily through a bounded LRU cache, and the
+    area and address columns are indexed for area listings and reverse
+    address lookups.
+
+    Parameters:
+    - db_path: SQLite database file
+    - seed: Customers inserted when the registry is empty (defaults to DEFAULT_CUSTOMERS)
+    """
+
+    def __init__(self, db_path='customers.db', seed=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # name -> (customer_id, area), replaced wholesale on writes
+        self._index = {}
+
+        self._connection().executescript(SCHEMA)
+        self._address = lru_cache(maxsize=ADDRESS_CACHE_SIZE)(self._fetch_address)
+
+        count = self._connection().execute('SELECT COUNT(*) FROM customers').fetchone()[0]
+        if count == 0:
+            self.upsert_many(DEFAULT_CUSTOMERS if seed is None else seed)
+        else:
+            self._load_index()
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def _load_index(self):
+        rows = self._connection().execute('SELECT name, customer_id, area FROM customers ORDER BY customer_id')
+        self._index = {name: (customer_id, area) for name, customer_id, area in rows}
+
+    def upsert_many(self, customers):
+        """
+        Insert or update customers
+
+        Parameters:
+        - customers: Iterable of (name, area, address) tuples
+        """
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    'INSERT INTO customers (name, area, address) VALUES (?, ?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET area = excluded.area, address = excluded.address',
+                    customers
+                )
+            self._address.cache_clear()
+            self._load_index()
+
+    def import_csv(self, csv_path, batch_size=10000):
+        """Import customers from a CSV with name, area and address columns. Returns the number of rows read."""
+        imported = 0
+        batch = []
+        with open(csv_path, newline='') as f:
+            for row in csv.DictReader(f):
+                batch.append((row['name'].strip(), row['area'].strip(), (row.get('address') or '').strip() or None))
+                if len(batch) >= batch_size:
+                    self.upsert_many(batch)
+                    imported += len(batch)
+                    batch = []
+        if batch:
+            self.upsert_many(batch)
+            imported += len(batch)
+        return imported
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def names(self):
+        """All customer names in id order"""
+        return list(self._index)
+
+    def id_for(self, name):
+        """Customer id for a name, or None"""
+        entry = self._index.get(name)
+        return entry[0] if entry else None
+
+    def area_of(self, name):
+        """Fixed delivery area of a customer, or None"""
+        entry = self._index.get(name)
+        return entry[1] if entry else None
+
+    def address_of(self, name):
+        """Address of a customer, loaded from the database on first use"""
+        if name not in self._index:
+            return None
+        return self._address(name)
+
+    def get(self, customer_id):
+        """Look up a customer by id. Returns a dict or None."""
+        row = self._connection().execute(
+            'SELECT customer_id, name, area, address FROM customers WHERE customer_id = ?', (customer_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'customer_id': row[0], 'name': row[1], 'area': row[2], 'address': row[3]}
+
+    def names_in_area(self, area, limit=None, offset=0):
+        """Customer names in an area, in id order"""
+        sql = 'SELECT name FROM customers WHERE area = ? ORDER BY customer_id'
+        params = (area,)
+        if limit is not None:
+            sql += ' LIMIT ? OFFSET ?'
+            params += (limit, offset)
+        return [row[0] for row in self._connection().execute(sql, params)]
+
+    def count_in_area(self, area):
+        """Number of customers in an area"""
+        return self._connection().execute('SELECT COUNT(*) FROM customers WHERE area = ?', (area,)).fetchone()[0]
+
+    def areas(self):
+        """Distinct areas with at least one customer"""
+        return [row[0] for row in self._connection().execute('SELECT DISTINCT area FROM customers ORDER BY area')]
+
+    def area_for_address(self, address):
+        """Area of the customer living at an address (indexed reverse lookup), or None"""
+        row = self._connection().execute('SELECT area FROM customers WHERE address = ? LIMIT 1', (address,)).fetchone()
+        return row[0] if row else None
+
+    def areas_view(self):
+        """Read-only name -> area mapping backed by the registry"""
+        return CustomerAreas(self)
+
+    def addresses_view(self):
+        """Read-only name -> address mapping with lazily loaded values"""
+        return CustomerAddresses(self)
+
+    def _fetch_address(self, name):
+        row = self._connection().execute('SELECT address FROM customers WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+
+class CustomerAreas(Mapping):
+    """Dict-like name -> area view over a CustomerRegistry"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getitem__(self, name):
+        area = self.registry.area_of(name)
+        if area is None:
+            raise KeyError(name)
+        return area
+
+    def __contains__(self, name):
+        return name in self.registry
+
+    def __iter__(self):
+        return iter(self.registry.names())
+
+    def __len__(self):
+        return len(self.registry)
+
+
+class CustomerAddresses(Mapping):
+    """Dict-like name -> address view over a CustomerRegistry; values are loaded on access"""
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def __getitem__(self, name):
+        if name not in self.registry:
+            raise KeyError(name)
+        return self.registry.address_of(name)
+
+    def __contains__(self, name):
+        return name in self.registry
+
+    def __iter__(self):
+        return iter(self.registry.names())
+
+    def __len__(self):
+        return len(self.registry)
+
+    def items(self):
+        # Stream from the database instead of one lookup per customer
+        return list(self.registry._connection().execute('SELECT name, address FROM customers ORDER BY customer_id'))
+
+
+def open_registry():
+    """Open the registry at CUSTOMER_DB_PATH, importing CUSTOMERS_CSV into an empty registry"""
+    registry = CustomerRegistry(os.environ.get('CUSTOMER_DB_PATH', 'customers.db'))
+    csv_path = os.environ.get('CUSTOMERS_CSV')
+    if csv_path and os.path.exists(csv_path) and len(registry) <= len(DEFAULT_CUSTOMERS):
+        imported = registry.import_csv(csv_path)
+        print(f"Imported {imported} customers from {csv_path}")
+    return registry
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Create or update the customer registry')
+    parser.add_argument('--db', default='customers.db', help='SQLite database to create or update')
+    parser.add_argument('--import-csv', metavar='PATH', help='CSV with name, area and address columns')
+    args = parser.parse_args()
+
+    registry = CustomerRegistry(args.db)
+    if args.import_csv:
+        print(f"Imported {registry.import_csv(args.import_csv)} customers from {args.import_csv}")
+    print(f"{len(registry)} customers in {len(registry.areas())} areas")
@@ -0,0 +1,249 @@
+import argparse
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+
+DEFAULT_PLAN_PATH = 'day_plan.json'
+
+
+def orders_fingerprint(customer_names, mode='auto'):
+    """Fingerprint of a set of stops (order-independent, counting repeated parcels) and a routing mode"""
+    key = json.dumps([sorted(customer_names), mode])
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def _congestion_key(traffic):
+    """
+    Congestion as the adjustments see it
+
+    The prediction scales peak hours by the raw level from 7 up and boosts
+    off-peak hours at 3 and below; routes use the bands <= 3, <= 6, <= 8.
+    So levels 4-6 are equivalent, every other level counts on its own.
+    """
+    level = traffic.get('congestion_level', 5) if isinstance(traffic, dict) else 5
+    return level if level <= 3 or level >= 7 else 'normal'
+
+
+def condition_key(traffic_by_area, weather_data, festival_data, today=None):
+    """
+    The real-time conditions the prediction and route adjustments depend on
+
+    Built from the exact tests _apply_real_time_adjustments and
+    _adjust_travel_duration branch on, so a plan stays valid exactly as long
+    as its answers would not change:
+    - traffic: congestion per area (see _congestion_key)
+    - weather: `rainy` (conditions exactly rain/rainy/thunderstorm/stormy,
+      or a 70% chance of rain), `wet_roads` (conditions mention rain, snow
+      or thunderstorm), `low_visibility` (fog or mist) and `hot` (38 degrees)
+    - festivals: each festival with its date and whether that date is today,
+      since predictions only react to today's festivals
+
+    Parameters:
+    - traffic_by_area: {area: get_real_time_data('traffic', area)}
+    - weather_data, festival_data: As returned by get_real_time_data
+    - today: Date the adjustments would run on (defaults to today)
+
+    Returns:
+    - Dictionary with `traffic` ({area: key}), `weather` and `festivals` lists
+    """
+    today = (today or date.today()).isoformat()
+    traffic = {area: _congestion_key(data) for area, data in traffic_by_area.items()}
+
+    weather = []
+    if isinstance(weather_data, dict):
+        conditions = str(weather_data.get('conditions', '')).lower()
+        precipitation = weather_data.get('precipitation')
+        chance = precipitation.get('chance', 0) if isinstance(precipitation, dict) else 0
+        if conditions in ('rain', 'rainy', 'thunderstorm', 'stormy') or chance >= 70:
+            weather.append('rainy')
+        if any(word in conditions for word in ('rain', 'snow', 'thunderstorm')):
+            weather.append('wet_roads')
+        if 'fog' in conditions or 'mist' in conditions:
+            weather.append('low_visibility')
+        temperature = weather_data.get('temperature')
+        if isinstance(temperature, dict) and temperature.get('current', 30) >= 38:
+            weather.append('hot')
+
+    festivals = []
+    if isinstance(festival_data, dict) and festival_data.get('has_festival_today', False):
+        festivals = sorted(
+            f"{festival.get('name')}|{festival.get('traffic_impact')}|{festival.get('time')}|"
+            f"{festival.get('date')}|{festival.get('date') == today}|{','.join(sorted(festival.get('affected_areas', [])))}"
+            for festival in festival_data.get('festivals', [])
+        )
+    return {'traffic': traffic, 'weather': weather, 'festivals': festivals}
+
+
+def current_conditions(predictor, areas, today=None):
+    """condition_key for the predictor's current (cached) real-time data in some areas"""
+    return condition_key(
+        {area: predictor.get_real_time_data('traffic', area) for area in areas},
+        predictor.get_real_time_data('weather'),
+        predictor.get_real_time_data('festivals'),
+        today
+    )
+
+
+def _conditions_match(planned, current, areas):
+    if planned['weather'] != current['weather'] or planned['festivals'] != current['festivals']:
+        return False
+    return all(planned['traffic'].get(area) == current['traffic'].get(area) for area in areas)
+
+
+def build_day_plan(predictor, plan_date=None):
+    """
+    Precompute a day's predictions and routes
+
+    - Ranked time slots (model score with the real-time adjustments) for
+      every registered customer, for the plan's day of the week.
+    - The route for all orders due that day, plus one route per area.
+
+    Parameters:
+    - predictor: DeliveryPredictor
+    - plan_date: Date to plan for (defaults to tomorrow)
+
+    Returns:
+    - JSON-serialisable plan with a `fingerprint` over its contents
+    """
+    plan_date = plan_date or date.today() + timedelta(days=1)
+    day = plan_date.strftime('%A')
+
+    predictions = {}
+    for name in sorted(predictor.customer_areas):
+        ranked = predictor._ranked_times(name, day)
+        if ranked is not None:
+            predictions[name] = [[time, round(score, 6)] for time, score in ranked]
+
+    # Candidate routes: the whole day's stops, then each area on its own
+    customers = predictor.order_aggregates.customers_for_day(day)
+    stops = [customer['name'] for customer in customers for _ in range(customer['parcel_count'])]
+    candidates = [stops]
+    for area in sorted({customer['area'] for customer in customers}):
+        candidates.append([name for name in stops if predictor.customer_areas.get(name) == area])
+
+    routes = {}
+    for names in candidates:
+        fingerprint = orders_fingerprint(names)
+        if names and fingerprint not in routes:
+            routes[fingerprint] = {
+                'customers': sorted(names),
+                'areas': sorted({predictor.customer_areas.get(name) for name in names} - {None}),
+                'route': predictor.optimize_delivery_route(names)
+            }
+
+    plan = {
+        'date': plan_date.isoformat(),
+        'day': day,
+        'built_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'model_fingerprint': predictor.model_tables.fingerprint,
+        # Keyed as of now, the day the adjustments in these answers ran on
+        'conditions': current_conditions(predictor, sorted(set(predictor.customer_areas.values()))),
+        'orders_fingerprint': orders_fingerprint(stops),
+        'predictions': predictions,
+        'routes': routes
+    }
+    plan['fingerprint'] = hashlib.sha1(json.dumps(plan, sort_keys=True).encode()).hexdigest()[:16]
+    return plan
+
+
+def save_day_plan(plan, path=DEFAULT_PLAN_PATH):
+    """Write the plan atomically, so a running server never reads a partial file"""
+    temporary = f"{path}.tmp"
+    with open(temporary, 'w') as f:
+        json.dump(plan, f)
+    os.replace(temporary, path)
+
+
+class DayPlan:
+    """
+    A loaded day plan answering predictions and routes by lookup
+
+    A lookup returns None (and the caller computes on demand) when the plan
+    is for another date or day, the live model tables differ from the ones
+    it was built with (compared by content fingerprint, so a plan built in
+    another process still matches), the stops differ from every planned
+    route, or the real-time conditions that affect the answer have changed
+    (see condition_key).
+
+    Parameters:
+    - plan: Dictionary from build_day_plan
+    - mtime: Modification time of the file it was loaded from
+    """
+
+    def __init__(self, plan, mtime=None):
+        self.plan = plan
+        self.mtime = mtime
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path=DEFAULT_PLAN_PATH):
+        with open(path) as f:
+            plan = json.load(f)
+        return cls(plan, os.path.getmtime(path))
+
+    def is_current(self, today=None):
+        """Whether the plan is for today"""
+        return self.plan['date'] == (today or date.today()).isoformat()
+
+    def _usable(self, predictor, day):
+        return self.is_current() and day == self.plan['day'] and predictor.model_tables.fingerprint == self.plan['model_fingerprint']
+
+    def _count(self, result):
+        # Plain counters for the status endpoint; an occasional lost increment is harmless
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def ranked_times(self, predictor, name, day, package_size=None):
+        """Planned (time, score) list for a customer, most likely first, or None to compute on demand"""
+        ranked = self.plan['predictions'].get(name)
+        if ranked is None or package_size is not None or not self._usable(predictor, day):
+            return self._count(None)
+        area = predictor.customer_areas.get(name)
+        if not _conditions_match(self.plan['conditions'], current_conditions(predictor, [area]), [area]):
+            return self._count(None)
+        return self._count([(time, score) for time, score in ranked])
+
+    def route(self, predictor, customer_names, mode='auto'):
+        """Planned route for exactly these stops, or None to compute on demand"""
+        if mode != 'auto' or not self._usable(predictor, datetime.now().strftime('%A')):
+            return self._count(None)
+        entry = self.plan['routes'].get(orders_fingerprint(customer_names, mode))
+        if entry is None or not _conditions_match(self.plan['conditions'], current_conditions(predictor, entry['areas']), entry['areas']):
+            return self._count(None)
+        return self._count(entry['route'])
+
+    def summary(self):
+        """Plan metadata and lookup counts"""
+        return {
+            'date': self.plan['date'],
+            'day': self.plan['day'],
+            'built_at': self.plan['built_at'],
+            'fingerprint': self.plan['fingerprint'],
+            'model_fingerprint': self.plan['model_fingerprint'],
+            'customers': len(self.plan['predictions']),
+            'routes': len(self.plan['routes']),
+            'current': self.is_current(),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+
+if __name__ == "__main__":
+    from delivery_predictor import DeliveryPredictor
+
+    parser = argparse.ArgumentParser(description="Precompute a day's predictions and routes")
+    parser.add_argument('--date', default=None, help='Date to plan for, YYYY-MM-DD (default: tomorrow)')
+    parser.add_argument('--output', default=os.environ.get('DAY_PLAN_PATH', DEFAULT_PLAN_PATH), help='Where to write the plan')
+    args = parser.parse_args()
+
+    plan_date = datetime.strptime(args.date, '%Y-%m-%d').date() if args.date else None
+    # Plan the persisted orders; the default constructor would replace them with generated ones
+    plan = build_day_plan(DeliveryPredictor(generate_orders=False), plan_date)
+    save_day_plan(plan, args.output)
+    print(f"Planned {plan['day']} {plan['date']}: {len(plan['predictions'])} customers, "
+          f"{len(plan['routes'])} routes (fingerprint {plan['fingerprint']}) -> {args.output}")
@@ -0,0 +1,246 @@
+import heapq
+import threading
+from datetime import datetime
+
+# Used when the model has no history for a customer at the current hour
+DEFAULT_FAILURE_RISK = 0.5
+
+# Minutes of driving that one unit of failure risk (0..1) is worth when ranking stops
+DEFAULT_RISK_WEIGHT = 30.0
+
+
+def slot_label(hour):
+    """Time slot label used by the dataset for an hour of the day (14 -> '2 PM')"""
+    return f"{hour % 12 or 12} {'AM' if hour < 12 else 'PM'}"
+
+
+class Shift:
+    """
+    Live state of one courier's shift
+
+    Remaining stops are kept in one min-heap per area keyed by the
+    customer's failure risk at the current hour. Travel time from the
+    courier's position only depends on the destination area, so the best
+    next stop is the cheapest (travel to area + weighted heap top) over the
+    handful of areas: O(areas + log n) per query instead of re-ranking every
+    stop. Completed stops are dropped lazily when they reach a heap top, and
+    the heaps are rebuilt only when the hour (and with it every risk) changes.
+    """
+
+    def __init__(self, courier_id, day, location, location_area):
+        self.courier_id = courier_id
+        self.day = day
+        self.location = location
+        self.location_area = location_area
+        self.stops = {}          # name -> stop dict (area, address, order_ids)
+        self.heaps = {}          # area -> [(risk, name)]
+        self.heap_hour = None
+        self.completed = []
+        self.started_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+class Dispatcher:
+    """
+    Answers "where next?" for active shifts without re-solving the route
+
+    Parameters:
+    - predictor: DeliveryPredictor supplying orders, travel times and model tables
+    - risk_weight: Minutes of driving one unit of failure risk is worth
+    """
+
+    def __init__(self, predictor, risk_weight=DEFAULT_RISK_WEIGHT):
+        self.predictor = predictor
+        self.risk_weight = risk_weight
+        self.shifts = {}
+        self._lock = threading.Lock()
+        # (origin, area) -> minutes, shared by all shifts
+        self._travel_cache = {}
+
+    def start_shift(self, courier_id='default', orders=None, location=None):
+        """
+        Start (or restart) a shift from a set of pending orders
+
+        Parameters:
+        - courier_id: Courier identifier
+        - orders: Orders to deliver (defaults to today's pending orders)
+        - location: Starting address (defaults to the depot)
+
+        Returns:
+        - The shift state (see state())
+        """
+        if orders is None:
+            orders = self.predictor.get_todays_orders()
+        location = location or self.predictor.default_location
+        shift = Shift(courier_id, datetime.now().strftime('%A'), location, self._area_of(location))
+
+        for order in orders:
+            stop = shift.stops.setdefault(order['name'], {
+                'name': order['name'],
+                'area': order['area'],
+                'address': order['address'],
+                'order_ids': []
+            })
+            stop['order_ids'].append(order['order_id'])
+
+        with self._lock:
+            self._rebuild_heaps(shift, datetime.now().hour)
+            self.shifts[courier_id] = shift
+        return self.state(courier_id)
+
+    def next_stops(self, courier_id='default', k=1, now=None):
+        """
+        Best next stops for a courier
+
+        Returns:
+        - List of up to k candidates with name, area, address, order_ids,
+          travel_minutes, failure_risk and score (lower is better)
+        """
+        now = now or datetime.now()
+        with self._lock:
+            shift = self.shifts.get(courier_id)
+            if shift is None:
+                return []
+            if shift.heap_hour != now.hour:
+                self._rebuild_heaps(shift, now.hour)
+
+            candidates = []
+            for area, heap in shift.heaps.items():
+                # Drop completed stops lazily from the top of each heap
+                while heap and heap[0][1] not in shift.stops:
+                    heapq.heappop(heap)
+                if not heap:
+                    continue
+                travel = self._travel_minutes(shift.location, area)
+                for risk, name in heapq.nsmallest(k, heap) if k > 1 else heap[:1]:
+                    if name in shift.stops:
+                        candidates.append((travel + self.risk_weight * risk, travel, risk, name))
+
+            candidates.sort()
+            return [
+                dict(shift.stops[name], travel_minutes=travel, failure_risk=round(risk, 3), score=round(score, 2))
+                for score, travel, risk, name in candidates[:k]
+            ]
+
+    def order_completed(self, order):
+        """
+        Record a delivered (or attempted) order; called from mark_delivered
+
+        The courier is moved to the customer's address, and the stop leaves
+        the queue once all of its orders are done.
+
+        Returns:
+        - Courier id of the shift that held the order, or None
+        """
+        with self._lock:
+            for shift in self.shifts.values():
+                stop = shift.stops.get(order['name'])
+                if stop is None or order['order_id'] not in stop['order_ids']:
+                    continue
+                stop['order_ids'].remove(order['order_id'])
+                shift.location = stop['address']
+                shift.location_area = stop['area']
+                if not stop['order_ids']:
+                    del shift.stops[order['name']]
+                    shift.completed.append(order['name'])
+                return shift.courier_id
+        return None
+
+    def add_orders(self, courier_id, orders):
+        """
+        Add orders to an active shift (e.g. redeliveries rescheduled for later today)
+
+        New stops are pushed onto their area's heap with their risk at the
+        heap's hour; nothing else is re-ranked. A customer coming back after
+        completion has their area's heap cleared of stale entries first, so
+        they are never queued twice.
+
+        Returns:
+        - Number of orders added
+        """
+        with self._lock:
+            shift = self.shifts.get(courier_id)
+            if shift is None:
+                return 0
+            for order in orders:
+                stop = shift.stops.get(order['name'])
+                if stop is None:
+                    stop = shift.stops[order['name']] = {
+                        'name': order['name'],
+                        'area': order['area'],
+                        'address': order['address'],
+                        'order_ids': []
+                    }
+                    heap = shift.heaps.setdefault(order['area'], [])
+                    if order['name'] in shift.completed:
+                        shift.completed.remove(order['name'])
+                        # The entry from the earlier visit may still be in the heap; drop it and other stale ones
+                        heap[:] = [entry for entry in heap if entry[1] in shift.stops and entry[1] != order['name']]
+                        heapq.heapify(heap)
+                    heapq.heappush(heap, (self._risk(shift.day, shift.heap_hour, order['name']), order['name']))
+                if order['order_id'] not in stop['order_ids']:
+                    stop['order_ids'].append(order['order_id'])
+            return len(orders)
+
+    def update_location(self, courier_id, location, area=None):
+        """Move a courier to an address (area is looked up when not given)"""
+        with self._lock:
+            shift = self.shifts.get(courier_id)
+            if shift is None:
+                return False
+            shift.location = location
+            shift.location_area = area or self._area_of(location)
+            return True
+
+    def end_shift(self, courier_id='default'):
+        """Forget a courier's shift"""
+        with self._lock:
+            return self.shifts.pop(courier_id, None) is not None
+
+    def state(self, courier_id='default'):
+        """Summary of a shift, or None if the courier has no active shift"""
+        with self._lock:
+            shift = self.shifts.get(courier_id)
+            if shift is None:
+                return None
+            return {
+                'courier_id': shift.courier_id,
+                'day': shift.day,
+                'started_at': shift.started_at,
+                'location': shift.location,
+                'location_area': shift.location_area,
+                'remaining': len(shift.stops),
+                'remaining_orders': sum(len(stop['order_ids']) for stop in shift.stops.values()),
+                'completed': list(shift.completed)
+            }
+
+    def _rebuild_heaps(self, shift, hour):
+        """Re-key every remaining stop by its failure risk at this hour (caller holds the lock)"""
+        heaps = {}
+        for name, stop in shift.stops.items():
+            heaps.setdefault(stop['area'], []).append((self._risk(shift.day, hour, name), name))
+        for heap in heaps.values():
+            heapq.heapify(heap)
+        shift.heaps = heaps
+        shift.heap_hour = hour
+
+    def _risk(self, day, hour, name):
+        """Failure risk of a customer at a day and hour"""
+        tables = self.predictor.model_tables
+        rate = tables.success_model.probability(name, day, slot_label(hour), area=self.predictor.customer_areas.get(name))
+        return 1 - rate if rate is not None else DEFAULT_FAILURE_RISK
+
+    def _travel_minutes(self, origin, area):
+        """Travel time from an address to an area, cached (caller holds the lock)"""
+        key = (origin, area)
+        minutes = self._travel_cache.get(key)
+        if minutes is None:
+            names = self.predictor.customer_registry.names_in_area(area, limit=1)
+            destination = self.predictor.customer_addresses.get(names[0]) if names else area
+            minutes = self.predictor.get_driving_distance(origin, destination, destination_area=area)['duration']
+            self._travel_cache[key] = minutes
+        return minutes
+
+    def _area_of(self, location):
+        if location == self.predictor.default_location:
+            return 'Satellite'
+        return self.predictor.customer_registry.area_for_address(location)
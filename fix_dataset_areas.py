@@ -1,18 +1,8 @@
 import pandas as pd
+from customer_registry import open_registry
 
-# Define the correct area for each customer
-customer_areas = {
-    'Aditya': 'Satellite',
-    'Vivaan': 'Bopal',
-    'Aarav': 'Vastrapur',
-    'Meera': 'Paldi',
-    'Diya': 'Thaltej',
-    'Riya': 'Navrangpura',
-    'Ananya': 'Bodakdev',
-    'Aryan': 'Gota',
-    'Ishaan': 'Maninagar',
-    'Kabir': 'Chandkheda'
-}
+# Look up each customer's area in the customer registry
+customer_areas = open_registry().areas_view()
 
 # Load the dataset
 try:
@@ -0,0 +1,388 @@
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+USER_AGENT = 'DeliveryPredictionSystem/1.0'
+
+# Area centres used as fallback coordinates for registry addresses (same points as the dashboard map)
+AREA_COORDINATES = {
+    'Satellite': (23.030357, 72.517845),
+    'Bopal': (23.032011, 72.467816),
+    'Vastrapur': (23.0362554310379, 72.5305526298169),
+    'Paldi': (23.013054, 72.562515),
+    'Thaltej': (23.049736, 72.511726),
+    'Navrangpura': (23.036406, 72.561066),
+    'Bodakdev': (23.0394524, 72.512492),
+    'Gota': (23.104, 72.5399),
+    'Maninagar': (22.99617, 72.599586),
+    'Chandkheda': (23.11842, 72.586777)
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS geocodes (
+    address_key TEXT PRIMARY KEY,
+    address TEXT NOT NULL,
+    found INTEGER NOT NULL,
+    lat REAL,
+    lon REAL,
+    display_name TEXT,
+    source TEXT NOT NULL,
+    expires_at REAL
+);
+"""
+
+# Number of entries kept in the in-process front cache
+MEMORY_CACHE_SIZE = 10000
+
+# Source of the area-centre fallbacks seeded for registry addresses
+CENTROID_SOURCE = 'area_centroid'
+
+
+def normalize_address(address):
+    """Cache key for an address: lower case, punctuation and repeated whitespace removed"""
+    return ' '.join(re.sub(r'[^\w]+', ' ', address.lower()).split())
+
+
+class GeocodeError(Exception):
+    """Upstream geocoding failure (never cached)"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class GeocodeCache:
+    """
+    Persistent geocode results keyed by normalized address
+
+    Entries live in SQLite with a small in-process LRU in front, so repeat
+    lookups never leave the process. Upstream results expire after
+    `ttl_seconds`; "not found" answers are cached too (negative caching) for
+    the shorter `negative_ttl_seconds`. Gazetteer entries (fixed, exact
+    locations) never expire.
+
+    Registry addresses without a real geocode are seeded at their area's
+    centre as `area_centroid` entries. These expire after
+    `centroid_ttl_seconds`, so the next lookup asks the upstream and the real
+    result replaces them. An expired centroid is kept as a fallback: it is
+    still used for the spatial index, and for lookups while the upstream
+    fails or does not know the address.
+
+    Parameters:
+    - db_path: SQLite database file
+    - ttl_seconds: Lifetime of upstream results
+    - negative_ttl_seconds: Lifetime of cached "not found" answers
+    - centroid_ttl_seconds: Lifetime of area-centre seeds before a real geocode is tried
+    """
+
+    def __init__(self, db_path='geocode_cache.db', ttl_seconds=30 * 86400, negative_ttl_seconds=86400,
+                 centroid_ttl_seconds=86400):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.centroid_ttl_seconds = centroid_ttl_seconds
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self.stats = {'hits': 0, 'negative_hits': 0, 'misses': 0}
+
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def lookup(self, address):
+        """
+        Look up an address
+
+        Returns:
+        - (hit, entry): hit is False on a miss or expired entry; entry is the
+          result dict, or None for a cached "not found"
+        """
+        key = normalize_address(address)
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+
+        if cached is None:
+            row = self._connection().execute(
+                'SELECT found, lat, lon, display_name, source, expires_at FROM geocodes WHERE address_key = ?', (key,)
+            ).fetchone()
+            if row is not None:
+                found, lat, lon, display_name, source, expires_at = row
+                entry = {'lat': lat, 'lon': lon, 'display_name': display_name, 'source': source} if found else None
+                cached = (entry, expires_at)
+                self._remember(key, cached)
+
+        if cached is None or (cached[1] is not None and cached[1] <= now):
+            with self._lock:
+                self.stats['misses'] += 1
+            return False, None
+
+        with self._lock:
+            self.stats['hits' if cached[0] is not None else 'negative_hits'] += 1
+        return True, cached[0]
+
+    def store(self, address, entry, source='nominatim'):
+        """Cache an upstream result (entry dict with lat, lon, display_name) or a "not found" (None)"""
+        ttl = self.ttl_seconds if entry is not None else self.negative_ttl_seconds
+        self.store_many([(address, entry)], source, expires_at=time.time() + ttl)
+
+    def store_many(self, items, source, expires_at=None):
+        """Cache (address, entry) pairs in one transaction; expires_at None means they never expire"""
+        rows = []
+        for address, entry in items:
+            key = normalize_address(address)
+            if entry is None:
+                rows.append((key, address, 0, None, None, None, source, expires_at))
+            else:
+                rows.append((key, address, 1, entry['lat'], entry['lon'], entry.get('display_name'), source, expires_at))
+
+        conn = self._connection()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+        with self._lock:
+            for row in rows:
+                self._memory.pop(row[0], None)
+
+    def seed_from_registry(self, registry, coordinates=AREA_COORDINATES, extra=None):
+        """
+        Pre-seed registry addresses that are not cached yet
+
+        Each customer address is placed at its area's coordinates as a
+        short-lived `area_centroid` entry that a real geocode replaces.
+        `extra` is an optional {address: (lat, lon)} map of exact fixed
+        locations, stored as gazetteer entries that never expire.
+
+        Returns:
+        - Number of entries added
+        """
+        # Centroids seeded as permanent gazetteer entries by older versions are re-seeded as fallbacks
+        centroids = set(coordinates.values())
+        known = {
+            key for key, source, lat, lon in self._connection().execute('SELECT address_key, source, lat, lon FROM geocodes')
+            if not (source == 'gazetteer' and (lat, lon) in centroids)
+        }
+        seeds = []
+        for name, address in registry.addresses_view().items():
+            if not address or normalize_address(address) in known:
+                continue
+            point = coordinates.get(registry.area_of(name))
+            if point is not None:
+                seeds.append((address, {'lat': point[0], 'lon': point[1], 'display_name': address}))
+                known.add(normalize_address(address))
+        fixed = []
+        for address, point in (extra or {}).items():
+            if normalize_address(address) not in known:
+                fixed.append((address, {'lat': point[0], 'lon': point[1], 'display_name': address}))
+
+        if seeds:
+            self.store_many(seeds, CENTROID_SOURCE, expires_at=time.time() + self.centroid_ttl_seconds)
+        if fixed:
+            self.store_many(fixed, 'gazetteer')
+        return len(seeds) + len(fixed)
+
+    def fallback(self, address):
+        """The area-centre entry for an address (expired or not), or None"""
+        row = self._connection().execute(
+            'SELECT lat, lon, display_name FROM geocodes WHERE address_key = ? AND source = ?',
+            (normalize_address(address), CENTROID_SOURCE)
+        ).fetchone()
+        if row is None:
+            return None
+        return {'lat': row[0], 'lon': row[1], 'display_name': row[2], 'source': CENTROID_SOURCE}
+
+    def locations(self):
+        """All cached coordinates (with expired area-centre fallbacks) as {normalized address: (lat, lon)}, in one query"""
+        rows = self._connection().execute(
+            'SELECT address_key, lat, lon FROM geocodes WHERE found = 1 AND (expires_at IS NULL OR expires_at > ? OR source = ?)',
+            (time.time(), CENTROID_SOURCE)
+        )
+        return {key: (lat, lon) for key, lat, lon in rows}
+
+    def purge_expired(self):
+        """Delete expired entries (area-centre fallbacks are kept). Returns the number removed."""
+        conn = self._connection()
+        with conn:
+            removed = conn.execute(
+                'DELETE FROM geocodes WHERE expires_at IS NOT NULL AND expires_at <= ? AND source != ?',
+                (time.time(), CENTROID_SOURCE)
+            ).rowcount
+        with self._lock:
+            self._memory.clear()
+        return removed
+
+    def _remember(self, key, cached):
+        with self._lock:
+            self._memory[key] = cached
+            self._memory.move_to_end(key)
+            if len(self._memory) > MEMORY_CACHE_SIZE:
+                self._memory.popitem(last=False)
+
+
+class RateLimiter:
+    """
+    Spaces out upstream calls to at most `rate_per_second`, shared by all threads
+
+    Parameters:
+    - rate_per_second: Maximum request rate (Nominatim's usage policy allows 1/s)
+    """
+
+    def __init__(self, rate_per_second=1.0):
+        self.interval = 1.0 / rate_per_second if rate_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """Block until the caller may send its request"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def back_off(self, seconds):
+        """Push every later request back after the upstream asked us to slow down"""
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+
+class Geocoder:
+    """
+    Geocodes addresses through the cache, calling Nominatim only on a miss
+
+    Parameters:
+    - cache: GeocodeCache
+    - http: Session used for upstream calls (live, recording or replaying)
+    - timeout: Upstream request timeout in seconds
+    - rate_limiter: RateLimiter shared by all upstream calls
+    - retries: Retries after an HTTP 429 from the upstream
+    - back_off_seconds: Pause applied to the rate limiter after a 429
+    """
+
+    def __init__(self, cache, http, timeout=10, rate_limiter=None, retries=2, back_off_seconds=5):
+        self.cache = cache
+        self.http = http
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.retries = retries
+        self.back_off_seconds = back_off_seconds
+
+    def geocode(self, address):
+        """
+        Resolve an address to coordinates
+
+        Returns:
+        - Dictionary with lat, lon, display_name and source, or None if the address was not found
+
+        Upstream errors are raised and not cached.
+        """
+        hit, entry = self.cache.lookup(address)
+        if hit:
+            return entry
+        return self._resolve(address)
+
+    def geocode_many(self, addresses, workers=4):
+        """
+        Geocode a batch of addresses, yielding results as they become available
+
+        Addresses are deduplicated by their normalized form. Cache hits are
+        yielded first, then misses are resolved concurrently by `workers`
+        threads under the shared rate limit and yielded as they complete.
+
+        Yields:
+        - (address, indexes, entry, error): indexes are the positions of every
+          input that normalized to this address; entry is None when the
+          address was not found or the lookup failed (error is then set)
+        """
+        unique = OrderedDict()
+        for index, address in enumerate(addresses):
+            key = normalize_address(address)
+            if key in unique:
+                unique[key][1].append(index)
+            else:
+                unique[key] = (address, [index])
+
+        misses = []
+        for address, indexes in unique.values():
+            hit, entry = self.cache.lookup(address)
+            if hit:
+                yield address, indexes, entry, None
+            else:
+                misses.append((address, indexes))
+
+        if not misses:
+            return
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        try:
+            futures = {pool.submit(self._resolve, address): (address, indexes) for address, indexes in misses}
+            for future in as_completed(futures):
+                address, indexes = futures[future]
+                try:
+                    yield address, indexes, future.result(), None
+                except Exception as e:
+                    yield address, indexes, None, str(e)
+        finally:
+            # Stop queued lookups if the consumer goes away (e.g. the client disconnects)
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _resolve(self, address):
+        """Fetch a cache miss upstream under the rate limit and cache the answer"""
+        for attempt in range(self.retries + 1):
+            self.rate_limiter.wait()
+            try:
+                entry = self.fetch(address)
+                break
+            except (GeocodeError, requests.exceptions.RequestException) as e:
+                if isinstance(e, GeocodeError) and e.status_code == 429 and attempt < self.retries:
+                    self.rate_limiter.back_off(self.back_off_seconds)
+                    continue
+                # Keep serving the area centre while the upstream fails or is unreachable
+                fallback = self.cache.fallback(address)
+                if fallback is None:
+                    raise
+                return fallback
+
+        if entry is None:
+            # Unknown upstream: keep the area centre and try again after another centroid TTL
+            fallback = self.cache.fallback(address)
+            if fallback is not None:
+                self.cache.store_many([(address, fallback)], CENTROID_SOURCE, expires_at=time.time() + self.cache.centroid_ttl_seconds)
+                return fallback
+
+        self.cache.store(address, entry)
+        return dict(entry, source='nominatim') if entry is not None else None
+
+    def fetch(self, address):
+        """Query Nominatim directly. Returns the result dict or None if not found."""
+        response = self.http.get(
+            NOMINATIM_URL,
+            params={'format': 'json', 'q': address, 'limit': 1},
+            headers={'User-Agent': USER_AGENT},
+            timeout=self.timeout
+        )
+        if response.status_code >= 400:
+            raise GeocodeError(f"Nominatim returned HTTP {response.status_code}", response.status_code)
+        data = response.json()
+        if not data:
+            return None
+        result = data[0]
+        return {'lat': float(result['lat']), 'lon': float(result['lon']), 'display_name': result['display_name']}
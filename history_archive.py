@@ -0,0 +1,262 @@
+import argparse
+import csv
+import json
+import os
+import re
+import threading
+from datetime import datetime, date
+
+import pandas as pd
+
+HISTORY_COLUMNS = ['Name', 'Day of Delivery Attempt', 'Time', 'Area', 'Package Size', 'Delivery Status']
+
+# Legacy rows (e.g. the original dataset.csv) carry no attempt date
+UNDATED = 'undated'
+
+
+def _slug(value):
+    """Make a value safe to use in a partition directory or file name"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', str(value)) or '_'
+
+
+def _to_date(value):
+    if value is None or isinstance(value, date):
+        return value
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class DeliveryHistoryArchive:
+    """
+    Delivery history partitioned by attempt date (and area), with a manifest
+
+    Raw attempts live in `raw/date=YYYY-MM-DD/area=<Area>.csv`. The manifest
+    lists every partition with its date and area so queries only open the
+    files inside the requested window. Old raw partitions can be compacted
+    into monthly summary count tables (`summary/month=YYYY-MM.csv`), which
+    keep one row per distinct attempt with a `Count` column.
+
+    Parameters:
+    - root: Directory holding the archive
+    - partition_by_area: Also split each day into one file per area
+    """
+
+    def __init__(self, root='history', partition_by_area=True):
+        self.root = root
+        self.partition_by_area = partition_by_area
+        self.manifest_path = os.path.join(root, 'manifest.json')
+        self._lock = threading.Lock()
+        self.manifest = {'partitions': {}, 'summaries': {}}
+
+        os.makedirs(root, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+
+    def is_empty(self):
+        """Whether the archive has no partitions yet"""
+        return not self.manifest['partitions'] and not self.manifest['summaries']
+
+    def append(self, entry, attempt_date=None):
+        """Append one attempt (a dataset.csv style row) to its partition"""
+        self.append_many([entry], attempt_date)
+
+    def append_many(self, entries, attempt_date=None):
+        """
+        Append attempts, grouping them into one write per partition
+
+        Parameters:
+        - entries: Rows with the dataset.csv columns
+        - attempt_date: Date of the attempts (defaults to today); use UNDATED for legacy rows
+        """
+        if attempt_date is None:
+            attempt_date = date.today()
+        date_key = UNDATED if attempt_date == UNDATED else _to_date(attempt_date).isoformat()
+
+        by_partition = {}
+        for entry in entries:
+            area = entry.get('Area') if self.partition_by_area else None
+            by_partition.setdefault(area, []).append(entry)
+
+        with self._lock:
+            manifest_changed = False
+            for area, rows in by_partition.items():
+                relative = self._partition_path(date_key, area)
+                path = os.path.join(self.root, relative)
+                is_new = not os.path.exists(path)
+                if is_new:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+                with open(path, 'a', newline='') as f:
+                    writer = csv.writer(f)
+                    if is_new:
+                        writer.writerow(HISTORY_COLUMNS)
+                    writer.writerows([[row.get(column) for column in HISTORY_COLUMNS] for row in rows])
+
+                if relative not in self.manifest['partitions']:
+                    self.manifest['partitions'][relative] = {
+                        'date': None if date_key == UNDATED else date_key,
+                        'area': area
+                    }
+                    manifest_changed = True
+
+            # The manifest only changes when a partition is created, not on every append
+            if manifest_changed:
+                self._write_manifest()
+
+    def load(self, start_date=None, end_date=None, areas=None, include_summaries=True, include_undated=None):
+        """
+        Load attempts for a date range and set of areas, opening only matching partitions
+
+        Parameters:
+        - start_date, end_date: Inclusive date bounds (date or 'YYYY-MM-DD'); None means unbounded
+        - areas: Iterable of area names to keep (None for all)
+        - include_summaries: Include compacted monthly count tables overlapping the range
+        - include_undated: Include legacy rows without a date (default: only when start_date is None)
+
+        Returns:
+        - DataFrame with the dataset.csv columns plus `Date` and `Count`
+        """
+        start_date = _to_date(start_date)
+        end_date = _to_date(end_date)
+        areas = set(areas) if areas else None
+        if include_undated is None:
+            include_undated = start_date is None
+
+        with self._lock:
+            partitions = dict(self.manifest['partitions'])
+            summaries = dict(self.manifest['summaries'])
+
+        frames = []
+        for relative, info in partitions.items():
+            if not self._partition_matches(info, start_date, end_date, areas, include_undated):
+                continue
+            frame = pd.read_csv(os.path.join(self.root, relative))
+            if areas is not None and not self.partition_by_area:
+                frame = frame[frame['Area'].isin(areas)]
+            frame['Date'] = info['date']
+            frame['Count'] = 1
+            frames.append(frame)
+
+        if include_summaries:
+            for relative, info in summaries.items():
+                if start_date and info['end'] < start_date.isoformat():
+                    continue
+                if end_date and info['start'] > end_date.isoformat():
+                    continue
+                frame = pd.read_csv(os.path.join(self.root, relative))
+                if areas is not None:
+                    frame = frame[frame['Area'].isin(areas)]
+                frame['Date'] = info['month']
+                frames.append(frame)
+
+        if not frames:
+            return pd.DataFrame(columns=HISTORY_COLUMNS + ['Date', 'Count'])
+        return pd.concat(frames, ignore_index=True)
+
+    def compact(self, before_date):
+        """
+        Fold raw partitions older than before_date into monthly summary count tables
+
+        Returns:
+        - Number of raw partitions compacted
+        """
+        cutoff = _to_date(before_date).isoformat()
+
+        with self._lock:
+            by_month = {}
+            for relative, info in self.manifest['partitions'].items():
+                if info['date'] is not None and info['date'] < cutoff:
+                    by_month.setdefault(info['date'][:7], []).append((relative, info))
+
+            group_columns = HISTORY_COLUMNS
+            for month, parts in by_month.items():
+                frames = [pd.read_csv(os.path.join(self.root, relative)).assign(Count=1) for relative, _ in parts]
+
+                summary_relative = os.path.join('summary', f"month={month}.csv")
+                summary_path = os.path.join(self.root, summary_relative)
+                summary = self.manifest['summaries'].get(summary_relative)
+                if summary is not None:
+                    frames.append(pd.read_csv(summary_path))
+
+                combined = pd.concat(frames, ignore_index=True)
+                # Keep attempts with missing fields (e.g. no package size) instead of dropping their counts
+                counts = combined.groupby(group_columns, as_index=False, dropna=False)['Count'].sum()
+
+                dates = [info['date'] for _, info in parts]
+                if summary is not None:
+                    dates += [summary['start'], summary['end']]
+
+                os.makedirs(os.path.dirname(summary_path), exist_ok=True)
+                tmp_path = f"{summary_path}.tmp"
+                counts.to_csv(tmp_path, index=False)
+                os.replace(tmp_path, summary_path)
+
+                self.manifest['summaries'][summary_relative] = {
+                    'month': month,
+                    'start': min(dates),
+                    'end': max(dates),
+                    'rows': int(len(counts)),
+                    'attempts': int(counts['Count'].sum())
+                }
+                for relative, _ in parts:
+                    del self.manifest['partitions'][relative]
+
+            # Persist the manifest before deleting files so a crash never points at missing data
+            self._write_manifest()
+            compacted = 0
+            for parts in by_month.values():
+                for relative, _ in parts:
+                    os.remove(os.path.join(self.root, relative))
+                    compacted += 1
+                    try:
+                        os.rmdir(os.path.dirname(os.path.join(self.root, relative)))
+                    except OSError:
+                        pass
+
+        return compacted
+
+    def migrate_from_csv(self, dataset_path='dataset.csv'):
+        """Import a flat dataset.csv as undated legacy partitions. Returns the number of rows imported."""
+        if not os.path.exists(dataset_path):
+            return 0
+        rows = pd.read_csv(dataset_path).to_dict('records')
+        self.append_many(rows, UNDATED)
+        return len(rows)
+
+    def _partition_path(self, date_key, area):
+        date_part = UNDATED if date_key == UNDATED else f"date={date_key}"
+        file_name = f"area={_slug(area)}.csv" if area is not None else 'attempts.csv'
+        return os.path.join('raw', date_part, file_name)
+
+    def _partition_matches(self, info, start_date, end_date, areas, include_undated):
+        if info['date'] is None:
+            if not include_undated:
+                return False
+        else:
+            if start_date and info['date'] < start_date.isoformat():
+                return False
+            if end_date and info['date'] > end_date.isoformat():
+                return False
+        if areas is not None and self.partition_by_area and info['area'] not in areas:
+            return False
+        return True
+
+    def _write_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Manage the partitioned delivery history archive')
+    parser.add_argument('--root', default='history', help='Archive directory')
+    parser.add_argument('--import-csv', metavar='PATH', help='Import a flat dataset.csv as undated history')
+    parser.add_argument('--compact-before', metavar='YYYY-MM-DD', help='Compact raw partitions older than this date')
+    args = parser.parse_args()
+
+    archive = DeliveryHistoryArchive(args.root)
+    if args.import_csv:
+        print(f"Imported {archive.migrate_from_csv(args.import_csv)} rows from {args.import_csv}")
+    if args.compact_before:
+        print(f"Compacted {archive.compact(args.compact_before)} partitions")
@@ -0,0 +1,373 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from route_solver import route_cost, solve_open_route
+
+# Used when the model has no history for a customer
+DEFAULT_SUCCESS_RATE = 0.5
+
+
+def horizon_days(num_days=3, start=None):
+    """Day names for the planning horizon, starting at `start` (default today)"""
+    start = start or datetime.now()
+    return [(start + timedelta(days=offset)).strftime('%A') for offset in range(num_days)]
+
+
+def success_table(tables, names, days, slots, area_of=None):
+    """
+    Success probability per customer, day and slot from published ModelTables
+
+    Reads the compiled success model (parcel size unknown), the same scores
+    predict_optimal_times ranks by. Customers without history use their
+    area's row when `area_of` is given; anything still unknown gets
+    DEFAULT_SUCCESS_RATE.
+
+    Returns:
+    - Array of shape (len(names), len(days), len(slots))
+    """
+    table = tables.success_model.grid(names, days, slots, area_of).astype(float)
+    table[np.isnan(table)] = DEFAULT_SUCCESS_RATE
+    return table
+
+
+def _nearest_tour_cost(matrix, stops):
+    """Cheap route estimate for comparing restarts: nearest-neighbour tour from the depot"""
+    if not stops:
+        return 0.0
+    remaining = set(stops)
+    current = 0
+    total = 0.0
+    while remaining:
+        nxt = min(remaining, key=lambda s: matrix[current, s])
+        total += matrix[current, nxt]
+        remaining.discard(nxt)
+        current = nxt
+    return total
+
+
+def assign_orders(problem, seed=0, passes=2):
+    """
+    Assign orders to (day, slot) pairs for one restart (runs in a worker process)
+
+    Each order goes where its success probability minus `route_weight` times
+    the extra driving it causes is highest. Extra driving is the travel time
+    from the customer to the nearest stop already planned that day (or the
+    depot), and is zero when the customer already has a stop that day, so
+    parcels for the same customer are consolidated. Orders are placed in
+    order of regret (how much they lose if they miss their best day), then
+    improved by re-inserting each order in turn.
+
+    Parameters:
+    - problem: Dictionary with `success` (orders x days x slots, -inf where a
+      slot is unavailable), `customer`
+      (matrix index per order, 1-based), `fixed_day` (day index or -1 per
+      order), `matrix`, `stops_per_day`, `slot_capacity` and `route_weight`
+    - seed: Tie-break seed for this restart
+
+    Returns:
+    - Dictionary with `days` and `slots` per order (-1 if unassigned) and the `objective`
+    """
+    success = problem['success']
+    customer = problem['customer']
+    fixed_day = problem['fixed_day']
+    matrix = problem['matrix']
+    n_orders, n_days, n_slots = success.shape
+    weight = problem['route_weight']
+    rng = random.Random(seed)
+
+    day_of = np.full(n_orders, -1)
+    slot_of = np.full(n_orders, -1)
+    # Per day: customer -> (slot, number of orders), and distance from each point to the nearest stop
+    stops = [dict() for _ in range(n_days)]
+    slot_load = np.zeros((n_days, n_slots), dtype=int)
+    nearest = np.tile(matrix[0], (n_days, 1))
+
+    def recompute_nearest(d):
+        nearest[d] = matrix[0]
+        for c in stops[d]:
+            np.minimum(nearest[d], matrix[c], out=nearest[d])
+
+    def options(o):
+        c = customer[o]
+        days = [fixed_day[o]] if fixed_day[o] >= 0 else range(n_days)
+        for d in days:
+            if c in stops[d]:
+                slot = stops[d][c][0]
+                yield success[o, d, slot], d, slot
+            elif len(stops[d]) < problem['stops_per_day']:
+                open_slots = np.flatnonzero((slot_load[d] < problem['slot_capacity']) & np.isfinite(success[o, d]))
+                if len(open_slots):
+                    slot = int(open_slots[np.argmax(success[o, d, open_slots])])
+                    yield success[o, d, slot] - weight * nearest[d, c], d, slot
+
+    def place(o, d, slot):
+        c = customer[o]
+        if c in stops[d]:
+            stops[d][c] = (slot, stops[d][c][1] + 1)
+        else:
+            stops[d][c] = (slot, 1)
+            slot_load[d, slot] += 1
+            np.minimum(nearest[d], matrix[c], out=nearest[d])
+        day_of[o] = d
+        slot_of[o] = slot
+
+    def unplace(o):
+        c, d = customer[o], day_of[o]
+        slot, count = stops[d][c]
+        if count > 1:
+            stops[d][c] = (slot, count - 1)
+        else:
+            del stops[d][c]
+            slot_load[d, slot] -= 1
+            recompute_nearest(d)
+        day_of[o] = -1
+        slot_of[o] = -1
+
+    # Regret from success probabilities alone decides the placement order (unavailable slots count as 0)
+    best_per_day = np.where(np.isfinite(success), success, 0).max(axis=2)
+    ranked = np.sort(best_per_day, axis=1)
+    regret = ranked[:, -1] - (ranked[:, -2] if n_days > 1 else 0)
+    order = sorted(range(n_orders), key=lambda o: (-regret[o], rng.random()))
+
+    for o in order:
+        choices = list(options(o))
+        if choices:
+            _, d, slot = max(choices, key=lambda option: option[0])
+            place(o, d, slot)
+
+    for _ in range(passes):
+        moved = False
+        order = list(range(n_orders))
+        rng.shuffle(order)
+        for o in order:
+            if day_of[o] < 0:
+                continue
+            previous = (day_of[o], slot_of[o])
+            unplace(o)
+            _, d, slot = max(options(o), key=lambda option: option[0])
+            place(o, d, slot)
+            moved = moved or (d, slot) != previous
+        if not moved:
+            break
+
+    assigned = day_of >= 0
+    expected = float(success[np.flatnonzero(assigned), day_of[assigned], slot_of[assigned]].sum())
+    driving = sum(_nearest_tour_cost(matrix, list(stops[d])) for d in range(n_days))
+    return {'days': day_of, 'slots': slot_of, 'objective': expected - weight * driving}
+
+
+def _solve_day(args):
+    """Route for one day's stops (runs in a worker process)"""
+    matrix, stops = args
+    if not stops:
+        return [], 0.0
+    sub = matrix[np.ix_([0] + stops, [0] + stops)]
+    order = solve_open_route(sub)
+    return [stops[i - 1] for i in order], route_cost(sub, order)
+
+
+class HorizonPlanner:
+    """
+    Joint assignment of pending orders to days and time slots across the horizon
+
+    Builds a success-probability table from the predictor's model and a
+    travel-time matrix between customers, then runs several randomised
+    assignment restarts and the per-day route solves in a process pool. The
+    travel-time matrix is saved to `matrix_path` and reused by later runs as
+    long as it covers the customers being planned.
+
+    Parameters:
+    - predictor: DeliveryPredictor supplying orders, model tables and distances
+    - num_days: Length of the horizon, starting today
+    - stops_per_day: Maximum distinct customers visited per shift
+    - slot_capacity: Maximum customers per time slot
+    - route_weight: Expected deliveries traded for one minute of driving
+    - matrix_path: Cache file for the travel-time matrix
+    - workers: Worker processes (defaults to the CPU count)
+    """
+
+    def __init__(self, predictor, num_days=3, stops_per_day=40, slot_capacity=6, route_weight=0.01,
+                 matrix_path='horizon_matrix.npz', workers=None):
+        self.predictor = predictor
+        self.num_days = num_days
+        self.stops_per_day = stops_per_day
+        self.slot_capacity = slot_capacity
+        self.route_weight = route_weight
+        self.matrix_path = matrix_path
+        self.workers = workers
+
+    def travel_matrix(self, names):
+        """
+        Travel times in minutes between the depot (index 0) and customers (1..n)
+
+        Reuses the cached matrix when it already covers every name.
+        """
+        depot = self.predictor.default_location
+        if self.matrix_path and os.path.exists(self.matrix_path):
+            cached = np.load(self.matrix_path, allow_pickle=False)
+            cached_names = list(cached['names'])
+            if str(cached['depot']) == depot and set(names) <= set(cached_names):
+                position = {name: i + 1 for i, name in enumerate(cached_names)}
+                rows = [0] + [position[name] for name in names]
+                return cached['matrix'][np.ix_(rows, rows)]
+
+        addresses = [depot] + [self.predictor.customer_addresses.get(name) or name for name in names]
+        # Areas looked up once per customer instead of once per leg
+        areas = [None] + [self.predictor.customer_areas.get(name) for name in names]
+        # One many-to-many query when a road graph is loaded, otherwise pairwise lookups
+        legs = self.predictor._road_distances(addresses)
+        matrix = np.zeros((len(addresses), len(addresses)))
+        for a, origin in enumerate(addresses):
+            for b, destination in enumerate(addresses):
+                if a != b:
+                    leg = legs.get((origin, destination)) or self.predictor.get_driving_distance(origin, destination, areas[a], areas[b])
+                    matrix[a, b] = leg['duration']
+
+        if self.matrix_path:
+            tmp_path = f"{self.matrix_path}.tmp.npz"
+            np.savez(tmp_path, names=np.array(names), depot=np.array(depot), matrix=matrix)
+            os.replace(tmp_path, self.matrix_path)
+        return matrix
+
+    def plan(self, orders=None, restarts=4, start=None):
+        """
+        Plan the horizon
+
+        Parameters:
+        - orders: Orders to plan (defaults to all pending orders due within the horizon)
+        - restarts: Randomised assignment runs; the best one is kept
+        - start: First day of the horizon (datetime, defaults to now). When
+          it is today, slots that have already started are left out
+
+        Returns:
+        - JSON-serialisable plan with per-day orders, slots and routes
+        """
+        now = datetime.now()
+        start = start or now
+        days = horizon_days(self.num_days, start)
+        if orders is None:
+            orders = [o for o in self.predictor.get_pending_orders() if o['delivery_day'] in days]
+
+        tables = self.predictor.model_tables
+        names = sorted({o['name'] for o in orders})
+        slots = sorted({time for times in tables.rate_by_name_time.values() for time in times}, key=slot_hour)
+        customer_index = {name: i for i, name in enumerate(names)}
+
+        success_by_customer = success_table(tables, names, days, slots, self.predictor.customer_areas.get)
+        # Today's past slots are out, as in redelivery
+        if start.date() == now.date():
+            slot_hours = np.array([slot_hour(slot) for slot in slots])
+            success_by_customer[:, 0, slot_hours <= now.hour] = -np.inf
+        problem = {
+            'success': success_by_customer[[customer_index[o['name']] for o in orders]],
+            'customer': np.array([customer_index[o['name']] + 1 for o in orders], dtype=int),
+            # Orders flagged fixed_day keep their delivery day; everything else may move
+            'fixed_day': np.array([days.index(o['delivery_day']) if o.get('fixed_day') else -1 for o in orders], dtype=int),
+            'matrix': self.travel_matrix(names),
+            'stops_per_day': self.stops_per_day,
+            'slot_capacity': self.slot_capacity,
+            'route_weight': self.route_weight
+        }
+
+        if not orders:
+            return self._result(start, days, slots, names, orders, None, [[] for _ in days], [0.0 for _ in days])
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            runs = list(pool.map(assign_orders, [problem] * restarts, range(restarts)))
+            best = max(runs, key=lambda run: run['objective'])
+
+            day_stops = [sorted({int(problem['customer'][o]) for o in np.flatnonzero(best['days'] == d)}) for d in range(len(days))]
+            routes = list(pool.map(_solve_day, [(problem['matrix'], stops) for stops in day_stops]))
+
+        return self._result(start, days, slots, names, orders, best, [r[0] for r in routes], [r[1] for r in routes], problem['success'])
+
+    def _result(self, start, days, slots, names, orders, best, routes, minutes, success=None):
+        plan_days = {day: {'orders': [], 'route': [], 'route_minutes': 0.0} for day in days}
+        unassigned = []
+        expected = 0.0
+        for o, order in enumerate(orders):
+            if best is None or best['days'][o] < 0:
+                unassigned.append(order['order_id'])
+                continue
+            d, s = int(best['days'][o]), int(best['slots'][o])
+            probability = float(success[o, d, s])
+            expected += probability
+            plan_days[days[d]]['orders'].append({
+                'order_id': order['order_id'],
+                'name': order['name'],
+                'slot': slots[s],
+                'success_probability': round(probability, 3),
+                'moved_from': order['delivery_day'] if order['delivery_day'] != days[d] else None
+            })
+        for d, day in enumerate(days):
+            plan_days[day]['route'] = [names[stop - 1] for stop in routes[d]]
+            plan_days[day]['route_minutes'] = round(float(minutes[d]), 1)
+
+        return {
+            'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'start_date': start.strftime('%Y-%m-%d'),
+            'horizon': days,
+            'expected_deliveries': round(expected, 2),
+            'route_minutes': round(float(sum(minutes)), 1),
+            'days': plan_days,
+            'unassigned': unassigned,
+            'fingerprint': hashlib.sha1(json.dumps(sorted(o['order_id'] for o in orders)).encode()).hexdigest()
+        }
+
+
+def slot_hour(slot):
+    """Hour of the day (0-23) for slot labels like '9 AM' or '2 PM', used as a sort key"""
+    hour, period = slot.split()
+    return int(hour) % 12 + (12 if period == 'PM' else 0)
+
+
+if __name__ == "__main__":
+    from delivery_predictor import DeliveryPredictor
+
+    parser = argparse.ArgumentParser(description='Plan pending orders across the next few days')
+    parser.add_argument('--days', type=int, default=3, help='Horizon length in days')
+    parser.add_argument('--stops-per-day', type=int, default=40, help='Maximum customers per shift')
+    parser.add_argument('--slot-capacity', type=int, default=6, help='Maximum customers per time slot')
+    parser.add_argument('--route-weight', type=float, default=0.01, help='Deliveries traded per minute of driving')
+    parser.add_argument('--restarts', type=int, default=4, help='Randomised assignment runs')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes')
+    parser.add_argument('--matrix', default='horizon_matrix.npz', help='Travel-time matrix cache')
+    parser.add_argument('--output', default='horizon_plan.json', help='Where to write the plan')
+    parser.add_argument('--start', default=None, help='First day of the horizon, YYYY-MM-DD (default today)')
+    parser.add_argument('--apply', action='store_true', help='Move orders to their planned day and slot')
+    parser.add_argument('--server', default='http://localhost:5000', help='Running server that applies the plan')
+    args = parser.parse_args()
+    start = datetime.strptime(args.start, '%Y-%m-%d') if args.start else None
+
+    # Plan the persisted orders; the default constructor would replace them with generated ones
+    predictor = DeliveryPredictor(generate_orders=False)
+    planner = HorizonPlanner(predictor, num_days=args.days, stops_per_day=args.stops_per_day,
+                             slot_capacity=args.slot_capacity, route_weight=args.route_weight,
+                             matrix_path=args.matrix, workers=args.workers)
+    plan = planner.plan(restarts=args.restarts, start=start)
+
+    with open(args.output, 'w') as f:
+        json.dump(plan, f, indent=2)
+    print(f"Planned {sum(len(d['orders']) for d in plan['days'].values())} orders, "
+          f"{plan['expected_deliveries']} expected deliveries, {plan['route_minutes']} minutes of driving -> {args.output}")
+
+    if args.apply:
+        import requests
+
+        # The running server holds the orders in memory and never rereads the journal,
+        # so the plan is applied through it; only without a server is the store written here
+        try:
+            response = requests.post(f"{args.server}/api/horizon_plan/apply", json=plan, timeout=60)
+            response.raise_for_status()
+            moved = response.json()['rescheduled']
+            print(f"Rescheduled {moved} orders on {args.server}")
+        except requests.exceptions.ConnectionError:
+            moved = predictor.apply_horizon_plan(plan)
+            print(f"No server at {args.server}; rescheduled {moved} orders in the order store")
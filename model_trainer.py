@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+
+from history_archive import DeliveryHistoryArchive
+from sqlite_store import SQLiteOrderStore
+from success_model import SuccessModel
+
+
+def compute_model_tables(df, areas):
+    """
+    Success-rate tables and the compiled success model for a history DataFrame
+
+    Parameters:
+    - df: History with the dataset.csv columns (and optional `Count`)
+    - areas: Dictionary of customer name -> fixed area
+
+    Returns:
+    - Dictionary with the ModelTables fields except `version` (plain dicts
+      and arrays, so it can be returned from a worker process); the
+      `fingerprint` identifies the tables across processes
+    """
+    # Compacted history rows stand for `Count` identical attempts
+    attempts = df['Count'].astype(float) if 'Count' in df.columns else pd.Series(1.0, index=df.index)
+
+    # Group by name, day, time and calculate success rate
+    frame = pd.DataFrame({
+        'Name': df['Name'],
+        'Day': df['Day of Delivery Attempt'],
+        'Time': df['Time'],
+        'Success': (df['Delivery Status'] == 'Success').astype(float) * attempts,
+        'Attempts': attempts
+    })
+
+    def success_rates(keys):
+        sums = frame.groupby(keys)[['Success', 'Attempts']].sum()
+        return (sums['Success'] / sums['Attempts']).items()
+
+    rate_by_name_day_time = defaultdict(lambda: defaultdict(dict))
+    for (name, day, time_slot), rate in success_rates(['Name', 'Day', 'Time']):
+        rate_by_name_day_time[name][day][time_slot] = float(rate)
+
+    rate_by_name_day = defaultdict(dict)
+    for (name, day), rate in success_rates(['Name', 'Day']):
+        rate_by_name_day[name][day] = float(rate)
+
+    rate_by_name_time = defaultdict(dict)
+    for (name, time_slot), rate in success_rates(['Name', 'Time']):
+        rate_by_name_time[name][time_slot] = float(rate)
+
+    tables = {
+        'rate_by_name_day_time': {name: {day: dict(times) for day, times in days.items()} for name, days in rate_by_name_day_time.items()},
+        'rate_by_name_day': dict(rate_by_name_day),
+        'rate_by_name_time': dict(rate_by_name_time),
+        # Logistic regression over customer, area, day, slot and package size, compiled to a lookup table
+        'success_model': SuccessModel().fit(df).compile(areas.get)
+    }
+    tables['fingerprint'] = tables_fingerprint(tables)
+    return tables
+
+
+def tables_fingerprint(tables):
+    """Content hash of the model tables: equal in every process that trained on the same history"""
+    digest = hashlib.sha1()
+    for key in ('rate_by_name_day_time', 'rate_by_name_day', 'rate_by_name_time'):
+        digest.update(json.dumps(tables[key], sort_keys=True).encode())
+    model = tables['success_model']
+    digest.update(json.dumps([model.names, model.slots]).encode())
+    digest.update(model.table.tobytes())
+    digest.update(model.area_table.tobytes())
+    return digest.hexdigest()[:16]
+
+
+def load_training_history(source):
+    """
+    Load delivery history from a source description (see DeliveryPredictor.history_source)
+
+    Parameters:
+    - source: {'sqlite': db_path}, {'archive': root, 'start_date': date or None, 'include_undated': bool}
+      or {'csv': path}
+    """
+    if 'sqlite' in source:
+        return SQLiteOrderStore(source['sqlite']).load_history()
+    if 'archive' in source:
+        return DeliveryHistoryArchive(source['archive']).load(source.get('start_date'), include_undated=source.get('include_undated'))
+    return pd.read_csv(source['csv'])
+
+
+def train_model_tables(source, areas):
+    """
+    Load the history and build new model tables (runs in the trainer process)
+
+    Returns:
+    - (tables dictionary from compute_model_tables, number of history rows)
+    """
+    df = load_training_history(source)
+    return compute_model_tables(df, areas), len(df)
+
+
+class ModelRetrainer:
+    """
+    Retrains the model tables in a background process and hot-swaps them in
+
+    A daemon thread waits until `interval_seconds` have passed or
+    `after_outcomes` new delivery outcomes have been recorded, then rebuilds
+    the tables from the stored history in a separate process, so training
+    neither holds the GIL nor any lock the request threads need. The child
+    runs this module as a script: it never imports the server's main module
+    (app.py builds a DeliveryPredictor at import time, which would reset the
+    pending orders on disk).
+    The result is published with DeliveryPredictor.publish_model_tables: one
+    reference assignment under a new version number. Requests that already
+    read the old ModelTables finish on it; new requests see the new version.
+
+    Parameters:
+    - predictor: DeliveryPredictor whose tables are refreshed
+    - interval_seconds: Retrain at least this often (None: no schedule)
+    - after_outcomes: Retrain after this many recorded outcomes (None: no count trigger)
+    """
+
+    def __init__(self, predictor, interval_seconds=None, after_outcomes=None):
+        self.predictor = predictor
+        self.interval_seconds = interval_seconds
+        self.after_outcomes = after_outcomes
+        self.outcomes_since_training = 0
+        self.last_result = None
+        self._lock = threading.Lock()
+        self._train_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    @classmethod
+    def from_environment(cls, predictor):
+        """Configure from MODEL_RETRAIN_INTERVAL (seconds) and MODEL_RETRAIN_AFTER (outcomes)"""
+        interval = os.environ.get('MODEL_RETRAIN_INTERVAL')
+        after = os.environ.get('MODEL_RETRAIN_AFTER')
+        return cls(predictor, float(interval) if interval else None, int(after) if after else None)
+
+    def start(self):
+        """Start the background thread (only when a schedule or outcome count is configured)"""
+        if self._thread is None and (self.interval_seconds or self.after_outcomes):
+            self._thread = threading.Thread(target=self._run, name='model-retrainer', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the background thread"""
+        self._stopped = True
+        self._wake.set()
+
+    def record_outcome(self, count=1):
+        """Count new delivery outcomes; wakes the trainer once after_outcomes is reached"""
+        with self._lock:
+            self.outcomes_since_training += count
+            due = self.after_outcomes and self.outcomes_since_training >= self.after_outcomes
+        if due:
+            self._wake.set()
+
+    def request(self):
+        """Ask the background thread to retrain now; falls back to training on a new thread"""
+        if self._thread is not None:
+            self._wake.set()
+        else:
+            threading.Thread(target=self.retrain, name='model-retrainer', daemon=True).start()
+
+    def status(self):
+        """Current model version, pending outcomes and the last training result"""
+        return {
+            'version': self.predictor.model_tables.version,
+            'outcomes_since_training': self.outcomes_since_training,
+            'interval_seconds': self.interval_seconds,
+            'after_outcomes': self.after_outcomes,
+            'training': self._train_lock.locked(),
+            'last_result': self.last_result
+        }
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.interval_seconds)
+            self._wake.clear()
+            if not self._stopped:
+                self.retrain()
+
+    def _train_in_child(self, source, areas):
+        """Run train_model_tables in a fresh interpreter running this file, exchanging pickles"""
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, 'tables.pickle')
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), output_path],
+                input=pickle.dumps((source, areas)),
+                capture_output=True
+            )
+            if completed.returncode != 0:
+                errors = completed.stderr.decode(errors='replace').strip().splitlines()
+                raise RuntimeError(errors[-1] if errors else f"trainer exited with status {completed.returncode}")
+            with open(output_path, 'rb') as f:
+                return pickle.load(f)
+
+    def retrain(self):
+        """
+        Train new tables in the worker process and publish them (blocks until done)
+
+        Returns:
+        - Dictionary with the new `version`, `rows`, `seconds` and
+          `trained_at`, or `error` if training failed (the old tables stay live)
+        """
+        with self._train_lock:
+            with self._lock:
+                counted = self.outcomes_since_training
+            started = time.time()
+            try:
+                tables, rows = self._train_in_child(self.predictor.history_source(), dict(self.predictor.customer_areas))
+            except Exception as e:
+                print(f"Model retraining failed: {e}")
+                self.last_result = {'error': str(e), 'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+                return self.last_result
+
+            version = self.predictor.publish_model_tables(tables)
+            with self._lock:
+                # Outcomes recorded while training count towards the next round
+                self.outcomes_since_training -= counted
+            self.last_result = {
+                'version': version,
+                'rows': rows,
+                'seconds': round(time.time() - started, 2),
+                'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            print(f"Published model version {version} trained on {rows} attempts in {self.last_result['seconds']}s")
+            return self.last_result
+
+
+if __name__ == "__main__":
+    # Trainer child: (source, areas) pickled on stdin, (tables, rows) pickled to the path in argv
+    source, areas = pickle.load(sys.stdin.buffer)
+    result = train_model_tables(source, areas)
+    with open(sys.argv[1], 'wb') as f:
+        pickle.dump(result, f)
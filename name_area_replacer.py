@@ -1,20 +1,10 @@
 import csv
 import os
 from collections import defaultdict
+from customer_registry import open_registry
 
-# Define the name to area mappings
-name_to_area = {
-    'Aditya': 'Satellite',
-    'Vivaan': 'Bopal',
-    'Aarav': 'Vastrapur',
-    'Meera': 'Paldi',
-    'Diya': 'Thaltej',
-    'Riya': 'Navrangpura',
-    'Ananya': 'Bodakdev',
-    'Aryan': 'Gota',
-    'Ishaan': 'Maninagar',
-    'Kabir': 'Chandkheda'
-}
+# Name to area mappings come from the customer registry
+name_to_area = open_registry().areas_view()
 
 # Statistics counters
 stats = defaultdict(int)
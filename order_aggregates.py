@@ -0,0 +1,221 @@
+import bisect
+import itertools
+import threading
+from collections import Counter, namedtuple
+
+from persistent_map import EMPTY_MAP, PersistentMap
+
+# Immutable view published to readers; each write publishes a new one sharing structure with the last
+#   groups:        (name, delivery_day) -> group dict with an `orders` tuple
+#   day_customers: delivery_day -> {name: first order + parcel_count}
+#   names:         sorted tuple of customers with pending orders
+#   orders:        order_id -> the counted version of each order
+AggregateView = namedtuple('AggregateView', ['groups', 'day_customers', 'customer_totals', 'names', 'orders'])
+
+EMPTY_VIEW = AggregateView(EMPTY_MAP, EMPTY_MAP, EMPTY_MAP, (), EMPTY_MAP)
+
+
+class OrderAggregates:
+    """
+    Dashboard groupings of pending orders, maintained incrementally
+
+    Keeps the per-customer/day order groups, the per-day parcel counts per
+    customer and the sorted customer list up to date as orders are added
+    and delivered, so the dashboard no longer regroups the whole backlog on
+    every request. Like OrderStore, writes are copy-on-write over
+    PersistentMaps (a write copies only the paths to the groups, days and
+    customers it touches) and readers work from an immutable AggregateView.
+
+    Orders are counted once per order_id: adding an order whose id is
+    already counted replaces the earlier version, like the order store does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._view = EMPTY_VIEW
+
+    def view(self):
+        """Current immutable AggregateView"""
+        return self._view
+
+    def rebuild(self, orders):
+        """Recompute all aggregates from a list of orders"""
+        with self._lock:
+            # Later versions of an id win, as in the order store
+            by_id = {order['order_id']: order for order in orders}
+            orders = list(by_id.values())
+            groups = {}
+            for order in orders:
+                groups.setdefault((order['name'], order['delivery_day']), []).append(order)
+            day_customers = {}
+            for (name, day), members in groups.items():
+                day_customers.setdefault(day, {})[name] = dict(members[0], parcel_count=len(members))
+            customer_totals = Counter(order['name'] for order in orders)
+
+            self._view = AggregateView(
+                PersistentMap((key, self._group(members[0], tuple(members))) for key, members in groups.items()),
+                PersistentMap((day, PersistentMap(customers)) for day, customers in day_customers.items()),
+                PersistentMap(customer_totals),
+                tuple(sorted(customer_totals)),
+                PersistentMap(by_id)
+            )
+
+    def add(self, orders):
+        """Fold added orders into the aggregates (an id already counted is replaced)"""
+        with self._lock:
+            self._apply(orders, ())
+
+    def remove(self, orders):
+        """Take delivered or cancelled orders out of the aggregates"""
+        with self._lock:
+            self._apply((), orders)
+
+    def replace(self, old_orders, new_orders):
+        """Swap updated versions of orders in (e.g. after a reschedule) in one publish"""
+        with self._lock:
+            self._apply(new_orders, old_orders)
+
+    def groups_page(self, day=None, customer=None, area=None, page=1, per_page=50):
+        """
+        Paginated order groups, optionally filtered by delivery day, customer and area
+
+        Returns:
+        - Dictionary with `items`, `total`, `page`, `per_page` and `pages`
+        """
+        view = self._view
+        page = max(1, page)
+        per_page = max(1, per_page)
+
+        if customer and day:
+            group = view.groups.get((customer, day))
+            candidates = [group] if group else []
+        elif day:
+            candidates = (view.groups[(name, day)] for name in view.day_customers.get(day, EMPTY_MAP))
+        elif customer:
+            candidates = (view.groups[(customer, d)] for d, names in view.day_customers.items() if customer in names)
+        else:
+            candidates = view.groups.values()
+
+        if area:
+            candidates = (group for group in candidates if group['area'] == area)
+
+        if hasattr(candidates, '__len__'):
+            total = len(candidates)
+            start = (page - 1) * per_page
+            items = list(itertools.islice(candidates, start, start + per_page))
+        else:
+            # Filtered generators have to be walked to count them
+            matching = list(candidates)
+            total = len(matching)
+            start = (page - 1) * per_page
+            items = matching[start:start + per_page]
+
+        return {
+            'items': [dict(group, orders=list(group['orders'])) for group in items],
+            'total': total,
+            'page': page,
+            'per_page': per_page,
+            'pages': (total + per_page - 1) // per_page
+        }
+
+    def customers_for_day(self, day, area=None):
+        """Per-customer parcel counts for a delivery day, in the order customers first appeared"""
+        customers = self._view.day_customers.get(day, EMPTY_MAP).values()
+        if area:
+            return [c for c in customers if c['area'] == area]
+        return list(customers)
+
+    def _group(self, first, orders):
+        return {
+            'name': first['name'],
+            'delivery_day': first['delivery_day'],
+            'area': first['area'],
+            'address': first['address'],
+            'orders': orders
+        }
+
+    def _apply(self, adds, removes):
+        """Apply removals then additions and publish a new view (caller holds the lock)"""
+        current = self._view
+        orders_by_id = current.orders
+
+        # Work on the counted versions: removals go by id, and an added id that is already counted replaces it
+        latest = {order['order_id']: order for order in adds}
+        counted = {}
+        for order in itertools.chain(removes, latest.values()):
+            previous = orders_by_id.get(order['order_id'])
+            if previous is not None:
+                counted[order['order_id']] = previous
+        for order_id in counted:
+            if order_id not in latest:
+                orders_by_id = orders_by_id.delete(order_id)
+        for order_id, order in latest.items():
+            orders_by_id = orders_by_id.set(order_id, order)
+        removes, adds = counted.values(), latest.values()
+
+        groups = current.groups
+        day_customers = current.day_customers
+        customer_totals = current.customer_totals
+        names = current.names
+        names_copied = False
+        # Insertion-ordered so new customers appear in the order their orders arrived
+        touched = {}
+
+        for order in removes:
+            key = (order['name'], order['delivery_day'])
+            group = groups.get(key)
+            if group is None:
+                continue
+            remaining = tuple(o for o in group['orders'] if o['order_id'] != order['order_id'])
+            if len(remaining) == len(group['orders']):
+                continue
+            if remaining:
+                groups = groups.set(key, dict(group, orders=remaining))
+            else:
+                groups = groups.delete(key)
+            touched[key] = True
+
+            total = customer_totals[order['name']] - 1
+            if total:
+                customer_totals = customer_totals.set(order['name'], total)
+            else:
+                customer_totals = customer_totals.delete(order['name'])
+                if not names_copied:
+                    names = list(names)
+                    names_copied = True
+                names.pop(bisect.bisect_left(names, order['name']))
+
+        # Collect additions per group first so a large batch copies each group once
+        added = {}
+        for order in adds:
+            added.setdefault((order['name'], order['delivery_day']), []).append(order)
+
+        for key, new_orders in added.items():
+            group = groups.get(key)
+            if group is None:
+                groups = groups.set(key, self._group(new_orders[0], tuple(new_orders)))
+            else:
+                groups = groups.set(key, dict(group, orders=group['orders'] + tuple(new_orders)))
+            touched[key] = True
+
+        for order in adds:
+            total = customer_totals.get(order['name'], 0)
+            if not total:
+                if not names_copied:
+                    names = list(names)
+                    names_copied = True
+                bisect.insort(names, order['name'])
+            customer_totals = customer_totals.set(order['name'], total + 1)
+
+        # Refresh the per-day customer summaries only for the touched groups
+        for name, day in touched:
+            customers = day_customers.get(day, EMPTY_MAP)
+            group = groups.get((name, day))
+            if group is None:
+                customers = customers.delete(name)
+            else:
+                customers = customers.set(name, dict(group['orders'][0], parcel_count=len(group['orders'])))
+            day_customers = day_customers.set(day, customers) if customers else day_customers.delete(day)
+
+        # The sorted name tuple is only rebuilt when a customer appears or leaves
+        self._view = AggregateView(groups, day_customers, customer_totals, tuple(names) if names_copied else names, orders_by_id)
@@ -0,0 +1,251 @@
+import json
+import os
+import threading
+from collections import namedtuple
+
+from persistent_map import EMPTY_MAP, PersistentMap
+
+# Immutable view of the store published to readers. The maps inside are
+# PersistentMaps; writers derive new versions that share structure with them.
+OrderSnapshot = namedtuple('OrderSnapshot', ['orders', 'by_day', 'by_customer'])
+
+EMPTY_SNAPSHOT = OrderSnapshot(EMPTY_MAP, EMPTY_MAP, EMPTY_MAP)
+
+
+def _bucket_set(index, key, order):
+    bucket = index.get(key, EMPTY_MAP)
+    return index.set(key, bucket.set(order['order_id'], order))
+
+
+def _bucket_delete(index, key, order_id):
+    bucket = index.get(key, EMPTY_MAP).delete(order_id)
+    return index.set(key, bucket) if bucket else index.delete(key)
+
+
+def _build_snapshot(orders):
+    """Snapshot of a list of orders built in one pass (later duplicates of an id win)"""
+    by_id = {order['order_id']: order for order in orders}
+    by_day, by_customer = {}, {}
+    for order_id, order in by_id.items():
+        by_day.setdefault(order['delivery_day'], {})[order_id] = order
+        by_customer.setdefault(order['name'], {})[order_id] = order
+    return OrderSnapshot(
+        PersistentMap(by_id),
+        PersistentMap((day, PersistentMap(bucket)) for day, bucket in by_day.items()),
+        PersistentMap((name, PersistentMap(bucket)) for name, bucket in by_customer.items())
+    )
+
+
+class OrderStore:
+    """
+    Pending orders indexed by id, delivery day and customer
+
+    Orders are persisted as a JSON snapshot plus an append-only journal of
+    add/remove operations, so each mutation is a single appended line
+    instead of a rewrite of the whole file. The journal is folded back into
+    the snapshot every `compact_every` operations.
+
+    Reads are lock-free: writers serialise on a lock, apply their change
+    copy-on-write and publish a new OrderSnapshot with a single reference
+    assignment. The indexes are PersistentMaps, so a write copies only the
+    O(log n) nodes on the path to each touched order, day and customer. Readers
+    always see a complete snapshot, never a half-applied write. Order dicts
+    handed out by the store are shared and must be treated as read-only.
+
+    Parameters:
+    - snapshot_path: JSON file holding the list of pending orders
+    - journal_path: Journal file (defaults to snapshot_path + '.journal')
+    - compact_every: Number of journal entries that triggers a compaction
+    - first_order_id: Id handed out when the store is empty
+    """
+    records_attempts = False
+
+    def __init__(self, snapshot_path='pending_orders.json', journal_path=None, compact_every=500, first_order_id=10000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or f"{snapshot_path}.journal"
+        self.compact_every = compact_every
+        self.first_order_id = first_order_id
+
+        self._snapshot = EMPTY_SNAPSHOT
+        self._write_lock = threading.RLock()
+        self._next_id = first_order_id
+        self._journal_entries = 0
+        self._journal = None
+
+    def load(self):
+        """Load the snapshot and replay the journal on top of it"""
+        with self._write_lock:
+            # Replay into a plain dict first and publish once, instead of one snapshot per entry
+            orders = {}
+            if os.path.exists(self.snapshot_path):
+                with open(self.snapshot_path) as f:
+                    for order in json.load(f):
+                        orders[order['order_id']] = order
+            max_seen = max(orders, default=self.first_order_id - 1)
+
+            torn = False
+            journal_entries = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path) as f:
+                    for line in f:
+                        line = line.strip()
+                        if not line:
+                            continue
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # A torn final line from a crash mid-write; everything before it is intact
+                            torn = True
+                            break
+                        if entry.get('op') == 'add':
+                            order = entry['order']
+                            orders[order['order_id']] = order
+                            max_seen = max(max_seen, order['order_id'])
+                        elif entry.get('op') == 'remove':
+                            orders.pop(entry['order_id'], None)
+                        elif entry.get('op') == 'allocator':
+                            max_seen = max(max_seen, entry['next_id'] - 1)
+                            continue
+                        journal_entries += 1
+
+            # Ids of delivered orders are never handed out again
+            self._next_id = max(self.first_order_id, max_seen + 1)
+            self._snapshot = _build_snapshot(list(orders.values()))
+            self._journal_entries = journal_entries
+
+            # Rewrite the snapshot so new entries are not appended after the torn line
+            if torn:
+                self.compact()
+
+        return self
+
+    def reset(self, orders):
+        """Replace all orders and write a fresh snapshot (the id allocator never moves back)"""
+        with self._write_lock:
+            self._next_id = max([self._next_id, self.first_order_id] + [order['order_id'] + 1 for order in orders])
+            self._snapshot = _build_snapshot(orders)
+            self.compact()
+
+    def next_order_id(self):
+        """Allocate a new order id"""
+        with self._write_lock:
+            order_id = self._next_id
+            self._next_id += 1
+            return order_id
+
+    def add(self, order):
+        """Add an order and journal it"""
+        self.add_many([order])
+
+    def add_many(self, orders):
+        """Add a batch of orders with a single journal write"""
+        with self._write_lock:
+            self._apply(adds=orders)
+            self._append_journal([{'op': 'add', 'order': order} for order in orders])
+
+    def update_many(self, orders):
+        """Replace existing orders (matched by order_id) with a single journal write"""
+        self.add_many(orders)
+
+    def remove(self, order_id):
+        """Remove an order and journal it. Returns the removed order or None."""
+        with self._write_lock:
+            order = self._apply(removes=[order_id])[0]
+            if order is not None:
+                self._append_journal([{'op': 'remove', 'order_id': order_id}])
+            return order
+
+    def snapshot(self):
+        """Current immutable OrderSnapshot"""
+        return self._snapshot
+
+    def get(self, order_id):
+        """Look up an order by id"""
+        return self._snapshot.orders.get(order_id)
+
+    def all(self):
+        """All pending orders in insertion order"""
+        return list(self._snapshot.orders.values())
+
+    def by_day(self, day):
+        """Pending orders for a delivery day"""
+        return list(self._snapshot.by_day.get(day, EMPTY_MAP).values())
+
+    def by_customer(self, name):
+        """Pending orders for a customer"""
+        return list(self._snapshot.by_customer.get(name, EMPTY_MAP).values())
+
+    def __len__(self):
+        return len(self._snapshot.orders)
+
+    def compact(self):
+        """Write the current state as a new snapshot and truncate the journal"""
+        with self._write_lock:
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(list(self._snapshot.orders.values()), f, indent=2)
+            os.replace(tmp_path, self.snapshot_path)
+
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+            # Start the new journal with the allocator position so ids of
+            # delivered orders are not reused after a restart
+            with open(self.journal_path, 'w') as f:
+                f.write(json.dumps({'op': 'allocator', 'next_id': self._next_id}) + '\n')
+            self._journal_entries = 0
+
+    def close(self):
+        """Close the journal file handle"""
+        with self._write_lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _append_journal(self, entries):
+        """Append entries to the journal (caller holds the write lock)"""
+        if not entries:
+            return
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(''.join(json.dumps(entry) + '\n' for entry in entries))
+        self._journal.flush()
+        self._journal_entries += len(entries)
+
+        if self._journal_entries >= self.compact_every:
+            self.compact()
+
+    def _apply(self, adds=(), removes=()):
+        """
+        Apply removals then additions copy-on-write and publish a new snapshot
+
+        Caller holds the write lock. Returns the removed orders (None for ids
+        that were not pending), in the order of `removes`.
+        """
+        current = self._snapshot
+        orders, by_day, by_customer = current.orders, current.by_day, current.by_customer
+
+        removed = []
+        for order_id in removes:
+            order = orders.get(order_id)
+            removed.append(order)
+            if order is None:
+                continue
+            orders = orders.delete(order_id)
+            by_day = _bucket_delete(by_day, order['delivery_day'], order_id)
+            by_customer = _bucket_delete(by_customer, order['name'], order_id)
+
+        for order in adds:
+            order_id = order['order_id']
+            previous = orders.get(order_id)
+            if previous is not None:
+                by_day = _bucket_delete(by_day, previous['delivery_day'], order_id)
+                by_customer = _bucket_delete(by_customer, previous['name'], order_id)
+            orders = orders.set(order_id, order)
+            by_day = _bucket_set(by_day, order['delivery_day'], order)
+            by_customer = _bucket_set(by_customer, order['name'], order)
+            # Keep the allocator ahead of any id we have seen
+            self._next_id = max(self._next_id, order_id + 1)
+
+        self._snapshot = OrderSnapshot(orders, by_day, by_customer)
+        return removed
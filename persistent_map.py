@@ -0,0 +1,232 @@
+BITS = 5
+BRANCHING = 1 << BITS
+MASK = BRANCHING - 1
+
+# Hash bits consumed by the key index before leaves stop splitting
+HASH_BITS = 60
+
+# Keys kept in one index leaf before it splits into a branch
+LEAF_SIZE = 8
+
+# Marks a deleted slot in the entry vector
+_HOLE = object()
+
+
+def _hash(key):
+    return hash(key) & ((1 << HASH_BITS) - 1)
+
+
+# Key index: a hash trie of 32-way tuple branches and small dict leaves, key -> slot
+
+def _index_get(node, key, h):
+    shift = 0
+    while type(node) is tuple:
+        node = node[(h >> shift) & MASK]
+        shift += BITS
+    return node.get(key) if node is not None else None
+
+
+def _index_set(node, key, h, slot, shift=0):
+    if node is None:
+        return {key: slot}
+    if type(node) is dict:
+        if key in node or len(node) < LEAF_SIZE or shift >= HASH_BITS:
+            leaf = dict(node)
+            leaf[key] = slot
+            return leaf
+        # Split a full leaf into a branch on the next hash bits
+        children = [None] * BRANCHING
+        for other, other_slot in node.items():
+            other_hash = _hash(other)
+            i = (other_hash >> shift) & MASK
+            children[i] = _index_set(children[i], other, other_hash, other_slot, shift + BITS)
+    else:
+        children = list(node)
+    i = (h >> shift) & MASK
+    children[i] = _index_set(children[i], key, h, slot, shift + BITS)
+    return tuple(children)
+
+
+def _index_delete(node, key, h, shift=0):
+    if type(node) is dict:
+        leaf = dict(node)
+        leaf.pop(key, None)
+        return leaf or None
+    i = (h >> shift) & MASK
+    children = list(node)
+    children[i] = _index_delete(children[i], key, h, shift + BITS)
+    return tuple(children)
+
+
+def _index_build(hashed, shift=0):
+    """Bulk-build the index from (hash, key, slot) triples"""
+    if len(hashed) <= LEAF_SIZE or shift >= HASH_BITS:
+        return {key: slot for _, key, slot in hashed} or None
+    buckets = [[] for _ in range(BRANCHING)]
+    for item in hashed:
+        buckets[(item[0] >> shift) & MASK].append(item)
+    return tuple(_index_build(bucket, shift + BITS) if bucket else None for bucket in buckets)
+
+
+# Entry vector: a 32-way trie of (key, value) slots in insertion order; leaves are level 1
+
+def _vector_set(node, levels, i, entry):
+    j = (i >> (BITS * (levels - 1))) & MASK
+    items = list(node) if node is not None else []
+    if levels == 1:
+        new = entry
+    else:
+        new = _vector_set(items[j] if j < len(items) else None, levels - 1, i, entry)
+    if j == len(items):
+        items.append(new)
+    else:
+        items[j] = new
+    return tuple(items)
+
+
+def _vector_iter(node, levels):
+    if levels == 1:
+        yield from node
+    else:
+        for child in node:
+            yield from _vector_iter(child, levels - 1)
+
+
+def _vector_build(entries):
+    """Bulk-build the vector; returns (root, levels)"""
+    nodes = [tuple(entries[i:i + BRANCHING]) for i in range(0, len(entries), BRANCHING)] or [()]
+    levels = 1
+    while len(nodes) > 1:
+        nodes = [tuple(nodes[i:i + BRANCHING]) for i in range(0, len(nodes), BRANCHING)]
+        levels += 1
+    return nodes[0], levels
+
+
+class PersistentMap:
+    """
+    Immutable insertion-ordered map with structural sharing
+
+    `set` and `delete` return a new map and leave this one untouched. Only
+    the O(log n) trie nodes on the path to the changed key are copied, and
+    everything else is shared with the previous version. A copy-on-write
+    writer therefore pays for the keys it touches, not for the size of the
+    map, and readers holding an older version are never affected.
+
+    Reads follow dict semantics: `get`, `in`, `[]`, `len` and iteration
+    over keys, `values()` and `items()` in insertion order. Replacing an
+    existing key keeps its position.
+
+    Parameters:
+    - items: Initial mapping or (key, value) pairs
+    """
+    __slots__ = ('_index', '_entries', '_levels', '_size', '_count')
+
+    def __init__(self, items=()):
+        pairs = dict(items)
+        entries = list(pairs.items())
+        self._index = _index_build([(_hash(key), key, slot) for slot, (key, _) in enumerate(entries)])
+        self._entries, self._levels = _vector_build(entries)
+        self._size = len(entries)
+        self._count = len(entries)
+
+    @classmethod
+    def _make(cls, index, entries, levels, size, count):
+        new = object.__new__(cls)
+        new._index = index
+        new._entries = entries
+        new._levels = levels
+        new._size = size
+        new._count = count
+        return new
+
+    def get(self, key, default=None):
+        slot = _index_get(self._index, key, _hash(key))
+        if slot is None:
+            return default
+        return self._entry(slot)[1]
+
+    def _entry(self, slot):
+        node = self._entries
+        for level in range(self._levels - 1, -1, -1):
+            node = node[(slot >> (BITS * level)) & MASK]
+        return node
+
+    def __getitem__(self, key):
+        slot = _index_get(self._index, key, _hash(key))
+        if slot is None:
+            raise KeyError(key)
+        return self._entry(slot)[1]
+
+    def __contains__(self, key):
+        return _index_get(self._index, key, _hash(key)) is not None
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return (entry[0] for entry in self._live())
+
+    def _live(self):
+        return (entry for entry in _vector_iter(self._entries, self._levels) if entry is not _HOLE)
+
+    def keys(self):
+        return _View(self, lambda entry: entry[0])
+
+    def values(self):
+        return _View(self, lambda entry: entry[1])
+
+    def items(self):
+        return _View(self, lambda entry: entry)
+
+    def set(self, key, value):
+        """A new map with key set to value"""
+        h = _hash(key)
+        slot = _index_get(self._index, key, h)
+        if slot is not None:
+            entries = _vector_set(self._entries, self._levels, slot, (key, value))
+            return self._make(self._index, entries, self._levels, self._size, self._count)
+
+        entries, levels = self._entries, self._levels
+        if self._size == BRANCHING ** levels:
+            entries, levels = (entries,), levels + 1
+        return self._make(
+            _index_set(self._index, key, h, self._size),
+            _vector_set(entries, levels, self._size, (key, value)),
+            levels, self._size + 1, self._count + 1
+        )
+
+    def delete(self, key):
+        """A new map without key (this map if the key is missing)"""
+        h = _hash(key)
+        slot = _index_get(self._index, key, h)
+        if slot is None:
+            return self
+        # Repack once deleted slots outnumber live ones, so the cost is amortised over the deletes
+        if self._size - self._count + 1 > max(self._count - 1, BRANCHING):
+            return PersistentMap((k, v) for k, v in self._live() if k != key)
+        return self._make(
+            _index_delete(self._index, key, h),
+            _vector_set(self._entries, self._levels, slot, _HOLE),
+            self._levels, self._size, self._count - 1
+        )
+
+    def __repr__(self):
+        return f"PersistentMap({dict(self._live())!r})"
+
+
+class _View:
+    """Sized, re-iterable keys/values/items view of a PersistentMap"""
+    __slots__ = ('_map', '_pick')
+
+    def __init__(self, mapping, pick):
+        self._map = mapping
+        self._pick = pick
+
+    def __len__(self):
+        return len(self._map)
+
+    def __iter__(self):
+        return map(self._pick, self._map._live())
+
+
+EMPTY_MAP = PersistentMap()
@@ -0,0 +1,354 @@
+import json
+import threading
+from datetime import datetime
+
+from route_solver import stop_name
+from spatial_index import haversine_km
+
+# A ping this close to the next stop counts as arriving there
+ARRIVAL_RADIUS_KM = 0.15
+
+# Label of the depot in the customer spatial index
+DEPOT_LABEL = 'Start Location (Postman)'
+
+
+def parse_pings(lines):
+    """
+    Parse NDJSON position pings, skipping blank lines
+
+    Each line is {"courier_id": "c1", "lat": 23.03, "lon": 72.53, "timestamp": ...}
+    where timestamp is epoch seconds or ISO 8601 and defaults to now.
+
+    Returns:
+    - (pings, errors): list of (courier_id, lat, lon, datetime) and a list of
+      {"line": n, "error": message}
+    """
+    pings = []
+    errors = []
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            timestamp = record.get('timestamp')
+            if timestamp is None:
+                timestamp = datetime.now()
+            elif isinstance(timestamp, (int, float)):
+                timestamp = datetime.fromtimestamp(timestamp)
+            else:
+                timestamp = datetime.fromisoformat(timestamp)
+                if timestamp.tzinfo is not None:
+                    timestamp = timestamp.astimezone().replace(tzinfo=None)
+            pings.append((str(record.get('courier_id', 'default')), float(record['lat']), float(record['lon']), timestamp))
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            errors.append({'line': number, 'error': str(e)})
+    return pings, errors
+
+
+class RouteProgress:
+    """
+    Planned route of one courier and where they are along it
+
+    Planned leg times are stored as a prefix sum, so the ETA of every
+    remaining stop is the ETA of the next stop plus a constant difference of
+    prefix sums. A ping only updates the anchor (time and minutes to the
+    next stop); the remaining ETAs are derived when read.
+    """
+
+    def __init__(self, stops, legs, started_at):
+        self.stops = stops              # list of dicts: name, address, area, lat, lon
+        self.legs = legs                # planned minutes to reach each stop from the previous one
+        self.cumulative = self._prefix_sums(legs)
+        self.next_index = 0
+        self.previous_point = None      # (lat, lon) of the last stop reached or the start
+        self.reached_point = None       # (lat, lon) of the last stop reached
+        self.anchor_time = started_at
+        self.minutes_to_next = legs[0] if legs else 0.0
+        self.position = None
+        self.last_ping = None
+
+    @staticmethod
+    def _prefix_sums(legs):
+        sums = []
+        total = 0.0
+        for minutes in legs:
+            total += minutes
+            sums.append(total)
+        return sums
+
+    def advance_past(self, index):
+        if index >= self.next_index:
+            stop = self.stops[index]
+            self.next_index = index + 1
+            if stop['lat'] is not None:
+                self.previous_point = (stop['lat'], stop['lon'])
+                self.reached_point = self.previous_point
+            self.minutes_to_next = self.legs[self.next_index] if self.next_index < len(self.legs) else 0.0
+
+    def insert(self, index, stop, previous_address, minutes):
+        """Insert a stop before position `index` and rebuild the leg prefix sums"""
+        self.stops.insert(index, stop)
+        self.legs.insert(index, minutes(previous_address, stop['address']))
+        if index + 1 < len(self.stops):
+            self.legs[index + 1] = minutes(stop['address'], self.stops[index + 1]['address'])
+        self.cumulative = self._prefix_sums(self.legs)
+        if index == self.next_index:
+            self.minutes_to_next = self.legs[index]
+
+    def etas(self):
+        remaining = []
+        if self.next_index >= len(self.stops):
+            return remaining
+        base = self.cumulative[self.next_index]
+        for i in range(self.next_index, len(self.stops)):
+            minutes = self.minutes_to_next + self.cumulative[i] - base
+            remaining.append(dict(
+                self.stops[i],
+                minutes_away=round(minutes, 1),
+                eta=self.anchor_time.timestamp() + minutes * 60
+            ))
+        return remaining
+
+
+class PositionTracker:
+    """
+    Live courier positions from GPS pings, with ETAs for the remaining route
+
+    Pings are coalesced per courier before any work is done, so a burst of
+    pings costs one parse each plus one snap and one O(1) ETA update per
+    courier. Snapping uses the customer KD-tree (nearest customer and its
+    area) and, when loaded, the road graph's node index.
+
+    Parameters:
+    - predictor: DeliveryPredictor supplying the customer index, road graph and dispatcher
+    """
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.routes = {}
+        self.positions = {}
+        self._lock = threading.Lock()
+
+    def set_route(self, courier_id, names, started_at=None):
+        """
+        Track a courier along a planned route (e.g. the one from optimize_delivery_route)
+
+        Parameters:
+        - courier_id: Courier identifier
+        - names: Customer names or route labels in visiting order (the depot label is skipped)
+        - started_at: Departure time (defaults to now)
+
+        Returns:
+        - The route progress (see progress())
+        """
+        predictor = self.predictor
+        shift = predictor.dispatcher.state(courier_id)
+        origin = shift['location'] if shift is not None else predictor.default_location
+        start_hit, start = predictor.geocoder.cache.lookup(origin)
+
+        stops = []
+        legs = []
+        origin_area = None
+        for name in map(stop_name, names):
+            if name == DEPOT_LABEL:
+                continue
+            address = predictor.customer_addresses.get(name)
+            if address is None:
+                raise ValueError(f"Unknown customer: {name}")
+            hit, entry = predictor.geocoder.cache.lookup(address)
+            located = hit and entry is not None
+            stops.append({
+                'name': name,
+                'address': address,
+                'area': predictor.customer_areas.get(name),
+                'lat': entry['lat'] if located else None,
+                'lon': entry['lon'] if located else None
+            })
+            legs.append(float(predictor.get_driving_distance(origin, address, origin_area, stops[-1]['area'])['duration']))
+            origin, origin_area = address, stops[-1]['area']
+
+        progress = RouteProgress(stops, legs, started_at or datetime.now())
+        if start_hit and start is not None:
+            progress.previous_point = (start['lat'], start['lon'])
+        with self._lock:
+            self.routes[courier_id] = progress
+        return self.progress(courier_id)
+
+    def ingest(self, pings):
+        """
+        Apply a batch of (courier_id, lat, lon, timestamp) pings
+
+        Only the newest ping per courier is applied; older pings than the
+        courier's last applied one are ignored.
+
+        Returns:
+        - Summary with received, applied and stale counts and the couriers updated
+        """
+        latest = {}
+        for ping in pings:
+            current = latest.get(ping[0])
+            if current is None or ping[3] >= current[3]:
+                latest[ping[0]] = ping
+
+        applied = []
+        stale = 0
+        for courier_id, lat, lon, timestamp in latest.values():
+            if self._apply(courier_id, lat, lon, timestamp):
+                applied.append(courier_id)
+            else:
+                stale += 1
+        return {'received': len(pings), 'applied': len(applied), 'stale': stale, 'couriers': applied}
+
+    def stop_reached(self, courier_id, name):
+        """Move a courier's route past a customer (called when an order is marked delivered)"""
+        with self._lock:
+            progress = self.routes.get(courier_id)
+            if progress is None:
+                return False
+            for i in range(progress.next_index, len(progress.stops)):
+                if progress.stops[i]['name'] == name:
+                    progress.advance_past(i)
+                    return True
+        return False
+
+    def insert_stop(self, courier_id, name):
+        """
+        Insert a customer into a courier's remaining route at the cheapest position
+
+        Returns:
+        - Index of the inserted stop, or None if the courier has no route or
+          already has the customer ahead
+        """
+        predictor = self.predictor
+        address = predictor.customer_addresses.get(name)
+        with self._lock:
+            progress = self.routes.get(courier_id)
+            if progress is None or address is None:
+                return None
+            if any(stop['name'] == name for stop in progress.stops[progress.next_index:]):
+                return None
+            remaining = progress.stops[progress.next_index:]
+
+        # Areas of the stops are already known; only the courier's current location is looked up
+        area_at = {stop['address']: stop['area'] for stop in remaining}
+        area_at[address] = predictor.customer_areas.get(name)
+
+        def minutes(origin, destination):
+            return float(predictor.get_driving_distance(origin, destination, area_at.get(origin), area_at.get(destination))['duration'])
+
+        # Cheapest insertion: detour = (a -> new) + (new -> b) - (a -> b); the last position has no b
+        shift = predictor.dispatcher.state(courier_id)
+        current = shift['location'] if shift is not None else predictor.default_location
+        addresses = [current] + [stop['address'] for stop in remaining]
+        best = None
+        for i in range(len(remaining) + 1):
+            detour = minutes(addresses[i], address)
+            if i < len(remaining):
+                detour += minutes(address, addresses[i + 1]) - minutes(addresses[i], addresses[i + 1])
+            if best is None or detour < best[0]:
+                best = (detour, i)
+
+        hit, entry = predictor.geocoder.cache.lookup(address)
+        located = hit and entry is not None
+        stop = {
+            'name': name,
+            'address': address,
+            'area': area_at[address],
+            'lat': entry['lat'] if located else None,
+            'lon': entry['lon'] if located else None
+        }
+        position = progress.next_index + best[1]
+        with self._lock:
+            if self.routes.get(courier_id) is not progress:
+                return None
+            progress.insert(position, stop, addresses[best[1]], minutes)
+        return position
+
+    def position(self, courier_id):
+        """Last snapped position of a courier, or None"""
+        with self._lock:
+            return self.positions.get(courier_id)
+
+    def progress(self, courier_id):
+        """Last position and ETAs of the remaining stops, or None if the courier has no route"""
+        with self._lock:
+            progress = self.routes.get(courier_id)
+            if progress is None:
+                return None
+            return {
+                'courier_id': courier_id,
+                'position': self.positions.get(courier_id),
+                'last_ping': progress.last_ping.isoformat() if progress.last_ping else None,
+                'completed': progress.next_index,
+                'remaining': progress.etas()
+            }
+
+    def _snap(self, lat, lon):
+        predictor = self.predictor
+        snapped = {'lat': lat, 'lon': lon}
+        nearest = predictor.get_customer_index().nearest(lat, lon, k=1)
+        if nearest:
+            label, distance = nearest[0]
+            if label == DEPOT_LABEL:
+                snapped.update(area='Satellite', address=predictor.default_location)
+            else:
+                snapped.update(area=predictor.customer_registry.area_of(label), address=predictor.customer_registry.address_of(label))
+            snapped.update(nearest_stop=label, nearest_stop_km=round(distance, 3))
+        if predictor.road_graph is not None:
+            node = predictor.road_graph.snap(lat, lon)
+            snapped['road_node'] = predictor.road_graph.node_ids[node].item()
+            snapped['road_lat'] = float(predictor.road_graph.lat[node])
+            snapped['road_lon'] = float(predictor.road_graph.lon[node])
+        return snapped
+
+    def _apply(self, courier_id, lat, lon, timestamp):
+        snapped = self._snap(lat, lon)
+
+        with self._lock:
+            previous = self.positions.get(courier_id)
+            if previous is not None and previous['timestamp'] > timestamp.timestamp():
+                return False
+            snapped['timestamp'] = timestamp.timestamp()
+            self.positions[courier_id] = snapped
+
+            progress = self.routes.get(courier_id)
+            if progress is not None:
+                self._update_progress(progress, lat, lon, timestamp)
+
+        if 'address' in snapped:
+            self.predictor.dispatcher.update_location(courier_id, snapped['address'], snapped['area'])
+        return True
+
+    def _update_progress(self, progress, lat, lon, timestamp):
+        """Re-anchor the ETAs at this ping (caller holds the lock)"""
+        progress.position = (lat, lon)
+        progress.last_ping = timestamp
+        progress.anchor_time = timestamp
+
+        # Arrived at the next stop? A stop sharing coordinates with the last one
+        # reached (same building, or area-centre geocodes) is only passed by
+        # marking its order delivered: a courier standing there keeps pinging
+        # inside the radius without having delivered anything
+        while progress.next_index < len(progress.stops):
+            stop = progress.stops[progress.next_index]
+            if stop['lat'] is None or haversine_km(lat, lon, stop['lat'], stop['lon']) > ARRIVAL_RADIUS_KM:
+                break
+            if (stop['lat'], stop['lon']) == progress.reached_point:
+                break
+            progress.advance_past(progress.next_index)
+        if progress.next_index >= len(progress.stops):
+            progress.minutes_to_next = 0.0
+            return
+
+        # Scale the planned (traffic-adjusted) leg by the share of the straight-line distance still to go
+        stop = progress.stops[progress.next_index]
+        leg = progress.legs[progress.next_index]
+        if stop['lat'] is None or progress.previous_point is None:
+            progress.minutes_to_next = leg
+            return
+        total = haversine_km(progress.previous_point[0], progress.previous_point[1], stop['lat'], stop['lon'])
+        remaining = haversine_km(lat, lon, stop['lat'], stop['lon'])
+        share = remaining / total if total > ARRIVAL_RADIUS_KM else 1.0
+        progress.minutes_to_next = leg * min(share, 2.0)
@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from horizon_planner import horizon_days, slot_hour, success_table
+
+# Orders are given up (and reported) after this many failed attempts
+MAX_ATTEMPTS = 3
+
+
+class RedeliveryScheduler:
+    """
+    Reschedules failed delivery attempts in batches
+
+    Failed orders are queued by mark_delivered. A flush scores every queued
+    order against every (day, slot) in the horizon in one success_table
+    lookup, then places the orders greedily, most promising first. A slot
+    takes at most `slot_capacity` customers, and a customer who already has
+    an order in a slot can take another at no cost. Today's past hours and
+    the slot that just failed are skipped.
+
+    The orders go back into the pending store under a fresh id (the failed
+    one is kept as `previous_order_id`, since it may have been handed out
+    again after a restart), plus `planned_slot` and `attempts`. If the new
+    day is today, the order is also added to the courier's dispatch shift
+    and tracked route.
+
+    A failed order has already left the pending store, so the queue
+    (including a batch being scheduled) is written to `queue_path` on every
+    change and reloaded on start. A background thread flushes the queue
+    once its oldest entry has waited max_wait_seconds, even if no further
+    failures arrive.
+
+    Parameters:
+    - predictor: DeliveryPredictor supplying the model tables and the order store
+    - num_days: Days in the planning horizon, starting today
+    - slot_capacity: Maximum customers per day and slot
+    - batch_size: Queue length that triggers a flush
+    - max_wait_seconds: Oldest queued failure that triggers a flush
+    - queue_path: JSON file persisting the queue (None keeps it in memory only)
+    """
+
+    def __init__(self, predictor, num_days=3, slot_capacity=6, batch_size=20, max_wait_seconds=300, queue_path=None):
+        self.predictor = predictor
+        self.num_days = num_days
+        self.slot_capacity = slot_capacity
+        self.batch_size = batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.queue_path = queue_path
+        self.queue = []
+        self.last_result = None
+        self._in_flight = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._load_queue()
+
+    def start(self):
+        """Start the thread that flushes queues which have waited max_wait_seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='redelivery-flush', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the flush thread"""
+        self._stopped.set()
+
+    def _run(self):
+        # Check a few times per wait period so a lone failure is flushed close to its deadline
+        while not self._stopped.wait(max(1.0, min(self.max_wait_seconds / 4, 60))):
+            with self._lock:
+                due = bool(self.queue) and time.time() - self.queue[0]['queued_at'] >= self.max_wait_seconds
+            if due:
+                try:
+                    self.flush()
+                except Exception as e:
+                    print(f"Redelivery flush failed: {e}")
+
+    def _load_queue(self):
+        """Reload failures queued (or being scheduled) before a restart"""
+        if not self.queue_path or not os.path.exists(self.queue_path):
+            return
+        with open(self.queue_path) as f:
+            entries = json.load(f)
+        self.queue = [dict(entry, failed_at=datetime.strptime(entry['failed_at'], '%Y-%m-%d %H:%M:%S')) for entry in entries]
+        if self.queue:
+            print(f"Reloaded {len(self.queue)} queued redeliveries from {self.queue_path}")
+
+    def _save_queue(self):
+        """Write the in-flight batch and the queue atomically (caller holds self._lock)"""
+        if not self.queue_path:
+            return
+        entries = [
+            dict(entry, failed_at=entry['failed_at'].strftime('%Y-%m-%d %H:%M:%S'))
+            for entry in self._in_flight + self.queue
+        ]
+        temporary = f"{self.queue_path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(entries, f)
+        os.replace(temporary, self.queue_path)
+
+    def enqueue(self, order, courier_id=None, failed_at=None):
+        """
+        Queue a failed order; flushes when the batch is full or has waited too long
+
+        Returns:
+        - The flush result if this call triggered one, otherwise None
+        """
+        failed_at = failed_at or datetime.now()
+        with self._lock:
+            self.queue.append({'order': order, 'courier_id': courier_id, 'failed_at': failed_at, 'queued_at': time.time()})
+            self._save_queue()
+            due = len(self.queue) >= self.batch_size or time.time() - self.queue[0]['queued_at'] >= self.max_wait_seconds
+        return self.flush() if due else None
+
+    def pending(self):
+        """Queued failures awaiting the next flush"""
+        with self._lock:
+            return [dict(entry['order'], failed_at=entry['failed_at'].strftime('%Y-%m-%d %H:%M:%S')) for entry in self.queue]
+
+    def flush(self, now=None):
+        """
+        Schedule every queued failure
+
+        Returns:
+        - Dictionary with `scheduled` (order_id, previous_order_id, name,
+          delivery_day, planned_slot, success_probability), `abandoned` (orders past
+          MAX_ATTEMPTS) and `unscheduled` (no free slot in the horizon, left queued)
+        """
+        with self._flush_lock:
+            with self._lock:
+                # The batch stays in the persisted queue until it has been scheduled
+                batch, self.queue = self.queue, []
+                self._in_flight = batch
+            try:
+                result = self._schedule(batch, now or datetime.now())
+            except Exception:
+                with self._lock:
+                    self.queue[:0] = batch
+                    self._in_flight = []
+                raise
+            with self._lock:
+                unscheduled = {o['order_id'] for o in result['unscheduled']}
+                self.queue[:0] = [entry for entry in batch if entry['order']['order_id'] in unscheduled]
+                self._in_flight = []
+                self._save_queue()
+            self.last_result = result
+            return result
+
+    def _schedule(self, batch, now):
+        predictor = self.predictor
+        result = {'scheduled': [], 'abandoned': [], 'unscheduled': []}
+        pending = predictor.get_pending_orders()
+        # A batch reloaded after a crash mid-flush may already be back in the store under its new id
+        restored = {order['previous_order_id'] for order in pending if 'previous_order_id' in order}
+
+        entries = []
+        for entry in batch:
+            if entry['order']['order_id'] in restored:
+                continue
+            if entry['order'].get('attempts', 1) >= MAX_ATTEMPTS:
+                result['abandoned'].append(entry['order'])
+            else:
+                entries.append(entry)
+        if not entries:
+            return result
+
+        tables = predictor.model_tables
+        days = horizon_days(self.num_days, now)
+        slots = sorted({time for times in tables.rate_by_name_time.values() for time in times}, key=slot_hour)
+        names = sorted({entry['order']['name'] for entry in entries})
+        customer_index = {name: i for i, name in enumerate(names)}
+        success = success_table(tables, names, days, slots, predictor.customer_areas.get)[[customer_index[entry['order']['name']] for entry in entries]]
+
+        # Today's past slots are out; so is a retry in the slot that just failed
+        slot_hours = np.array([slot_hour(slot) for slot in slots])
+        success[:, 0, slot_hours <= now.hour] = -np.inf
+        for i, entry in enumerate(entries):
+            failed_at = entry['failed_at']
+            if failed_at.strftime('%A') in days:
+                success[i, days.index(failed_at.strftime('%A')), slot_hours == failed_at.hour] = -np.inf
+
+        # Slot load from the orders already planned: (day, slot) -> customers
+        slot_index = {slot: s for s, slot in enumerate(slots)}
+        booked = {}
+        for order in pending:
+            if order.get('planned_slot') in slot_index and order['delivery_day'] in days:
+                booked.setdefault((days.index(order['delivery_day']), slot_index[order['planned_slot']]), set()).add(order['name'])
+
+        requeued = []
+        # Most promising orders pick first
+        for i in np.argsort(-success.reshape(len(entries), -1).max(axis=1), kind='stable'):
+            entry = entries[i]
+            order = entry['order']
+            scores = success[i].copy()
+            for d in range(len(days)):
+                for s in range(len(slots)):
+                    customers = booked.get((d, s), ())
+                    if len(customers) >= self.slot_capacity and order['name'] not in customers:
+                        scores[d, s] = -np.inf
+            d, s = np.unravel_index(int(np.argmax(scores)), scores.shape)
+            if not np.isfinite(scores[d, s]):
+                result['unscheduled'].append(order)
+                continue
+            booked.setdefault((d, s), set()).add(order['name'])
+            requeued.append((entry, dict(
+                order,
+                delivery_day=days[d],
+                planned_slot=slots[s],
+                attempts=order.get('attempts', 1) + 1,
+                status='Pending'
+            ), round(float(scores[d, s]), 3)))
+
+        if requeued:
+            restored = predictor.restore_orders([order for _, order, _ in requeued])
+            today = days[0]
+            for (entry, _, probability), order in zip(requeued, restored):
+                result['scheduled'].append({
+                    'order_id': order['order_id'],
+                    'previous_order_id': order['previous_order_id'],
+                    'name': order['name'],
+                    'delivery_day': order['delivery_day'],
+                    'planned_slot': order['planned_slot'],
+                    'success_probability': probability
+                })
+                if order['delivery_day'] == today and entry['courier_id'] is not None:
+                    predictor.dispatcher.add_orders(entry['courier_id'], [order])
+                    predictor.position_tracker.insert_stop(entry['courier_id'], order['name'])
+        return result
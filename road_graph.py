@@ -0,0 +1,237 @@
+import heapq
+import os
+
+import numpy as np
+import pandas as pd
+
+from spatial_index import SpatialIndex
+
+# Used for edges without a speed column or value
+DEFAULT_SPEED_KMH = 30.0
+
+
+class RoadGraph:
+    """
+    Local road network in compressed sparse row (CSR) form
+
+    The graph is loaded from two CSV files: `nodes.csv` (node_id, lat, lon)
+    and `edges.csv` (source, target, length_m, optional speed_kmh and oneway).
+    Edges are stored as flat NumPy arrays, once in forward and once in
+    reverse order, so a node's neighbours are a contiguous slice. Edge
+    weights are travel times in seconds; lengths are carried alongside so
+    every query also returns the driven distance.
+
+    Parameters:
+    - node_ids: Array of external node ids
+    - lat, lon: Node coordinates
+    - sources, targets: Node positions (0..n-1) of each directed edge
+    - lengths_m: Edge lengths in metres
+    - durations_s: Edge travel times in seconds
+    """
+
+    def __init__(self, node_ids, lat, lon, sources, targets, lengths_m, durations_s):
+        self.node_ids = np.asarray(node_ids)
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        n = len(self.node_ids)
+
+        self.forward = self._csr(n, sources, targets, durations_s, lengths_m)
+        self.backward = self._csr(n, targets, sources, durations_s, lengths_m)
+        self.node_index = SpatialIndex(zip(range(n), self.lat, self.lon))
+
+    @staticmethod
+    def _csr(n, sources, targets, durations, lengths):
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=n), out=indptr[1:])
+        return (
+            indptr,
+            np.asarray(targets, dtype=np.int32)[order],
+            np.asarray(durations, dtype=float)[order],
+            np.asarray(lengths, dtype=float)[order]
+        )
+
+    @classmethod
+    def from_csv(cls, nodes_path, edges_path):
+        """Load a graph from nodes.csv and edges.csv"""
+        nodes = pd.read_csv(nodes_path)
+        edges = pd.read_csv(edges_path)
+
+        node_ids = nodes['node_id'].to_numpy()
+        sorter = np.argsort(node_ids)
+        sources = sorter[np.searchsorted(node_ids, edges['source'].to_numpy(), sorter=sorter)]
+        targets = sorter[np.searchsorted(node_ids, edges['target'].to_numpy(), sorter=sorter)]
+
+        lengths = edges['length_m'].to_numpy(dtype=float)
+        speeds = edges['speed_kmh'].fillna(DEFAULT_SPEED_KMH).to_numpy(dtype=float) if 'speed_kmh' in edges else np.full(len(edges), DEFAULT_SPEED_KMH)
+        durations = lengths / (speeds / 3.6)
+
+        # Two-way edges are stored once per direction
+        oneway = edges['oneway'].fillna(0).astype(bool).to_numpy() if 'oneway' in edges else np.zeros(len(edges), dtype=bool)
+        two_way = ~oneway
+        sources, targets = np.concatenate([sources, targets[two_way]]), np.concatenate([targets, sources[two_way]])
+        lengths = np.concatenate([lengths, lengths[two_way]])
+        durations = np.concatenate([durations, durations[two_way]])
+
+        return cls(node_ids, nodes['lat'], nodes['lon'], sources, targets, lengths, durations)
+
+    @classmethod
+    def load_if_configured(cls):
+        """Load the graph in ROAD_GRAPH_DIR (nodes.csv + edges.csv), or return None"""
+        root = os.environ.get('ROAD_GRAPH_DIR')
+        if not root:
+            return None
+        nodes_path = os.path.join(root, 'nodes.csv')
+        edges_path = os.path.join(root, 'edges.csv')
+        if not (os.path.exists(nodes_path) and os.path.exists(edges_path)):
+            print(f"Road graph not found in {root}, using the area distance table")
+            return None
+        graph = cls.from_csv(nodes_path, edges_path)
+        print(f"Loaded road graph with {len(graph.node_ids)} nodes and {len(graph.forward[1])} edges")
+        return graph
+
+    def snap(self, lat, lon):
+        """Position of the graph node closest to a location"""
+        return self.node_index.nearest(lat, lon, k=1)[0][0]
+
+    def shortest_path(self, source, target):
+        """
+        Fastest path between two nodes with bidirectional Dijkstra
+
+        Returns:
+        - (duration_s, length_m, node list), or None if target is unreachable
+        """
+        if source == target:
+            return 0.0, 0.0, [source]
+
+        dist = ({source: 0.0}, {target: 0.0})
+        length = ({source: 0.0}, {target: 0.0})
+        parent = ({source: None}, {target: None})
+        settled = (set(), set())
+        heaps = ([(0.0, source)], [(0.0, target)])
+        graphs = (self.forward, self.backward)
+        best = float('inf')
+        meeting = None
+
+        while heaps[0] and heaps[1]:
+            # Stop once no path through unsettled nodes can beat the best found
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+
+            indptr, indices, weights, lengths = graphs[side]
+            for edge in range(indptr[node], indptr[node + 1]):
+                neighbour = int(indices[edge])
+                nd = d + weights[edge]
+                if nd < dist[side].get(neighbour, float('inf')):
+                    dist[side][neighbour] = nd
+                    length[side][neighbour] = length[side][node] + lengths[edge]
+                    parent[side][neighbour] = node
+                    heapq.heappush(heaps[side], (nd, neighbour))
+                other = dist[1 - side].get(neighbour)
+                if other is not None and dist[side][neighbour] + other < best:
+                    best = dist[side][neighbour] + other
+                    meeting = neighbour
+
+        if meeting is None:
+            return None
+
+        path = []
+        node = meeting
+        while node is not None:
+            path.append(node)
+            node = parent[0][node]
+        path.reverse()
+        node = parent[1][meeting]
+        while node is not None:
+            path.append(node)
+            node = parent[1][node]
+        return best, length[0][meeting] + length[1][meeting], path
+
+    def many_to_many(self, sources, targets):
+        """
+        Travel times and distances between every source and target node
+
+        Runs one forward Dijkstra per distinct source that stops as soon as
+        every target is settled, instead of one search per pair.
+
+        Returns:
+        - (durations_s, lengths_m) arrays of shape (len(sources), len(targets)); unreachable pairs are inf
+        """
+        durations = np.full((len(sources), len(targets)), np.inf)
+        lengths = np.full((len(sources), len(targets)), np.inf)
+        target_columns = {}
+        for column, target in enumerate(targets):
+            target_columns.setdefault(target, []).append(column)
+
+        indptr, indices, weights, edge_lengths = self.forward
+        results = {}
+        for source in sources:
+            if source in results:
+                continue
+            dist = {source: 0.0}
+            length = {source: 0.0}
+            remaining = set(target_columns)
+            found = {}
+            heap = [(0.0, source)]
+            settled = set()
+            while heap and remaining:
+                d, node = heapq.heappop(heap)
+                if node in settled:
+                    continue
+                settled.add(node)
+                if node in remaining:
+                    remaining.discard(node)
+                    found[node] = (d, length[node])
+                for edge in range(indptr[node], indptr[node + 1]):
+                    neighbour = int(indices[edge])
+                    nd = d + weights[edge]
+                    if nd < dist.get(neighbour, float('inf')):
+                        dist[neighbour] = nd
+                        length[neighbour] = length[node] + edge_lengths[edge]
+                        heapq.heappush(heap, (nd, neighbour))
+            results[source] = found
+
+        for row, source in enumerate(sources):
+            for target, (d, l) in results[source].items():
+                for column in target_columns[target]:
+                    durations[row, column] = d
+                    lengths[row, column] = l
+        return durations, lengths
+
+    def route(self, points):
+        """
+        Fastest route through a sequence of (lat, lon) points
+
+        Returns:
+        - Dictionary with distance_km, duration_min, geometry ([lat, lon] list),
+          waypoint_indices (geometry index of each point) and per-leg totals,
+          or None if some leg is unreachable
+        """
+        nodes = [self.snap(lat, lon) for lat, lon in points]
+        geometry = []
+        waypoint_indices = []
+        legs = []
+        for a, b in zip(nodes, nodes[1:]):
+            result = self.shortest_path(a, b)
+            if result is None:
+                return None
+            duration, length, path = result
+            if geometry:
+                path = path[1:]
+            waypoint_indices.append(len(geometry) if not geometry else len(geometry) - 1)
+            geometry.extend([float(self.lat[node]), float(self.lon[node])] for node in path)
+            legs.append({'distance_km': round(length / 1000, 2), 'duration_min': round(duration / 60, 1)})
+        waypoint_indices.append(len(geometry) - 1)
+
+        return {
+            'distance_km': round(sum(leg['distance_km'] for leg in legs), 2),
+            'duration_min': round(sum(leg['duration_min'] for leg in legs), 1),
+            'geometry': geometry,
+            'waypoint_indices': waypoint_indices,
+            'legs': legs
+        }
@@ -0,0 +1,127 @@
+import numpy as np
+
+# Spread (congestion levels) assumed around the current reading when an area has no recorded history
+DEFAULT_CONGESTION_SD = 1.5
+
+# Festival impact levels, mildest first, with the multipliers _adjust_travel_duration applies
+FESTIVAL_IMPACTS = ['Low', 'Moderate', 'High', 'Severe']
+FESTIVAL_MULTIPLIERS = np.array([1.0, 1.2, 1.3, 1.5])
+
+
+def traffic_multiplier(levels):
+    """Vectorised congestion level -> travel time multiplier, as in _adjust_travel_duration"""
+    return np.select([levels <= 3, levels <= 6, levels <= 8], [0.9, 1.0, 1.3], default=1.6)
+
+
+def sample_scenarios(areas, samples, traffic_data=None, weather_data=None, festival_data=None,
+                     congestion_sd=None, seed=None):
+    """
+    Sample travel time multipliers per area for many traffic/weather/festival scenarios
+
+    - Congestion per area is drawn around the current reading (level 5 if
+      missing) with the area's spread from congestion_sd, rounded to 1-10.
+    - Rain happens with the forecast precipitation chance (at least 70% when
+      it is raining now); fog with 50% when foggy now, else 2%.
+    - Each reported festival's impact is drawn from its reported level
+      (60%) or one level either side (20% each).
+
+    Parameters:
+    - areas: Area names (columns of the result)
+    - samples: Number of scenarios
+    - traffic_data, weather_data, festival_data: Real-time data as returned by get_real_time_data
+    - congestion_sd: Optional {area: standard deviation of congestion level}
+
+    Returns:
+    - Array of shape (samples, len(areas)) with the combined multiplier
+    """
+    rng = np.random.default_rng(seed)
+    congestion_sd = congestion_sd or {}
+    traffic_data = traffic_data if isinstance(traffic_data, dict) else {}
+
+    current = np.array([
+        traffic_data[area].get('congestion_level', 5) if isinstance(traffic_data.get(area), dict) else 5
+        for area in areas
+    ], dtype=float)
+    spread = np.array([congestion_sd.get(area) or DEFAULT_CONGESTION_SD for area in areas])
+    levels = np.clip(np.rint(rng.normal(current, spread, size=(samples, len(areas)))), 1, 10)
+    multipliers = traffic_multiplier(levels)
+
+    if isinstance(weather_data, dict):
+        conditions = str(weather_data.get('conditions', '')).lower()
+        precipitation = weather_data.get('precipitation')
+        chance = precipitation.get('chance', 0) / 100 if isinstance(precipitation, dict) else 0.0
+        raining = any(word in conditions for word in ('rain', 'snow', 'thunderstorm'))
+        foggy = 'fog' in conditions or 'mist' in conditions
+    else:
+        chance, raining, foggy = 0.0, False, False
+    rain = rng.random(samples) < (max(chance, 0.7) if raining else chance)
+    fog = rng.random(samples) < (0.5 if foggy else 0.02)
+    multipliers *= (np.where(rain, 1.2, 1.0) * np.where(fog, 1.15, 1.0))[:, None]
+
+    if isinstance(festival_data, dict) and festival_data.get('has_festival_today', False):
+        column = {area: i for i, area in enumerate(areas)}
+        for festival in festival_data.get('festivals', []):
+            affected = [column[area] for area in festival.get('affected_areas', []) if area in column]
+            if not affected:
+                continue
+            reported = festival.get('traffic_impact', 'Moderate')
+            level = FESTIVAL_IMPACTS.index(reported) if reported in FESTIVAL_IMPACTS else 1
+            drawn = np.clip(level + rng.choice([-1, 0, 1], size=samples, p=[0.2, 0.6, 0.2]), 0, len(FESTIVAL_IMPACTS) - 1)
+            multipliers[:, affected] *= FESTIVAL_MULTIPLIERS[drawn][:, None]
+
+    return multipliers
+
+
+def evaluate_routes(routes, multipliers, deadline_minutes=None):
+    """
+    Score candidate routes against every scenario in one vectorised pass
+
+    Parameters:
+    - routes: List of (base_durations, leg_areas) per route: base leg minutes
+      and the column of `multipliers` that applies to each leg
+    - multipliers: (samples, areas) array from sample_scenarios
+    - deadline_minutes: Finish time to measure lateness against, one value
+      or one per route; defaults to each route's unadjusted duration
+
+    Returns:
+    - List of dicts per route: expected_duration, p50, p90, std,
+      lateness_risk (share of scenarios finishing after the deadline),
+      deadline and per-stop p90 arrival minutes
+    """
+    lengths = [len(durations) for durations, _ in routes]
+    base = np.concatenate([np.asarray(durations, dtype=float) for durations, _ in routes])
+    columns = np.concatenate([np.asarray(areas, dtype=int) for _, areas in routes])
+    ends = np.cumsum(lengths).astype(int)
+    starts = ends - np.asarray(lengths, dtype=int)
+
+    # (samples, all legs of all routes); legs are truncated to whole minutes like the deterministic plan
+    legs = np.floor(base[None, :] * multipliers[:, columns])
+    # Route totals as differences of one running sum (empty routes total 0)
+    running = np.concatenate([np.zeros((len(multipliers), 1)), np.cumsum(legs, axis=1)], axis=1)
+    totals = running[:, ends] - running[:, starts]
+
+    # Arrival time at every stop: running sum minus the running sum at its route's start
+    route_of_leg = np.repeat(np.arange(len(routes)), lengths)
+    arrivals = running[:, 1:] - running[:, starts[route_of_leg]]
+    stop_p90 = np.round(np.percentile(arrivals, 90, axis=0), 1) if arrivals.shape[1] else arrivals[0]
+
+    p50, p90 = np.percentile(totals, [50, 90], axis=0)
+    expected = totals.mean(axis=0)
+    spread = totals.std(axis=0)
+    base_running = np.concatenate([[0.0], np.cumsum(base)])
+    planned = base_running[ends] - base_running[starts]
+    deadlines = np.broadcast_to(np.asarray(deadline_minutes, dtype=float), (len(routes),)) if deadline_minutes is not None else planned
+    late = (totals > deadlines[None, :]).mean(axis=0)
+
+    return [
+        {
+            'expected_duration': round(float(expected[r]), 1),
+            'p50': round(float(p50[r]), 1),
+            'p90': round(float(p90[r]), 1),
+            'std': round(float(spread[r]), 1),
+            'lateness_risk': round(float(late[r]), 3),
+            'deadline': float(deadlines[r]),
+            'stop_p90_arrivals': stop_p90[start:end].tolist()
+        }
+        for r, (start, end) in enumerate(zip(starts, ends))
+    ]
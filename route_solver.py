@@ -0,0 +1,309 @@
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from spatial_index import SpatialIndex
+
+# Up to this many stops every permutation is tried; above it the heuristic takes over
+BRUTE_FORCE_LIMIT = 8
+
+# Routing modes accepted by optimize_delivery_route
+ROUTE_MODES = ('auto', 'decompose')
+
+PARCEL_SUFFIX = re.compile(r' \(\d+ parcels\)$')
+
+
+def stop_name(label):
+    """Customer name from a route label such as 'Aditya (2 parcels)'"""
+    return PARCEL_SUFFIX.sub('', label)
+
+
+def route_cost(matrix, order):
+    """Cost of an open route that starts at the depot (row/column 0) and visits `order`"""
+    cost = matrix[0, order[0]]
+    for a, b in zip(order, order[1:]):
+        cost += matrix[a, b]
+    return float(cost)
+
+
+def nearest_neighbor_order(matrix, coordinates=None):
+    """
+    Greedy construction: always drive to the closest unvisited stop
+
+    Parameters:
+    - matrix: (n+1) x (n+1) cost matrix, index 0 is the depot
+    - coordinates: Optional list of (lat, lon) for the depot and stops; when
+      given, the next stop is found with a SpatialIndex query instead of a
+      scan of the whole matrix row
+
+    Returns:
+    - Visiting order as a list of stop indices (1..n)
+    """
+    n = len(matrix) - 1
+    if coordinates is not None:
+        index = SpatialIndex((i, lat, lon) for i, (lat, lon) in enumerate(coordinates) if i > 0)
+        visited = set()
+        current = coordinates[0]
+        order = []
+        for _ in range(n):
+            stop = index.nearest(current[0], current[1], k=1, exclude=visited)[0][0]
+            order.append(stop)
+            visited.add(stop)
+            current = coordinates[stop]
+        return order
+
+    remaining = np.ones(n + 1, dtype=bool)
+    remaining[0] = False
+    order = []
+    current = 0
+    for _ in range(n):
+        row = np.where(remaining, matrix[current], np.inf)
+        current = int(np.argmin(row))
+        remaining[current] = False
+        order.append(current)
+    return order
+
+
+def two_opt(matrix, order, max_passes=50):
+    """
+    Improve an open route by reversing segments while that shortens it
+
+    Assumes a symmetric cost matrix. Returns the improved order.
+    """
+    route = [0] + list(order)
+    n = len(route)
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                a, b = route[i - 1], route[i]
+                c = route[j]
+                d = route[j + 1] if j + 1 < n else None
+                before = matrix[a, b] + (matrix[c, d] if d is not None else 0.0)
+                after = matrix[a, c] + (matrix[b, d] if d is not None else 0.0)
+                if after < before - 1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    improved = True
+        if not improved:
+            break
+    return route[1:]
+
+
+def solve_open_route(matrix, coordinates=None):
+    """
+    Heuristic visiting order for many stops: nearest neighbour, then 2-opt
+
+    Returns:
+    - Visiting order as a list of stop indices (1..n)
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    if len(matrix) <= 2:
+        return list(range(1, len(matrix)))
+    return two_opt(matrix, nearest_neighbor_order(matrix, coordinates))
+
+
+# Above this many stops the route is split into zones solved in parallel
+DECOMPOSE_THRESHOLD = 100
+
+# Largest zone solved as one sub-tour; bigger zones are split geographically
+MAX_CLUSTER_SIZE = 40
+
+
+def _solve_cluster(submatrix):
+    """
+    Open sub-tour through one zone with free start and end (runs in a worker process)
+
+    A dummy depot with zero cost to every stop turns the free-endpoint path
+    into the depot-anchored problem solve_open_route already handles.
+    """
+    n = len(submatrix)
+    matrix = np.zeros((n + 1, n + 1))
+    matrix[1:, 1:] = submatrix
+    return [stop - 1 for stop in solve_open_route(matrix)]
+
+
+def split_clusters(groups, coordinates=None, max_cluster_size=MAX_CLUSTER_SIZE, matrix=None):
+    """
+    Partition stops 1..n into zones
+
+    Stops are grouped by their label in `groups` (e.g. area). Zones larger
+    than max_cluster_size are split geographically with k-means on the
+    coordinates. Any part still over the limit (k-means collapses when
+    stops share coordinates, e.g. area centroids), and every oversized zone
+    when there are no coordinates, is cut into consecutive chunks of a
+    nearest-neighbour ordering.
+
+    Returns:
+    - List of zones, each a list of stop indices (1..n)
+    """
+    zones = {}
+    for stop, group in enumerate(groups, 1):
+        zones.setdefault(group, []).append(stop)
+
+    clusters = []
+    for members in zones.values():
+        if len(members) <= max_cluster_size:
+            clusters.append(members)
+            continue
+        parts = -(-len(members) // max_cluster_size)
+        if coordinates is not None:
+            points = np.array([coordinates[stop] for stop in members], dtype=float)
+            labels = _kmeans(points, parts)
+            pieces = [[m for m, label in zip(members, labels) if label == k] for k in range(parts)]
+        else:
+            pieces = [members]
+        for piece in pieces:
+            if len(piece) <= max_cluster_size:
+                clusters.append(piece)
+            else:
+                clusters.extend(_chunk(piece, max_cluster_size, matrix, coordinates))
+    return [cluster for cluster in clusters if cluster]
+
+
+def _chunk(members, max_cluster_size, matrix=None, coordinates=None):
+    """Consecutive chunks of a nearest-neighbour ordering of `members`"""
+    if matrix is not None:
+        sub = matrix[np.ix_([0] + members, [0] + members)]
+    else:
+        points = np.array([coordinates[0]] + [coordinates[stop] for stop in members], dtype=float)
+        sub = np.sqrt(((points[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    ordered = [members[i - 1] for i in nearest_neighbor_order(sub)]
+    return [ordered[i:i + max_cluster_size] for i in range(0, len(ordered), max_cluster_size)]
+
+
+def _kmeans(points, k, iterations=20, seed=0):
+    """Plain Lloyd's k-means; returns a label per point"""
+    rng = np.random.default_rng(seed)
+    centres = points[rng.choice(len(points), size=k, replace=False)]
+    labels = np.zeros(len(points), dtype=int)
+    for _ in range(iterations):
+        labels = np.argmin(((points[:, None, :] - centres[None, :, :]) ** 2).sum(axis=2), axis=1)
+        for c in range(k):
+            if np.any(labels == c):
+                centres[c] = points[labels == c].mean(axis=0)
+    return labels
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _shared_pool(workers=None):
+    """Process pool reused by every decomposed solve (started on first use)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+        _pool = None
+
+
+def solve_decomposed(matrix, groups, coordinates=None, workers=None, max_cluster_size=MAX_CLUSTER_SIZE):
+    """
+    Zone decomposition for large routes: cluster, solve zones in parallel, stitch
+
+    1. Stops are split into zones (see split_clusters).
+    2. Each zone's free-endpoint sub-tour is solved in a process pool.
+    3. The zone visiting order is chosen with nearest neighbour + 2-opt on
+       the closest-endpoint distance between zones.
+    4. Each zone's direction is picked by dynamic programming so the
+       stitching legs between consecutive zones are as short as possible.
+
+    Parameters:
+    - matrix: (n+1) x (n+1) cost matrix, index 0 is the depot
+    - groups: Zone label per stop (length n)
+    - coordinates: Optional (lat, lon) for the depot and stops
+    - workers: Worker processes (defaults to the CPU count; only used when
+      the shared pool is first started)
+
+    Returns:
+    - Visiting order as a list of stop indices (1..n)
+    """
+    matrix = np.asarray(matrix, dtype=float)
+    clusters = split_clusters(groups, coordinates, max_cluster_size, matrix)
+
+    submatrices = [matrix[np.ix_(members, members)] for members in clusters]
+    try:
+        local_orders = list(_shared_pool(workers).map(_solve_cluster, submatrices))
+    except BrokenProcessPool:
+        # A worker died (e.g. killed); start a fresh pool once
+        _reset_pool()
+        local_orders = list(_shared_pool(workers).map(_solve_cluster, submatrices))
+    paths = [[members[i] for i in order] for members, order in zip(clusters, local_orders)]
+
+    # Zone-level matrix: cheapest connection between the endpoints of two sub-tours
+    m = len(paths)
+    ends = [(path[0], path[-1]) for path in paths]
+    zone_matrix = np.zeros((m + 1, m + 1))
+    for a in range(m):
+        zone_matrix[0, a + 1] = min(matrix[0, ends[a][0]], matrix[0, ends[a][1]])
+        for b in range(m):
+            if a != b:
+                zone_matrix[a + 1, b + 1] = min(matrix[x, y] for x in ends[a] for y in ends[b])
+    zone_order = [z - 1 for z in solve_open_route(zone_matrix)]
+
+    # Direction of each zone: state 0 = forward, 1 = reversed; DP over the zone sequence
+    def entry(z, flipped):
+        return paths[z][-1] if flipped else paths[z][0]
+
+    def exit_(z, flipped):
+        return paths[z][0] if flipped else paths[z][-1]
+
+    first = zone_order[0]
+    best = [matrix[0, entry(first, 0)], matrix[0, entry(first, 1)]]
+    choices = []
+    for previous, zone in zip(zone_order, zone_order[1:]):
+        step = []
+        new_best = []
+        for flipped in (0, 1):
+            options = [best[p] + matrix[exit_(previous, p), entry(zone, flipped)] for p in (0, 1)]
+            p = int(np.argmin(options))
+            step.append(p)
+            new_best.append(options[p])
+        choices.append(step)
+        best = new_best
+
+    flips = [int(np.argmin(best))]
+    for step in reversed(choices):
+        flips.append(step[flips[-1]])
+    flips.reverse()
+
+    route = []
+    boundaries = []
+    for zone, flipped in zip(zone_order, flips):
+        boundaries.append(len(route))
+        route.extend(reversed(paths[zone]) if flipped else paths[zone])
+
+    # Polish the stitching points: 2-opt restricted to a window around each zone boundary
+    return two_opt_window(matrix, route, boundaries)
+
+
+def two_opt_window(matrix, order, centres, window=8):
+    """2-opt moves whose segment starts within `window` stops of a centre position and spans at most 2*window stops"""
+    route = [0] + list(order)
+    n = len(route)
+    for centre in centres:
+        improved = True
+        while improved:
+            improved = False
+            for i in range(max(1, centre + 1 - window), min(n - 1, centre + 1 + window)):
+                for j in range(i + 1, min(n, i + 2 * window)):
+                    a, b = route[i - 1], route[i]
+                    c = route[j]
+                    d = route[j + 1] if j + 1 < n else None
+                    before = matrix[a, b] + (matrix[c, d] if d is not None else 0.0)
+                    after = matrix[a, c] + (matrix[b, d] if d is not None else 0.0)
+                    if after < before - 1e-9:
+                        route[i:j + 1] = reversed(route[i:j + 1])
+                        improved = True
+    return route[1:]
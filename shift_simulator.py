@@ -0,0 +1,262 @@
+import argparse
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from horizon_planner import DEFAULT_SUCCESS_RATE, slot_hour, success_table
+from redelivery import MAX_ATTEMPTS
+from slot_rankings import DAYS
+
+ROUTING_STRATEGIES = ('slot_aware', 'distance')
+REDELIVERY_POLICIES = ('drop', 'next_day', 'best_day')
+
+
+def build_model(predictor):
+    """
+    Plain-array snapshot of the predictor for worker processes
+
+    Returns:
+    - Dictionary with `names`, `area_of` (area index per customer),
+      `success` (customers x 7 days x 24 hours) and `travel` (minutes between
+      the depot, index 0, and each area, 1..A)
+    """
+    tables = predictor.model_tables
+    names = sorted(tables.rate_by_name_time)
+    slots = sorted({time for times in tables.rate_by_name_time.values() for time in times}, key=slot_hour)
+
+    # Hours without any recorded slot keep the default rate
+    success = np.full((len(names), len(DAYS), 24), DEFAULT_SUCCESS_RATE)
+    success[:, :, [slot_hour(slot) for slot in slots]] = success_table(tables, names, DAYS, slots, predictor.customer_areas.get)
+
+    areas = sorted({predictor.customer_areas.get(name) for name in names} - {None})
+    area_index = {area: a + 1 for a, area in enumerate(areas)}
+    representative = {}
+    for name in names:
+        representative.setdefault(predictor.customer_areas.get(name), predictor.customer_addresses.get(name))
+    addresses = [predictor.default_location] + [representative[area] for area in areas]
+    address_areas = [None] + areas
+    travel = np.zeros((len(addresses), len(addresses)))
+    for a, origin in enumerate(addresses):
+        for b, destination in enumerate(addresses):
+            if a != b:
+                travel[a, b] = predictor.get_driving_distance(origin, destination, address_areas[a], address_areas[b])['duration']
+            else:
+                travel[a, b] = 5
+
+    return {
+        'names': names,
+        'areas': areas,
+        'area_of': np.array([area_index.get(predictor.customer_areas.get(name), 1) for name in names], dtype=int),
+        'success': success,
+        'travel': travel
+    }
+
+
+def simulate_shift(model, stops, day, rng, strategy='slot_aware', start_hour=9, end_hour=18,
+                   service_minutes=3.0, risk_weight=30.0, travel_noise=0.2):
+    """
+    Simulate one courier shift
+
+    Parameters:
+    - model: Dictionary from build_model
+    - stops: Dictionary of customer index -> parcel count
+    - day: Day of the week index (0 = Monday)
+    - rng: numpy Generator
+    - strategy: 'slot_aware' (travel + risk_weight x failure risk at the
+      current hour, like the live dispatcher) or 'distance' (travel only)
+
+    Returns:
+    - (delivered, failed, not_visited, minutes): parcel counts per customer
+      index for delivered / failed stops, the stops left when the shift ended,
+      and the shift length
+    """
+    area_of = model['area_of']
+    travel = model['travel']
+    success = model['success']
+
+    remaining = np.array(sorted(stops), dtype=int)
+    location = 0
+    clock = start_hour * 60.0
+    delivered = {}
+    failed = {}
+    while len(remaining) and clock < end_hour * 60:
+        hour = int(clock // 60) % 24
+        legs = travel[location, area_of[remaining]]
+        score = legs + risk_weight * (1 - success[remaining, day, hour]) if strategy == 'slot_aware' else legs
+        pick = int(np.argmin(score))
+        customer = int(remaining[pick])
+
+        clock += legs[pick] * rng.lognormal(0.0, travel_noise) + service_minutes
+        arrival_hour = int(clock // 60) % 24
+        if rng.random() < success[customer, day, arrival_hour]:
+            delivered[customer] = stops[customer]
+        else:
+            failed[customer] = stops[customer]
+        location = int(area_of[customer])
+        remaining = np.delete(remaining, pick)
+
+    not_visited = {int(c): stops[int(c)] for c in remaining}
+    # Drive back to the depot
+    clock += travel[location, 0]
+    return delivered, failed, not_visited, clock - start_hour * 60
+
+
+def simulate_run(args):
+    """
+    Simulate consecutive days of one scenario (runs in a worker process)
+
+    New orders arrive every day (Poisson, uniform over customers). Stops not
+    reached by the end of a shift carry over to the next day; failed parcels
+    follow the redelivery policy: 'drop' loses them, 'next_day' retries the
+    next day and 'best_day' retries on the day in the next three with the
+    best success rate, each up to MAX_ATTEMPTS attempts.
+
+    Returns:
+    - Dictionary of totals for the run
+    """
+    model, scenario, seed = args
+    rng = np.random.default_rng(seed)
+    n_customers = len(model['names'])
+    success_by_day = model['success'].max(axis=2)
+
+    # day offset -> list of (customer, attempts) parcels
+    schedule = {}
+    totals = {'shifts': 0, 'parcels_delivered': 0, 'failed_attempts': 0, 'abandoned': 0, 'courier_minutes': 0.0}
+    for offset in range(scenario['days']):
+        day = (scenario['start_day'] + offset) % 7
+        parcels = schedule.pop(offset, [])
+        parcels.extend((int(c), 1) for c in rng.integers(0, n_customers, rng.poisson(scenario['orders_per_day'])))
+        if not parcels:
+            continue
+
+        stops = {}
+        attempts = {}
+        for customer, attempt in parcels:
+            stops[customer] = stops.get(customer, 0) + 1
+            attempts.setdefault(customer, []).append(attempt)
+
+        delivered, failed, not_visited, minutes = simulate_shift(
+            model, stops, day, rng,
+            strategy=scenario['strategy'],
+            start_hour=scenario['start_hour'],
+            end_hour=scenario['end_hour'],
+            service_minutes=scenario['service_minutes']
+        )
+        totals['shifts'] += 1
+        totals['courier_minutes'] += minutes
+        totals['parcels_delivered'] += sum(delivered.values())
+        totals['failed_attempts'] += sum(failed.values())
+
+        for customer in not_visited:
+            schedule.setdefault(offset + 1, []).extend((customer, attempt) for attempt in attempts[customer])
+        for customer in failed:
+            for attempt in attempts[customer]:
+                if scenario['redelivery'] == 'drop' or attempt >= MAX_ATTEMPTS:
+                    totals['abandoned'] += 1
+                    continue
+                if scenario['redelivery'] == 'next_day':
+                    retry = offset + 1
+                else:
+                    ahead = [(day + k) % 7 for k in range(1, 4)]
+                    retry = offset + 1 + int(np.argmax(success_by_day[customer, ahead]))
+                schedule.setdefault(retry, []).append((customer, attempt + 1))
+
+    totals['backlog'] = sum(len(parcels) for parcels in schedule.values())
+    return totals
+
+
+def run_scenarios(model, scenarios, runs=100, workers=None, seed=0):
+    """
+    Run every scenario `runs` times in a process pool and aggregate the results
+
+    Parameters:
+    - model: Dictionary from build_model
+    - scenarios: List of scenario dicts (strategy, redelivery, days,
+      orders_per_day, start_day, start_hour, end_hour, service_minutes)
+    - runs: Independent runs per scenario
+    - workers: Worker processes (defaults to the CPU count)
+
+    Returns:
+    - List of per-scenario reports with totals, rates and the simulated shift throughput
+    """
+    for scenario in scenarios:
+        if scenario['strategy'] not in ROUTING_STRATEGIES or scenario['redelivery'] not in REDELIVERY_POLICIES:
+            raise ValueError(f"Unknown strategy or redelivery policy: {scenario['strategy']} / {scenario['redelivery']}")
+    jobs = [(model, scenario, seed + s * runs + r) for s, scenario in enumerate(scenarios) for r in range(runs)]
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(simulate_run, jobs, chunksize=max(1, len(jobs) // (4 * (workers or 4)))))
+    elapsed = time.time() - started
+
+    reports = []
+    for s, scenario in enumerate(scenarios):
+        runs_totals = results[s * runs:(s + 1) * runs]
+        totals = {key: sum(run[key] for run in runs_totals) for key in runs_totals[0]}
+        attempts = totals['parcels_delivered'] + totals['failed_attempts']
+        hours = totals['courier_minutes'] / 60
+        reports.append({
+            'scenario': scenario,
+            'runs': runs,
+            'shifts': totals['shifts'],
+            'parcels_delivered': totals['parcels_delivered'],
+            'failed_attempts': totals['failed_attempts'],
+            'abandoned': totals['abandoned'],
+            'backlog': totals['backlog'],
+            'success_rate': round(totals['parcels_delivered'] / attempts, 3) if attempts else None,
+            'courier_hours': round(hours, 1),
+            'parcels_per_courier_hour': round(totals['parcels_delivered'] / hours, 2) if hours else None
+        })
+    shifts = sum(report['shifts'] for report in reports)
+    for report in reports:
+        report['shifts_per_minute'] = round(shifts / elapsed * 60) if elapsed else None
+    return reports
+
+
+if __name__ == "__main__":
+    from delivery_predictor import DeliveryPredictor
+
+    parser = argparse.ArgumentParser(description='Compare routing and redelivery strategies on simulated shifts')
+    parser.add_argument('--strategies', default=','.join(ROUTING_STRATEGIES), help='Routing strategies to compare')
+    parser.add_argument('--redelivery', default=','.join(REDELIVERY_POLICIES), help='Redelivery policies to compare')
+    parser.add_argument('--days', type=int, default=30, help='Simulated days per run')
+    parser.add_argument('--runs', type=int, default=50, help='Runs per scenario')
+    parser.add_argument('--orders-per-day', type=float, default=40, help='Mean new orders per day')
+    parser.add_argument('--start-hour', type=int, default=9, help='Shift start hour')
+    parser.add_argument('--end-hour', type=int, default=18, help='Shift end hour')
+    parser.add_argument('--service-minutes', type=float, default=3.0, help='Minutes spent at each stop')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+    args = parser.parse_args()
+
+    # Read-only snapshot: leave the persisted pending orders alone
+    model = build_model(DeliveryPredictor(generate_orders=False))
+    scenarios = [
+        {
+            'strategy': strategy,
+            'redelivery': policy,
+            'days': args.days,
+            'orders_per_day': args.orders_per_day,
+            'start_day': 0,
+            'start_hour': args.start_hour,
+            'end_hour': args.end_hour,
+            'service_minutes': args.service_minutes
+        }
+        for strategy in args.strategies.split(',')
+        for policy in args.redelivery.split(',')
+    ]
+    reports = run_scenarios(model, scenarios, runs=args.runs, workers=args.workers, seed=args.seed)
+
+    for report in reports:
+        scenario = report['scenario']
+        print(f"{scenario['strategy']:>10} / {scenario['redelivery']:<8} "
+              f"success {report['success_rate']}, delivered {report['parcels_delivered']}, "
+              f"failed {report['failed_attempts']}, abandoned {report['abandoned']}, "
+              f"{report['courier_hours']} courier hours, {report['parcels_per_courier_hour']} parcels/hour")
+    print(f"Simulated {sum(r['shifts'] for r in reports)} shifts ({reports[0]['shifts_per_minute']} per minute)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
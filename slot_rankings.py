@@ -0,0 +1,88 @@
+import numpy as np
+
+from horizon_planner import slot_hour, success_table
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+
+class SlotRankings:
+    """
+    Customers ranked by success probability for every (day, slot)
+
+    The inverse of predict_optimal_times: for each day of the week and time
+    slot, customer ids are kept sorted by their model success probability,
+    once overall and once per area. A top-k query is a slice of a sorted
+    array, so its cost depends on k, not on the number of customers.
+
+    Probabilities come from the compiled success model in the published
+    ModelTables (parcel size unknown, as in the horizon planner). Customers
+    without history are ranked by their area's prediction. Real-time
+    adjustments are not included.
+
+    The model is one global regression, so a retrain moves every customer:
+    a new model version is always ranked from scratch.
+
+    Parameters:
+    - tables: ModelTables snapshot
+    - names: Customers to rank (the registry)
+    - area_of: Callable returning a customer's area
+    """
+
+    def __init__(self, tables, names, area_of):
+        self.version = tables.version
+        self.slots = sorted({time for times in tables.rate_by_name_time.values() for time in times}, key=slot_hour)
+        self._slot_index = {slot: s for s, slot in enumerate(self.slots)}
+        self.names = sorted(names)
+        self.areas = [area_of(name) for name in self.names]
+        self.customer_index = {name: i for i, name in enumerate(self.names)}
+
+        # success[c, d, s]; the rankings below are sorted views of it
+        self.success = success_table(tables, self.names, DAYS, self.slots, area_of).astype(np.float32)
+        self.ranked = self._rank(np.arange(len(self.names)))
+        self.ranked_by_area = {}
+        for area in sorted({area for area in self.areas if area is not None}):
+            members = np.array([i for i, a in enumerate(self.areas) if a == area], dtype=np.int32)
+            self.ranked_by_area[area] = self._rank(members)
+
+    def _rank(self, members):
+        """Member ids sorted by descending probability, shape (days, slots, len(members))"""
+        if not len(members):
+            return np.zeros((len(DAYS), len(self.slots), 0), dtype=np.int32)
+        probabilities = self.success[members].transpose(1, 2, 0)
+        # Stable sort on the negated probability keeps ties in name order
+        order = np.argsort(-probabilities, axis=2, kind='stable')
+        return np.asarray(members, dtype=np.int32)[order]
+
+    def top(self, day, slot, k=10, area=None, offset=0):
+        """
+        The customers most likely to accept a delivery in a slot
+
+        Parameters:
+        - day: Day name (e.g. 'Monday')
+        - slot: Slot label (e.g. '3 PM')
+        - k: Number of customers
+        - area: Restrict to one area
+        - offset: Skip this many (for paging)
+
+        Returns:
+        - List of {'name', 'area', 'success_probability'}, most likely first;
+          empty for unknown days, slots or areas
+        """
+        if day not in DAYS or slot not in self._slot_index:
+            return []
+        ranked = self.ranked if area is None else self.ranked_by_area.get(area)
+        if ranked is None:
+            return []
+        d, s = DAYS.index(day), self._slot_index[slot]
+        ids = ranked[d, s, offset:offset + k]
+        return [
+            {'name': self.names[i], 'area': self.areas[i], 'success_probability': round(float(self.success[i, d, s]), 3)}
+            for i in ids
+        ]
+
+    def count(self, area=None):
+        """Number of ranked customers (overall or in an area)"""
+        if area is None:
+            return len(self.names)
+        ranked = self.ranked_by_area.get(area)
+        return ranked.shape[2] if ranked is not None else 0
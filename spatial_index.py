@@ -0,0 +1,170 @@
+import heapq
+import math
+
+import numpy as np
+
+# Kilometres per degree of latitude (longitude is scaled by cos(latitude))
+KM_PER_DEGREE = 111.32
+
+# Points per leaf; leaves are scanned with one vectorised distance computation
+LEAF_SIZE = 16
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+class SpatialIndex:
+    """
+    Static KD-tree over labelled latitude/longitude points
+
+    Points are projected onto a local plane in kilometres (equirectangular
+    around the mean latitude, accurate to well under 1% across a city) and
+    stored in an implicit KD-tree: a single permutation of the point array
+    where each range's median splits it on alternating axes. Nearest-k,
+    radius and bounding-box queries visit only the branches that can hold a
+    match, so they run in roughly logarithmic time instead of scanning every
+    point.
+
+    Parameters:
+    - points: Iterable of (label, lat, lon)
+    """
+
+    def __init__(self, points):
+        points = list(points)
+        self.labels = [label for label, _, _ in points]
+        coords = np.array([(lat, lon) for _, lat, lon in points], dtype=float).reshape(-1, 2)
+        self.latlon = coords
+        self.ref_lat = float(coords[:, 0].mean()) if len(coords) else 0.0
+        self._lon_scale = KM_PER_DEGREE * math.cos(math.radians(self.ref_lat))
+        self.xy = self._project(coords[:, 0], coords[:, 1])
+        self.order = np.arange(len(points))
+        self._build()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _project(self, lat, lon):
+        return np.column_stack((np.asarray(lon, dtype=float) * self._lon_scale, np.asarray(lat, dtype=float) * KM_PER_DEGREE))
+
+    def _build(self):
+        """Arrange self.order so every range's median splits it (iterative, no recursion limit)"""
+        stack = [(0, len(self.order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                continue
+            axis = depth % 2
+            mid = (lo + hi) // 2
+            segment = self.order[lo:hi]
+            self.order[lo:hi] = segment[np.argpartition(self.xy[segment, axis], mid - lo)]
+            stack.append((lo, mid, depth + 1))
+            stack.append((mid + 1, hi, depth + 1))
+        # Keep the points in tree order so leaves are contiguous in memory
+        self._tree_xy = self.xy[self.order]
+
+    def nearest(self, lat, lon, k=1, exclude=None):
+        """
+        The k points closest to a location
+
+        Parameters:
+        - lat, lon: Query location
+        - k: Number of neighbours
+        - exclude: Optional set of labels to skip (e.g. stops already visited)
+
+        Returns:
+        - List of (label, distance_km), closest first
+        """
+        if k <= 0 or not len(self.order):
+            return []
+        query = self._project(lat, lon)[0]
+        heap = []  # max-heap of (-squared distance, position)
+
+        def consider(positions, sq_dists):
+            for position, sq in zip(positions, sq_dists):
+                if exclude and self.labels[self.order[position]] in exclude:
+                    continue
+                if len(heap) < k:
+                    heapq.heappush(heap, (-sq, position))
+                elif sq < -heap[0][0]:
+                    heapq.heapreplace(heap, (-sq, position))
+
+        stack = [(0, len(self.order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                sq = ((self._tree_xy[lo:hi] - query) ** 2).sum(axis=1)
+                consider(range(lo, hi), sq)
+                continue
+            axis = depth % 2
+            mid = (lo + hi) // 2
+            diff = query[axis] - self._tree_xy[mid, axis]
+            consider([mid], [((self._tree_xy[mid] - query) ** 2).sum()])
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            # Far side is pushed first so the near side is searched first
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                stack.append((far[0], far[1], depth + 1))
+            stack.append((near[0], near[1], depth + 1))
+
+        result = sorted((-neg_sq, position) for neg_sq, position in heap)
+        return [(self.labels[self.order[position]], math.sqrt(sq)) for sq, position in result]
+
+    def within_radius(self, lat, lon, radius_km):
+        """All points within radius_km of a location, as (label, distance_km) sorted by distance"""
+        if not len(self.order):
+            return []
+        query = self._project(lat, lon)[0]
+        limit = radius_km * radius_km
+        found = []
+
+        stack = [(0, len(self.order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                sq = ((self._tree_xy[lo:hi] - query) ** 2).sum(axis=1)
+                found.extend((float(s), lo + i) for i, s in enumerate(sq) if s <= limit)
+                continue
+            axis = depth % 2
+            mid = (lo + hi) // 2
+            diff = query[axis] - self._tree_xy[mid, axis]
+            sq = float(((self._tree_xy[mid] - query) ** 2).sum())
+            if sq <= limit:
+                found.append((sq, mid))
+            if diff >= -radius_km:
+                stack.append((mid + 1, hi, depth + 1))
+            if diff <= radius_km:
+                stack.append((lo, mid, depth + 1))
+
+        found.sort()
+        return [(self.labels[self.order[position]], math.sqrt(sq)) for sq, position in found]
+
+    def within_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Labels of all points inside a latitude/longitude bounding box"""
+        if not len(self.order):
+            return []
+        low = self._project(min_lat, min_lon)[0]
+        high = self._project(max_lat, max_lon)[0]
+        found = []
+
+        stack = [(0, len(self.order), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            if hi - lo <= LEAF_SIZE:
+                block = self._tree_xy[lo:hi]
+                inside = np.all((block >= low) & (block <= high), axis=1)
+                found.extend(lo + np.flatnonzero(inside))
+                continue
+            axis = depth % 2
+            mid = (lo + hi) // 2
+            point = self._tree_xy[mid]
+            if np.all((point >= low) & (point <= high)):
+                found.append(mid)
+            if point[axis] <= high[axis]:
+                stack.append((mid + 1, hi, depth + 1))
+            if point[axis] >= low[axis]:
+                stack.append((lo, mid, depth + 1))
+
+        return [self.labels[self.order[position]] for position in sorted(found)]
@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+
+import pandas as pd
+
+from order_store import OrderStore
+
+ORDER_COLUMNS = ['order_id', 'name', 'delivery_day', 'area', 'address', 'package_size', 'status', 'created_at']
+
+# Column names used by dataset.csv, in file order
+HISTORY_COLUMNS = {
+    'name': 'Name',
+    'day': 'Day of Delivery Attempt',
+    'time': 'Time',
+    'area': 'Area',
+    'package_size': 'Package Size',
+    'status': 'Delivery Status'
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    delivery_day TEXT NOT NULL,
+    area TEXT,
+    address TEXT,
+    package_size TEXT,
+    status TEXT NOT NULL DEFAULT 'Pending',
+    created_at TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_orders_delivery_day ON orders (delivery_day);
+CREATE INDEX IF NOT EXISTS idx_orders_name ON orders (name);
+
+CREATE TABLE IF NOT EXISTS delivery_attempts (
+    attempt_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    order_id INTEGER,
+    name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    time TEXT NOT NULL,
+    area TEXT,
+    package_size TEXT,
+    status TEXT NOT NULL,
+    attempted_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_attempts_name ON delivery_attempts (name);
+CREATE INDEX IF NOT EXISTS idx_attempts_attempted_at ON delivery_attempts (attempted_at);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteOrderStore:
+    """
+    Pending orders and delivery attempts in an embedded SQLite database
+
+    Same interface as OrderStore, plus `complete()` which removes an order
+    and records its delivery attempt in one transaction, so orders and
+    history can no longer drift apart after a crash. The database runs in
+    WAL mode: each thread gets its own connection and readers are never
+    blocked by a writer.
+
+    The id allocator is persisted in the `meta` table and only moves
+    forward, so ids of delivered or removed orders are never handed out
+    again, across restarts and processes sharing the database.
+
+    Parameters:
+    - db_path: SQLite database file
+    - first_order_id: Id handed out when the store is empty
+    """
+    records_attempts = True
+
+    def __init__(self, db_path='delivery.db', first_order_id=10000):
+        self.db_path = db_path
+        self.first_order_id = first_order_id
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+
+        self._connection().executescript(SCHEMA)
+
+    def _connection(self):
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        """Run work(conn) inside a single write transaction"""
+        with self._write_lock:
+            conn = self._connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(conn)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+
+    def load(self):
+        """Bring the persisted id allocator past every id in the database"""
+        def work(conn):
+            # Databases from before the allocator was persisted: start past every pending and attempted order
+            attempted = conn.execute('SELECT MAX(order_id) FROM delivery_attempts').fetchone()[0] or 0
+            self._raise_allocator(conn, attempted + 1)
+        self._transaction(work)
+        return self
+
+    def reset(self, orders):
+        """Replace all pending orders (delivery history and the id allocator are kept)"""
+        def work(conn):
+            conn.execute('DELETE FROM orders')
+            conn.executemany(self._insert_sql(), [self._order_row(o) for o in orders])
+            self._raise_allocator(conn, max([o['order_id'] + 1 for o in orders], default=0))
+        self._transaction(work)
+
+    def next_order_id(self):
+        """Allocate a new order id"""
+        def work(conn):
+            order_id = self._raise_allocator(conn, 0)
+            conn.execute("UPDATE meta SET value = ? WHERE key = 'next_order_id'", (order_id + 1,))
+            return order_id
+        return self._transaction(work)
+
+    def add(self, order):
+        """Insert an order"""
+        self.add_many([order])
+
+    def add_many(self, orders):
+        """
+        Insert a batch of new orders in one transaction
+
+        Raises:
+        - ValueError if an order id is already pending (use update_many to replace orders)
+        """
+        rows = [self._order_row(o) for o in orders]
+        ids = [o['order_id'] for o in orders]
+
+        def work(conn):
+            pending = set()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                pending.update(row[0] for row in conn.execute(
+                    f"SELECT order_id FROM orders WHERE order_id IN ({', '.join('?' * len(chunk))})", chunk
+                ))
+            repeated = [order_id for order_id, count in Counter(ids).items() if count > 1]
+            if pending or repeated:
+                raise ValueError(f"Order ids already pending: {sorted(pending.union(repeated))}")
+            conn.executemany(self._insert_sql(), rows)
+            self._raise_allocator(conn, max(ids, default=-1) + 1)
+        self._transaction(work)
+
+    def update_many(self, orders):
+        """Replace existing orders (matched by order_id) in one transaction"""
+        rows = [self._order_row(o) for o in orders]
+        self._transaction(lambda conn: conn.executemany(self._insert_sql(upsert=True), rows))
+
+    def remove(self, order_id):
+        """Remove an order without recording an attempt. Returns the removed order or None."""
+        def work(conn):
+            order = self._fetch_one(conn, order_id)
+            if order is not None:
+                conn.execute('DELETE FROM orders WHERE order_id = ?', (order_id,))
+            return order
+        return self._transaction(work)
+
+    def complete(self, order_id, attempt):
+        """
+        Remove an order and record its delivery attempt atomically
+
+        Parameters:
+        - order_id: Id of the pending order
+        - attempt: Row in dataset.csv format ('Name', 'Day of Delivery Attempt', ...)
+
+        Returns:
+        - The removed order, or None if it was not pending
+        """
+        def work(conn):
+            order = self._fetch_one(conn, order_id)
+            if order is None:
+                return None
+            conn.execute('DELETE FROM orders WHERE order_id = ?', (order_id,))
+            conn.execute(
+                'INSERT INTO delivery_attempts (order_id, name, day, time, area, package_size, status, attempted_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (order_id,) + self._attempt_row(attempt)
+            )
+            return order
+        return self._transaction(work)
+
+    def record_attempts(self, attempts):
+        """Insert delivery attempts in a single transaction"""
+        rows = [(None,) + self._attempt_row(a) for a in attempts]
+        self._transaction(lambda conn: conn.executemany(
+            'INSERT INTO delivery_attempts (order_id, name, day, time, area, package_size, status, attempted_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            rows
+        ))
+
+    def get(self, order_id):
+        """Look up an order by id"""
+        return self._fetch_one(self._connection(), order_id)
+
+    def all(self):
+        """All pending orders in id order"""
+        return self._fetch_many('SELECT * FROM orders ORDER BY order_id')
+
+    def by_day(self, day):
+        """Pending orders for a delivery day"""
+        return self._fetch_many('SELECT * FROM orders WHERE delivery_day = ? ORDER BY order_id', (day,))
+
+    def by_customer(self, name):
+        """Pending orders for a customer"""
+        return self._fetch_many('SELECT * FROM orders WHERE name = ? ORDER BY order_id', (name,))
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM orders').fetchone()[0]
+
+    def attempt_count(self):
+        """Number of recorded delivery attempts"""
+        return self._connection().execute('SELECT COUNT(*) FROM delivery_attempts').fetchone()[0]
+
+    def load_history(self):
+        """Delivery attempts as a DataFrame with the dataset.csv columns plus `Date` (None for migrated rows)"""
+        select = ', '.join(f'{column} AS "{label}"' for column, label in HISTORY_COLUMNS.items())
+        select += ', substr(attempted_at, 1, 10) AS "Date"'
+        return pd.read_sql_query(f'SELECT {select} FROM delivery_attempts ORDER BY attempt_id', self._connection())
+
+    def migrate_from_files(self, orders_path='pending_orders.json', dataset_path='dataset.csv'):
+        """
+        Import the file-based state: pending orders (snapshot + journal) and dataset.csv
+
+        Orders are upserted, attempts are only imported into an empty
+        attempts table so the migration can be re-run safely.
+
+        Returns:
+        - Tuple of (orders imported, attempts imported)
+        """
+        orders = []
+        next_id = 0
+        if os.path.exists(orders_path):
+            file_store = OrderStore(orders_path).load()
+            orders = file_store.all()
+            # Carry over the file store's allocator so ids of its delivered orders stay retired
+            next_id = file_store.next_order_id()
+
+        attempts = []
+        if os.path.exists(dataset_path) and self.attempt_count() == 0:
+            attempts = pd.read_csv(dataset_path).to_dict('records')
+
+        def work(conn):
+            conn.executemany(self._insert_sql(upsert=True), [self._order_row(o) for o in orders])
+            conn.executemany(
+                'INSERT INTO delivery_attempts (order_id, name, day, time, area, package_size, status, attempted_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                [(None,) + self._attempt_row(a, attempted_at=None) for a in attempts]
+            )
+            self._raise_allocator(conn, max([next_id] + [o['order_id'] + 1 for o in orders]))
+        self._transaction(work)
+
+        return len(orders), len(attempts)
+
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _raise_allocator(self, conn, floor):
+        """
+        Move the persisted allocator to at least floor and past every pending order (inside a transaction)
+
+        Returns:
+        - The next id to hand out
+        """
+        row = conn.execute("SELECT value FROM meta WHERE key = 'next_order_id'").fetchone()
+        highest = conn.execute('SELECT MAX(order_id) FROM orders').fetchone()[0]
+        next_id = max(self.first_order_id, floor, (highest or 0) + 1, row[0] if row else 0)
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('next_order_id', ?)", (next_id,))
+        return next_id
+
+    def _insert_sql(self, upsert=False):
+        verb = 'INSERT OR REPLACE' if upsert else 'INSERT'
+        return f"{verb} INTO orders ({', '.join(ORDER_COLUMNS)}, extra) VALUES ({', '.join('?' * (len(ORDER_COLUMNS) + 1))})"
+
+    def _order_row(self, order):
+        # Fields without a dedicated column are kept as JSON so no order data is lost
+        extra = {k: v for k, v in order.items() if k not in ORDER_COLUMNS}
+        return tuple(order.get(column) for column in ORDER_COLUMNS) + (json.dumps(extra) if extra else None,)
+
+    def _attempt_row(self, attempt, attempted_at=''):
+        if attempted_at == '':
+            attempted_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return tuple(attempt.get(label) for label in HISTORY_COLUMNS.values()) + (attempted_at,)
+
+    def _row_to_order(self, row):
+        order = {column: row[column] for column in ORDER_COLUMNS}
+        if row['extra']:
+            order.update(json.loads(row['extra']))
+        return order
+
+    def _fetch_one(self, conn, order_id):
+        row = conn.execute('SELECT * FROM orders WHERE order_id = ?', (order_id,)).fetchone()
+        return self._row_to_order(row) if row is not None else None
+
+    def _fetch_many(self, sql, params=()):
+        return [self._row_to_order(row) for row in self._connection().execute(sql, params)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Migrate pending orders and delivery history into SQLite')
+    parser.add_argument('--db', default='delivery.db', help='SQLite database to create or update')
+    parser.add_argument('--orders', default='pending_orders.json', help='Pending orders snapshot')
+    parser.add_argument('--dataset', default='dataset.csv', help='Delivery history CSV')
+    args = parser.parse_args()
+
+    store = SQLiteOrderStore(args.db)
+    imported_orders, imported_attempts = store.migrate_from_files(args.orders, args.dataset)
+    print(f"Imported {imported_orders} pending orders and {imported_attempts} delivery attempts into {args.db}")
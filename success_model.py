@@ -0,0 +1,274 @@
+import numpy as np
+import pandas as pd
+
+from horizon_planner import slot_hour
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Feature groups: single columns are main effects, tuples are interactions
+FEATURE_GROUPS = ['name', 'area', 'day', 'time', 'size', ('name', 'time'), ('name', 'day')]
+
+HISTORY_COLUMNS = {
+    'Name': 'name',
+    'Day of Delivery Attempt': 'day',
+    'Time': 'time',
+    'Area': 'area',
+    'Package Size': 'size'
+}
+
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-np.clip(x, -30, 30)))
+
+
+class SuccessModel:
+    """
+    L2-regularised logistic regression of delivery success, compiled to a lookup table
+
+    The model is trained on one-hot main effects for customer, area, day,
+    time slot and package size plus customer x time and customer x day
+    interactions. Identical attempts are grouped first and fitted as binomial
+    counts, so training cost depends on the number of distinct combinations
+    rather than the raw history size. Fitting uses Newton steps solved by
+    conjugate gradients (Hessian-vector products through the sparse feature
+    columns) with a backtracking line search, in NumPy.
+
+    After training, every (customer, day, slot, size) combination is scored
+    once into a dense float32 table, using the customer's fixed area. At
+    serving time a prediction is a single array index. The last size column
+    is the size-frequency-weighted average, for when the parcel size is
+    unknown. Customers without history fall back to per-area rows without
+    the customer terms.
+
+    Parameters:
+    - l2: Regularisation strength (also shrinks rarely seen customers towards their area)
+    - iterations: Maximum Newton iterations
+    - tolerance: Stop when the largest weight update is below this
+    """
+
+    def __init__(self, l2=1.0, iterations=200, tolerance=1e-5):
+        self.l2 = l2
+        self.iterations = iterations
+        self.tolerance = tolerance
+
+    def fit(self, df):
+        """Train on a history DataFrame with the dataset.csv columns (and optional `Count`)"""
+        frame = df[list(HISTORY_COLUMNS)].rename(columns=HISTORY_COLUMNS).astype(str)
+        counts = df['Count'].astype(float) if 'Count' in df.columns else pd.Series(1.0, index=df.index)
+        frame['successes'] = (df['Delivery Status'] == 'Success').astype(float) * counts
+        frame['attempts'] = counts
+        grouped = frame.groupby(list(HISTORY_COLUMNS.values()), sort=False)[['successes', 'attempts']].sum().reset_index()
+
+        self.vocab = {column: sorted(grouped[column].unique()) for column in HISTORY_COLUMNS.values()}
+        self.vocab['day'] = [day for day in DAYS if day in set(self.vocab['day'])] + sorted(set(self.vocab['day']) - set(DAYS))
+        self.vocab['time'] = sorted(self.vocab['time'], key=slot_hour)
+        codes = {
+            column: pd.Categorical(grouped[column], categories=self.vocab[column]).codes.astype(np.int64)
+            for column in HISTORY_COLUMNS.values()
+        }
+
+        # Column index of every active feature: the bias (column 0), then one per group
+        self.offsets = {}
+        columns = [np.zeros(len(grouped), dtype=np.int64)]
+        offset = 1
+        for group in FEATURE_GROUPS:
+            index, size = self._group_index(group, codes)
+            self.offsets[group] = offset
+            columns.append(index + offset)
+            offset += size
+        active = np.stack(columns, axis=1)
+        flat = active.ravel()
+        k = active.shape[1]
+
+        successes = grouped['successes'].to_numpy()
+        attempts = grouped['attempts'].to_numpy()
+        weights = np.zeros(offset)
+        weights[0] = np.log((successes.sum() + 1) / (attempts.sum() - successes.sum() + 1))
+        penalty = np.full(offset, self.l2)
+        penalty[0] = 0.0
+
+        def loss(w):
+            z = w[active].sum(axis=1)
+            return float((attempts * np.logaddexp(0, z) - successes * z).sum() + 0.5 * (penalty * w * w).sum())
+
+        current = loss(weights)
+        for _ in range(self.iterations):
+            p = _sigmoid(weights[active].sum(axis=1))
+            gradient = np.bincount(flat, weights=np.repeat(attempts * p - successes, k), minlength=offset) + penalty * weights
+            curvature = attempts * p * (1 - p)
+            step = self._newton_step(active, flat, k, offset, curvature, penalty, gradient)
+
+            # Backtracking line search on the penalised log-likelihood
+            scale = 1.0
+            while scale > 1e-4:
+                candidate = weights - scale * step
+                candidate_loss = loss(candidate)
+                if candidate_loss <= current - 1e-4 * scale * gradient.dot(step):
+                    break
+                scale /= 2
+            weights, current = candidate, candidate_loss
+            if np.abs(scale * step).max() < self.tolerance:
+                break
+
+        self.bias = float(weights[0])
+        self.weights = weights
+        self.size_weights = np.bincount(codes['size'], weights=attempts, minlength=len(self.vocab['size']))
+        self.size_weights /= self.size_weights.sum()
+        return self
+
+    def _newton_step(self, active, flat, k, offset, curvature, penalty, gradient, iterations=50):
+        """
+        Solve H step = gradient by preconditioned conjugate gradients
+
+        The Hessian X'WX + diag(penalty) is never formed: each product only
+        gathers and scatters through the active feature columns.
+        """
+        def hessian_product(v):
+            return np.bincount(flat, weights=np.repeat(curvature * v[active].sum(axis=1), k), minlength=offset) + penalty * v
+
+        diagonal = np.bincount(flat, weights=np.repeat(curvature, k), minlength=offset) + penalty + 1e-9
+        step = np.zeros(offset)
+        residual = gradient.copy()
+        preconditioned = residual / diagonal
+        direction = preconditioned.copy()
+        rho = residual.dot(preconditioned)
+        for _ in range(iterations):
+            product = hessian_product(direction)
+            alpha = rho / max(direction.dot(product), 1e-12)
+            step += alpha * direction
+            residual -= alpha * product
+            if np.abs(residual).max() < 1e-3 * self.tolerance:
+                break
+            preconditioned = residual / diagonal
+            rho, previous = residual.dot(preconditioned), rho
+            direction = preconditioned + (rho / previous) * direction
+        return step
+
+    def _group_index(self, group, codes):
+        if isinstance(group, tuple):
+            first, second = group
+            width = len(self.vocab[second])
+            return codes[first] * width + codes[second], len(self.vocab[first]) * width
+        return codes[group], len(self.vocab[group])
+
+    def _group_weights(self, group):
+        """Weights of a feature group reshaped to its categorical dimensions"""
+        start = self.offsets[group]
+        if isinstance(group, tuple):
+            shape = tuple(len(self.vocab[column]) for column in group)
+        else:
+            shape = (len(self.vocab[group]),)
+        return self.weights[start:start + int(np.prod(shape))].reshape(shape)
+
+    def compile(self, area_of):
+        """
+        Score every (customer, day, slot, size) once into a dense probability table
+
+        Parameters:
+        - area_of: Callable giving a customer's fixed area (history rows may
+          name other areas; serving uses the registry's)
+
+        Returns:
+        - CompiledSuccessModel
+        """
+        names = self.vocab['name']
+        areas = self.vocab['area']
+        area_position = {area: i for i, area in enumerate(areas)}
+        w_name = self._group_weights('name')
+        w_area = self._group_weights('area')
+        w_day = self._group_weights('day')
+        w_time = self._group_weights('time')
+        w_size = self._group_weights('size')
+        w_name_time = self._group_weights(('name', 'time'))
+        w_name_day = self._group_weights(('name', 'day'))
+
+        # Shared terms, shape (day, time, size)
+        common = self.bias + w_day[:, None, None] + w_time[None, :, None] + w_size[None, None, :]
+
+        customer_area = np.array([area_position.get(area_of(name), -1) for name in names])
+        area_term = np.where(customer_area >= 0, w_area[np.maximum(customer_area, 0)], 0.0)
+        logits = (
+            common[None, :, :, :]
+            + (w_name + area_term)[:, None, None, None]
+            + w_name_day[:, :, None, None]
+            + w_name_time[:, None, :, None]
+        )
+        table = self._with_any_size(_sigmoid(logits))
+
+        # Customers without history: area effect only
+        area_table = self._with_any_size(_sigmoid(common[None, :, :, :] + w_area[:, None, None, None]))
+        return CompiledSuccessModel(names, areas, self.vocab['day'], self.vocab['time'], self.vocab['size'], table, area_table)
+
+    def _with_any_size(self, probabilities):
+        """Append the size-weighted average as an extra last size column"""
+        average = (probabilities * self.size_weights).sum(axis=-1, keepdims=True)
+        return np.concatenate([probabilities, average], axis=-1).astype(np.float32)
+
+
+class CompiledSuccessModel:
+    """
+    Dense success-probability table: [customer, day, slot, size]
+
+    Built by SuccessModel.compile; read-only, so it can be shared freely
+    between threads and published as part of ModelTables.
+    """
+
+    def __init__(self, names, areas, days, slots, sizes, table, area_table):
+        self.names = names
+        self.slots = slots
+        self.slot_index = {slot: i for i, slot in enumerate(slots)}
+        self.table = table
+        self.area_table = area_table
+        self.name_index = {name: i for i, name in enumerate(names)}
+        self.area_index = {area: i for i, area in enumerate(areas)}
+        self.day_index = {day: i for i, day in enumerate(days)}
+        self.size_index = {size: i for i, size in enumerate(sizes)}
+
+    def _rows(self, name, area):
+        if name in self.name_index:
+            return self.table[self.name_index[name]]
+        if area in self.area_index:
+            return self.area_table[self.area_index[area]]
+        return None
+
+    def slot_probabilities(self, name, day, package_size=None, area=None):
+        """
+        Success probability for every slot (in self.slots order) as one gather
+
+        Returns:
+        - float32 array over slots, or None if neither the customer nor the area is known
+        """
+        rows = self._rows(name, area)
+        if rows is None or day not in self.day_index:
+            return None
+        return rows[self.day_index[day], :, self.size_index.get(package_size, -1)]
+
+    def grid(self, names, days, slots, area_of=None):
+        """
+        Success probability for every (customer, day, slot), parcel size unknown
+
+        Parameters:
+        - names, days, slots: Labels of the three axes
+        - area_of: Callable giving a customer's area, for customers without history
+
+        Returns:
+        - float32 array of shape (len(names), len(days), len(slots)); NaN where
+          the customer (and area), day or slot is unknown
+        """
+        grid = np.full((len(names), len(days), len(slots)), np.nan, dtype=np.float32)
+        day_codes = np.array([self.day_index.get(day, -1) for day in days], dtype=np.int64)
+        slot_codes = np.array([self.slot_index.get(slot, -1) for slot in slots], dtype=np.int64)
+        known_days, known_slots = day_codes >= 0, slot_codes >= 0
+        cells = np.ix_(day_codes[known_days], slot_codes[known_slots])
+        for c, name in enumerate(names):
+            rows = self._rows(name, area_of(name) if area_of else None)
+            if rows is not None:
+                grid[c][np.ix_(known_days, known_slots)] = rows[..., -1][cells]
+        return grid
+
+    def probability(self, name, day, slot, package_size=None, area=None):
+        """Success probability of a single attempt, or None if unknown"""
+        probabilities = self.slot_probabilities(name, day, package_size, area)
+        if probabilities is None or slot not in self.slot_index:
+            return None
+        return float(probabilities[self.slot_index[slot]])
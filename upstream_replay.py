@@ -0,0 +1,232 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode
+
+import requests
+
+# Upstream mode is chosen through environment variables so the Flask app,
+# the predictor CLI and benchmark scripts all pick up the same behaviour:
+#   UPSTREAM_MODE=live|record|replay   (default: live)
+#   UPSTREAM_CASSETTE=upstream_cassette.jsonl
+#   UPSTREAM_REPLAY_LATENCY_MS=0        fixed latency added to every replayed call
+#   UPSTREAM_REPLAY_JITTER_MS=0         extra uniform random latency
+#   UPSTREAM_REPLAY_ERROR_RATE=0.0      fraction of replayed calls that fail
+#   UPSTREAM_REPLAY_ERROR_STATUS=       HTTP status for injected errors (empty = connection error)
+#   UPSTREAM_REPLAY_SEED=               seed for latency/error injection
+DEFAULT_CASSETTE_PATH = 'upstream_cassette.jsonl'
+
+
+def request_key(method, url, params=None, json_body=None):
+    """Build a stable lookup key for an upstream request"""
+    if params:
+        url = f"{url}?{urlencode(sorted(params.items()))}"
+    body = json.dumps(json_body, sort_keys=True) if json_body is not None else ''
+    return f"{method.upper()} {url} {body}"
+
+
+def _endpoint_key(method, url):
+    """Key that ignores the query string and body, used as a replay fallback"""
+    return f"{method.upper()} {url.split('?', 1)[0]}"
+
+
+class ReplayResponse:
+    """Minimal stand-in for requests.Response built from a recorded interaction"""
+
+    def __init__(self, status_code, text, headers=None, url=''):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+        self.url = url
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class LiveSession:
+    """Pass-through to the real upstream services"""
+    replaying = False
+
+    def get(self, url, **kwargs):
+        return requests.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return requests.post(url, **kwargs)
+
+
+class RecordingSession(LiveSession):
+    """Calls the real upstream and appends every request/response pair to a cassette file"""
+
+    def __init__(self, cassette_path=DEFAULT_CASSETTE_PATH):
+        self.cassette_path = cassette_path
+        self._lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        return self._record('GET', url, requests.get, kwargs)
+
+    def post(self, url, **kwargs):
+        return self._record('POST', url, requests.post, kwargs)
+
+    def _record(self, method, url, send, kwargs):
+        started = time.perf_counter()
+        response = send(url, **kwargs)
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+
+        # Headers are left out on purpose so API keys never end up on disk
+        interaction = {
+            'key': request_key(method, url, kwargs.get('params'), kwargs.get('json')),
+            'method': method,
+            'url': url,
+            'params': kwargs.get('params'),
+            'json': kwargs.get('json'),
+            'status_code': response.status_code,
+            'content_type': response.headers.get('Content-Type', ''),
+            'text': response.text,
+            'elapsed_ms': elapsed_ms,
+            'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+        with self._lock:
+            with open(self.cassette_path, 'a') as f:
+                f.write(json.dumps(interaction) + '\n')
+
+        return response
+
+
+class ReplaySession:
+    """
+    Serves recorded upstream interactions from a cassette file
+
+    Requests are matched on method, URL, query parameters and JSON body. When
+    there is no exact match (e.g. chatbot prompts that embed the current date)
+    the recordings for the same endpoint are served round-robin, so the real
+    parsing and caching code paths still run.
+
+    Parameters:
+    - cassette_path: JSON lines file written by RecordingSession
+    - latency_ms: Fixed latency added to every call
+    - jitter_ms: Additional uniform random latency
+    - error_rate: Fraction of calls that fail (0.0 - 1.0)
+    - error_status: HTTP status returned for injected errors, or None to raise a connection error
+    - seed: Seed for the latency/error random generator
+    """
+    replaying = True
+
+    def __init__(self, cassette_path=DEFAULT_CASSETTE_PATH, latency_ms=0, jitter_ms=0,
+                 error_rate=0.0, error_status=None, seed=None):
+        self.cassette_path = cassette_path
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = defaultdict(int)
+
+        self.exact = {}
+        self.by_endpoint = defaultdict(list)
+        self._cursor = defaultdict(int)
+        self.load(cassette_path)
+
+    def load(self, cassette_path):
+        """Load interactions from a cassette file"""
+        if not os.path.exists(cassette_path):
+            return
+
+        with open(cassette_path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                interaction = json.loads(line)
+                # Later recordings of the same request win
+                self.exact[interaction['key']] = interaction
+                self.by_endpoint[_endpoint_key(interaction['method'], interaction['url'])].append(interaction)
+
+    def get(self, url, **kwargs):
+        return self._replay('GET', url, kwargs)
+
+    def post(self, url, **kwargs):
+        return self._replay('POST', url, kwargs)
+
+    def _replay(self, method, url, kwargs):
+        timeout = kwargs.get('timeout')
+
+        with self._lock:
+            delay_ms = self.latency_ms + (self.random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+            inject_error = self.error_rate > 0 and self.random.random() < self.error_rate
+            interaction = self._lookup(method, url, kwargs)
+
+            # Honour the caller's timeout the same way the real upstream would
+            timed_out = timeout is not None and delay_ms / 1000 > timeout
+            if timed_out:
+                self.stats['timeouts'] += 1
+            elif inject_error:
+                self.stats['injected_errors'] += 1
+            elif interaction is None:
+                self.stats['misses'] += 1
+
+        if timed_out:
+            time.sleep(timeout)
+            raise requests.exceptions.Timeout(f"Replayed upstream exceeded {timeout}s timeout")
+
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+
+        if inject_error:
+            if self.error_status is None:
+                raise requests.exceptions.ConnectionError("Injected upstream error")
+            return ReplayResponse(self.error_status, json.dumps({'error': 'Injected upstream error'}), url=url)
+
+        if interaction is None:
+            return ReplayResponse(404, json.dumps({'error': 'No recorded interaction'}), url=url)
+
+        return ReplayResponse(
+            interaction['status_code'],
+            interaction['text'],
+            headers={'Content-Type': interaction.get('content_type', '')},
+            url=url
+        )
+
+    def _lookup(self, method, url, kwargs):
+        """Find the recorded interaction for a request (caller holds the lock)"""
+        key = request_key(method, url, kwargs.get('params'), kwargs.get('json'))
+        if key in self.exact:
+            self.stats['exact_hits'] += 1
+            return self.exact[key]
+
+        endpoint = _endpoint_key(method, url)
+        candidates = self.by_endpoint.get(endpoint)
+        if not candidates:
+            return None
+
+        self.stats['fallback_hits'] += 1
+        index = self._cursor[endpoint] % len(candidates)
+        self._cursor[endpoint] += 1
+        return candidates[index]
+
+
+def create_upstream_session(mode=None, cassette_path=None):
+    """Create the HTTP session used for upstream calls based on UPSTREAM_* environment variables"""
+    mode = (mode or os.environ.get('UPSTREAM_MODE', 'live')).lower()
+    cassette_path = cassette_path or os.environ.get('UPSTREAM_CASSETTE', DEFAULT_CASSETTE_PATH)
+
+    if mode == 'record':
+        return RecordingSession(cassette_path)
+
+    if mode == 'replay':
+        error_status = os.environ.get('UPSTREAM_REPLAY_ERROR_STATUS')
+        seed = os.environ.get('UPSTREAM_REPLAY_SEED')
+        return ReplaySession(
+            cassette_path,
+            latency_ms=float(os.environ.get('UPSTREAM_REPLAY_LATENCY_MS', 0)),
+            jitter_ms=float(os.environ.get('UPSTREAM_REPLAY_JITTER_MS', 0)),
+            error_rate=float(os.environ.get('UPSTREAM_REPLAY_ERROR_RATE', 0)),
+            error_status=int(error_status) if error_status else None,
+            seed=int(seed) if seed else None
+        )
+
+    return LiveSession()